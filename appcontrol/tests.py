@@ -0,0 +1,119 @@
+import datetime
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import jobs
+from core.models import BackgroundJob, Payment, PlayerRegistration
+from core.tests import RegistrationTestCase
+
+from . import views
+
+
+class RegistrationListingTests(RegistrationTestCase):
+    """The mail listings page through the season and show each registration's latest payment."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.registrations = []
+        for n in range(3):
+            email = f"listed{n}@example.com"
+            user = User.objects.create_user(email, email, "player")
+            registration = cls.register(user=user, email=email, adhar_card=f"7890123456{n:02d}")
+            PlayerRegistration.objects.filter(pk=registration.pk).update(created=timezone.now() + datetime.timedelta(minutes=n))
+            cls.registrations.append(registration)
+        first = cls.registrations[0]
+        # Only the latest payment counts; the third registration has none
+        for amount, receipt in ((299, "rcpt_old"), (499, "rcpt_new")):
+            Payment.objects.create(user=first.user, registration=first, amount=amount, status="PENDING", recpt_id=receipt)
+        second = cls.registrations[1]
+        Payment.objects.create(user=second.user, registration=second, amount=399, status="PENDING", recpt_id="rcpt_second")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse("con_send_remaining_payment_mail")
+        patch = mock.patch.object(views, "LISTING_PAGE_SIZE", 2)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def listing(self, page):
+        return self.client.get(self.url, {"season_id": self.season.id, "page": page})
+
+    def test_pages_and_payment_amounts(self):
+        # Newest registration first
+        newest_first = self.registrations[::-1]
+        first, second = self.listing(1), self.listing(2)
+
+        self.assertEqual(
+            [(r.id, r.payment_amount) for r in first.context["registrations"]],
+            [(newest_first[0].id, None), (newest_first[1].id, 399)],
+        )
+        self.assertEqual([(r.id, r.payment_amount) for r in second.context["registrations"]], [(newest_first[2].id, 499)])
+        self.assertContains(first, "Page 1 of 2 (3 players)")
+        for registration in newest_first[:2]:
+            self.assertContains(first, f'name="selected_ids" value="{registration.id}"')
+        self.assertNotContains(first, f'name="selected_ids" value="{newest_first[2].id}"')
+
+    def test_superuser_only(self):
+        self.client.force_login(self.player)
+        self.assertEqual(self.listing(1).status_code, 403)
+
+
+IMPORT_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(IMPORT_ROOT=IMPORT_ROOT)
+class PointsUpdateTests(RegistrationTestCase):
+    """Points sheets are applied by a job; the report page streams the rows that were not applied."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.registration = cls.register(reg_id="TSPL01250001")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(IMPORT_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def upload(self, content):
+        return self.client.post(reverse("con_updatePoints"), {
+            "season_id": self.season.id,
+            "points_file": SimpleUploadedFile("points.csv", content.encode(), content_type="text/csv"),
+        })
+
+    def test_report_lists_rows_that_were_not_applied(self):
+        response = self.upload("reg_id,points\nTSPL01250001,42\nTSPL01259999,7\nTSPL01250001,oops\n")
+        background_job = BackgroundJob.objects.get(name="core.task.points_update_job")
+        self.assertRedirects(response, reverse("con_points_report", args=[background_job.id]))
+
+        waiting = self.client.get(reverse("con_points_report", args=[background_job.id]))
+        self.assertTrue(waiting.context["refresh"])
+
+        self.assertTrue(jobs.run_job(background_job))
+        report = self.client.get(reverse("con_points_report", args=[background_job.id]))
+        html = b"".join(report.streaming_content).decode()
+
+        self.assertEqual(PlayerRegistration.objects.get().points, 42)
+        self.assertIn("<td>TSPL01259999</td><td>7</td><td class=\"error\">NOT FOUND</td>", html)
+        self.assertIn("<td>TSPL01250001</td><td>oops</td><td class=\"error\">INVALID</td>", html)
+        self.assertNotIn("UPDATED</td>", html)
+
+        download = self.client.get(reverse("con_job_report", args=[background_job.id]))
+        self.assertEqual(b"".join(download.streaming_content).decode().count("\n"), 4)
+
+    def test_sheet_without_the_columns_is_refused(self):
+        response = self.upload("id,score\nTSPL01250001,42\n")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(BackgroundJob.objects.exists())
@@ -11,7 +11,15 @@ urlpatterns = [
     path("send-remaining-payment-mail/", views.send_remaining_payment_mail, name="con_send_remaining_payment_mail"),
     path("send-selection-payment-mail/", views.send_selection_status_mail, name="con_send_selection_status_mail"),
     path("send-mail",views.send_bulk_mail, name="con_send_bulk_mail"),
-    path("migrate-reg-ids/", views.migrate_reg_ids, name="con_migrate_reg_ids")
+    path("migrate-reg-ids/", views.migrate_reg_ids, name="con_migrate_reg_ids"),
+    path("jobs/", views.job_list, name="con_jobs"),
+    path("jobs/<int:job_id>", views.job_status, name="con_job_status"),
+    path("jobs/<int:job_id>/report", views.job_report, name="con_job_report"),
+    path("update-points/<int:job_id>", views.points_report, name="con_points_report"),
+    path("campaigns/", views.campaign_list, name="con_campaigns"),
+    path("campaigns/<int:campaign_id>", views.campaign_detail, name="con_campaign_detail"),
+    path("metrics", views.request_metrics, name="con_metrics"),
+    path("metrics/scrape", views.request_metrics_scrape, name="con_metrics_scrape"),
 ]
 
 
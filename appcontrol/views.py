@@ -1,17 +1,52 @@
+import hmac
 import logging
 from datetime import datetime
-from django.http import HttpResponseForbidden
+from django.conf import settings as django_settings
+from django.http import FileResponse, Http404, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, HttpResponse 
+from django.template.loader import render_to_string
+from django.utils.html import format_html
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from core.models import PlayerRegistration, Season, Payment, User
+from core.models import PlayerRegistration, Season, Payment, BackgroundJob, EmailCampaign
 from core.utils import get_general_settings
-from core.task import send_success_email, send_batch_payment_reminder_emails, send_batch_selection_status_emails,reg_id_migration_task, submit_csv_task, send_batch_custom_emails
-from django.db.models import Q
-import pandas as pd
+from core.task import send_batch_success_emails, send_batch_payment_reminder_emails, send_batch_selection_status_emails,reg_id_migration_task, submit_csv_task, send_custom_email_to_all_users, send_campaign_job, submit_points_update
+from core import metrics, outbox
+from core.csv_import import get_import_storage, read_rows
+from django.core.paginator import Paginator
+from django.db.models import OuterRef, Q, Subquery
 
 logger = logging.getLogger("appcontrol")
 
+LISTING_PAGE_SIZE = 100
+
+
+def _with_latest_payment(registrations):
+    """Annotate registrations with `payment_amount` from their latest payment (None without one)."""
+    latest_payment = Payment.objects.filter(
+        registration=OuterRef("pk"), user=OuterRef("user")
+    ).order_by("-created_at", "-id")
+    return registrations.select_related("user").annotate(
+        payment_amount=Subquery(latest_payment.values("amount")[:1])
+    )
+
+
+def _registration_listing(season_id, query=""):
+    """The season's registrations as shown by the mail listings, in one query."""
+    registrations = _with_latest_payment(PlayerRegistration.objects.filter(season=season_id))
+    if query:
+        registrations = registrations.filter(
+            Q(reg_id__icontains=query) |
+            Q(user__username__icontains=query) |
+            Q(player_name__icontains=query)
+        )
+    return registrations
+
+
+def _paginate(request, queryset, ordering=("-created", "id")):
+    """The LISTING_PAGE_SIZE page of `queryset` picked by ?page= (out-of-range pages give the last one)."""
+    return Paginator(queryset.order_by(*ordering), LISTING_PAGE_SIZE).get_page(request.GET.get("page"))
+
 
 
 # ---------- INDEX ----------
@@ -43,13 +78,10 @@ def data_upload(request):
             messages.error(request, "Season is required.")
             return render(request, "appcontrol/dataupload.html", {"seasons": Season.objects.all()})
 
-        # Read files as bytes to pass to Celery
-        data_bytes = data_file.read()
-        points_bytes = points_file.read() if points_file else None
-
-        submit_csv_task(data_bytes,points_bytes, season_id)
+        # The files are spooled to disk and the job only gets their names
+        background_job = submit_csv_task(data_file, points_file, season_id)
 
-        messages.success(request, f"Processing...")
+        messages.success(request, f"Processing... (job #{background_job.id})")
 
         return redirect("con_upload")
 
@@ -72,10 +104,7 @@ def trigger_mail(request):
 
     if season_id:
         # Only completed players visible
-        registrations = PlayerRegistration.objects.filter(
-            season=season_id,
-            is_compleated=True
-        )
+        registrations = _registration_listing(season_id, query).filter(is_compleated=True)
 
         # Mail Sent Filter
         if mail_filter == "sent":
@@ -83,13 +112,7 @@ def trigger_mail(request):
         elif mail_filter == "unsent":
             registrations = registrations.filter(is_mail_sent=False)
 
-        # Search Filter
-        if query:
-            registrations = registrations.filter(
-                Q(reg_id__icontains=query) |
-                Q(user__username__icontains=query) |
-                Q(player_name__icontains=query)
-            )
+        registrations = _paginate(request, registrations)
 
     # POST → SEND EMAILS
     if request.method == "POST":
@@ -99,41 +122,18 @@ def trigger_mail(request):
             messages.error(request, "No players selected.")
             return redirect(f"{request.path}?season_id={season_id}&q={query}&mail_filter={mail_filter}")
 
-        for reg in PlayerRegistration.objects.filter(id__in=selected_ids, is_compleated=True):
-
-            payment = Payment.objects.filter(
-                registration=reg.id,
-                user=reg.user
-            ).order_by("-created_at").first()
-
-            if not payment:
+        selected = []
+        for reg in _with_latest_payment(PlayerRegistration.objects.filter(id__in=selected_ids, is_compleated=True)):
+            if reg.payment_amount is None:
                 logger.warning(f"No payment found for reg_id={reg.reg_id}")
                 continue
+            selected.append(reg)
 
-            context = {
-                "id": reg.tx_id,
-                "reg_id": reg.reg_id,
-                "amount": payment.amount,
-                "zone": reg.zone,
-                "settings": get_general_settings()
-            }
-
-            try:
-                send_success_email(
-                    subject="Registration Completed",
-                    to=reg.user.email,
-                    context=context
-                )
-
-                reg.is_mail_sent = True
-                reg.save()
-
-                logger.info(f"[MAIL SENT] reg_id={reg.reg_id}")
-
-            except Exception as e:
-                logger.error(f"[MAIL ERROR] reg_id={reg.reg_id} error={str(e)}")
-
-        messages.success(request, "Emails sent successfully!")
+        if selected:
+            campaign = send_batch_success_emails(selected)
+            messages.success(request, f"Queued {len(selected)} emails (campaign #{campaign.id}); Mail Sent is updated as they are delivered.")
+        else:
+            messages.warning(request, "No payment records found for selected players.")
         return redirect(f"{request.path}?season_id={season_id}&q={query}&mail_filter={mail_filter}")
 
     return render(request, "appcontrol/trigger_mail.html", {
@@ -170,85 +170,15 @@ def updatePoints(request):
             if not csv_file:
                 return HttpResponse("Points CSV file is required.", status=400)
 
-            # Read CSV (with header: reg_id,points)
-            df = pd.read_csv(csv_file)
-
-            # Required columns check
-            if not {"reg_id", "points"}.issubset(df.columns):
+            # Required columns check (header: reg_id,points)
+            header = csv_file.readline().decode("utf-8-sig").strip().split(",")
+            csv_file.seek(0)
+            if not {"reg_id", "points"}.issubset(column.strip() for column in header):
                 return HttpResponse("CSV must contain 'reg_id' and 'points' columns.", status=400)
 
-            # Add status field
-            df["status"] = False
-
-            # Convert to list-of-lists for easy writing
-            data_rows = df.values.tolist()
-
-            def updateInDb(row):
-                reg_id = str(row[0]).strip()
-                points = row[1]
-
-                # Validate points
-                try:
-                    points = float(points)
-                except:
-                    row[2] = False
-                    return
-
-                # Update DB
-                try:
-                    obj = PlayerRegistration.objects.get(reg_id=reg_id, season=season)
-                    obj.points = points
-                    obj.save()
-                    row[2] = True
-                except Exception as e:
-                    logger.error(f"{reg_id} {e} ")
-                    row[2] = False
-
-            # Update each row
-            for row in data_rows:
-                updateInDb(row)
-
-            # Apply the updated status back to dataframe
-            df["status"] = [row[2] for row in data_rows]
-
-            # color code
-            def color_status(val):
-                return (
-                    'background-color: green; color: white;'
-                    if val else
-                    'background-color: red; color: white;'
-                )
-
-            # This is your ORIGINAL coloured table
-            table_html = (
-                df.style.map(color_status, subset=["status"])
-                .set_table_attributes('class="table table-bordered"')
-                .to_html()
-            )
-
-            # Build HTML: EXACT SAME STRUCTURE AS BEFORE + GO BACK
-            html_response = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Player Points Update</title>
-                <link rel="stylesheet"
-                    href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css">
-                <style> td, th {{ text-align: center; }} </style>
-            </head>
-
-            <body class="container mt-4">
-                <h2 class="mb-3">{season.title} {season.year}</h2>
-                <hr/>
-                <p class="mb-3">Player Points updated</p>
-
-                <a href="/master">Go Back</a>
-                {table_html}
-            </body>
-            </html>
-            """
-
-            return HttpResponse(html_response)
+            background_job = submit_points_update(csv_file, season.id)
+            messages.success(request, f"Updating points... (job #{background_job.id})")
+            return redirect("con_points_report", job_id=background_job.id)
 
         except Exception as e:
             logger.error(e)
@@ -270,29 +200,13 @@ def send_remaining_payment_mail(request):
     query = request.GET.get("q", "")
     is_compleated = request.GET.get("is_compleated", "")
     if season_id:
-        regs = PlayerRegistration.objects.filter(
-            season=season_id
-        )
-
-        if query:
-            regs = regs.filter(
-                Q(reg_id__icontains=query) |
-                Q(user__username__icontains=query) |
-                Q(player_name__icontains=query)
-            )
+        regs = _registration_listing(season_id, query)
         if is_compleated == "yes":
             regs = regs.filter(is_compleated=True)
         elif is_compleated == "no":
             regs = regs.filter(is_compleated=False)
-            
-        # Attach payment info to each registration
-        registrations = []
-        for r in regs:
-            payment = Payment.objects.filter(registration=r.id, user=r.user.id).first()
-            registrations.append({
-                "reg": r,
-                "payment_amount": payment.amount if payment else "N/A"
-            })
+
+        registrations = _paginate(request, regs)
 
     # POST → Send emails
     if request.method == "POST":
@@ -303,16 +217,15 @@ def send_remaining_payment_mail(request):
 
         # Collect all player data first
         email_data_list = []
-        for r in PlayerRegistration.objects.filter(id__in=selected_ids):
-            payment = Payment.objects.filter(registration=r.id, user=r.user.id).order_by('-created_at').first()
-            if not payment:
+        for r in _with_latest_payment(PlayerRegistration.objects.filter(id__in=selected_ids)):
+            if r.payment_amount is None:
                 continue
             
             email_data_list.append({
                 "to_email": r.user.email,
                 "reg_id": r.reg_id,
                 "tx_id": r.tx_id,
-                "amount": payment.amount,
+                "amount": r.payment_amount,
                 "zone": r.zone,
                 "player_name": r.player_name,
                 "season_id": settings.current_season.id,
@@ -320,7 +233,7 @@ def send_remaining_payment_mail(request):
 
         # Submit batch email task to background
         if email_data_list:
-            send_batch_payment_reminder_emails(
+            campaign = send_batch_payment_reminder_emails(
                 email_data_list=email_data_list,
                 subject=f"Remaining Payment Due for {settings.current_season.title}",
                 settings_data={
@@ -328,7 +241,7 @@ def send_remaining_payment_mail(request):
                     "current_season_year": settings.current_season.year,
                 }
             )
-            messages.success(request, f"Queued {len(email_data_list)} payment reminder emails for background delivery!")
+            messages.success(request, f"Queued {len(email_data_list)} payment reminder emails for background delivery! (campaign #{campaign.id})")
         else:
             messages.warning(request, "No valid payment records found for selected players.")
         
@@ -354,23 +267,7 @@ def send_selection_status_mail(request):
     query = request.GET.get("q", "")
 
     if season_id:
-        regs = PlayerRegistration.objects.filter(season=season_id)
-
-        if query:
-            regs = regs.filter(
-                Q(reg_id__icontains=query) |
-                Q(user__username__icontains=query) |
-                Q(player_name__icontains=query)
-            )
-
-        # Attach payment info for display
-        registrations = []
-        for r in regs:
-            payment = Payment.objects.filter(registration=r.id, user=r.user.id).first()
-            registrations.append({
-                "reg": r,
-                "payment_amount": payment.amount if payment else "N/A"
-            })
+        registrations = _paginate(request, _registration_listing(season_id, query))
 
     # POST → Send emails
     if request.method == "POST":
@@ -381,7 +278,7 @@ def send_selection_status_mail(request):
 
         # Collect all player data first
         email_data_list = []
-        for r in PlayerRegistration.objects.filter(id__in=selected_ids, is_compleated=True):
+        for r in PlayerRegistration.objects.filter(id__in=selected_ids, is_compleated=True).select_related("user"):
             email_data_list.append({
                 "to_email": r.user.email,
                 "reg_id": r.reg_id,
@@ -394,7 +291,7 @@ def send_selection_status_mail(request):
 
         # Submit batch email task to background
         if email_data_list:
-            send_batch_selection_status_emails(
+            campaign = send_batch_selection_status_emails(
                 email_data_list=email_data_list,
                 subject=f"Your Selection Status Update for {settings.current_season.title}",
                 settings_data={
@@ -405,7 +302,7 @@ def send_selection_status_mail(request):
                     }
                 }
             )
-            messages.success(request, f"Queued {len(email_data_list)} selection status emails for background delivery!")
+            messages.success(request, f"Queued {len(email_data_list)} selection status emails for background delivery! (campaign #{campaign.id})")
         else:
             messages.warning(request, "No valid completed registrations found for selected players.")
         
@@ -430,44 +327,21 @@ def send_bulk_mail(request):
             messages.error(request, "Subject and HTML content are required.")
             return redirect(request.path)
 
-        users = User.objects.filter(email__isnull=False).exclude(email="")
-
-        # Collect all user data first
-        email_data_list = []
-        for user in users:
-            # Pass actual user info as context
-            context = {
-                "username": user.username,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "email": user.email,
-                "season_title": settings.current_season.title,
-                "start_date": settings.current_season.start_date,
-                "end_date": settings.current_season.end_date,
-                "amount": settings.current_season.amount,
-                "year": settings.current_season.year
-            }
-            
-            email_data_list.append({
-                "to_email": user.email,
-                "context": context
-            })
-
-        # Submit batch email task to background with rate limiting
-        if email_data_list:
-            send_batch_custom_emails(
-                email_data_list=email_data_list,
-                subject=subject,
-                html_template=html_content
-            )
-            messages.success(
-                request,
-                f"Queued {len(email_data_list)} bulk emails for background delivery with rate limiting!"
-            )
-        else:
-            messages.warning(request, "No valid users found with email addresses.")
-        
-        return redirect(request.path)
+        # Season details are the same for everyone; per-user variables are added by the send job
+        season = settings.current_season
+        campaign = send_custom_email_to_all_users(
+            subject=subject,
+            html_template=html_content,
+            context={
+                "season_title": season.title,
+                "start_date": season.start_date,
+                "end_date": season.end_date,
+                "amount": season.amount,
+                "year": season.year,
+            },
+        )
+        messages.success(request, f"Bulk email queued for all users with an email address (campaign #{campaign.id}).")
+        return redirect("con_campaign_detail", campaign_id=campaign.id)
 
     return render(request, "appcontrol/send_mail.html")
 
@@ -494,13 +368,175 @@ def migrate_reg_ids(request):
             messages.error(request, "Invalid Season B.")
             return redirect("con_migrate_reg_ids")
         
-        reg_id_migration_task(season_a, season_b)
-        logger.info(f"Reg ID migration task submitted for seasons {season_a} and {season_b}")
-        messages.success(request, "Registration ID migration task submitted for background processing.")
+        dry_run = bool(request.POST.get("dry_run"))
+        background_job = reg_id_migration_task(season_a.id, season_b.id, dry_run=dry_run)
+        logger.info(f"Reg ID migration task submitted for seasons {season_a} and {season_b} (dry run: {dry_run})")
+        messages.success(request, f"Registration ID migration {'dry run ' if dry_run else ''}task submitted for background processing. (job #{background_job.id})")
     
     return render(request, "appcontrol/migrate_reg_id.html", {
         "seasons": Season.objects.all()
     })
-    
 
 
+@login_required
+def job_list(request):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    jobs = BackgroundJob.objects.all()
+    status = request.GET.get("status", "").strip()
+    if status:
+        jobs = jobs.filter(status=status)
+
+    return render(request, "appcontrol/jobs.html", {
+        "jobs": jobs[:100],
+        "status": status,
+        "statuses": BackgroundJob.STATUS_CHOICES,
+    })
+
+
+@login_required
+def job_status(request, job_id):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    background_job = BackgroundJob.objects.filter(id=job_id).first()
+    if background_job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+
+    return JsonResponse({
+        "id": background_job.id,
+        "name": background_job.get_short_name(),
+        "queue": background_job.queue,
+        "status": background_job.status,
+        "attempts": background_job.attempts,
+        "progress": background_job.progress,
+        "total": background_job.total,
+        "percent": background_job.get_percent(),
+        "result": background_job.result,
+        "error": background_job.error,
+        "created_at": background_job.created_at,
+        "started_at": background_job.started_at,
+        "finished_at": background_job.finished_at,
+    })
+
+
+@login_required
+def campaign_list(request):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    campaigns = list(EmailCampaign.objects.select_related("job")[:100])
+    return render(request, "appcontrol/campaigns.html", {
+        "campaigns": campaigns,
+        "refresh": any(campaign.status in ("QUEUED", "SENDING") for campaign in campaigns),
+    })
+
+
+@login_required
+def campaign_detail(request, campaign_id):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    campaign = EmailCampaign.objects.select_related("job").filter(id=campaign_id).first()
+    if campaign is None:
+        messages.error(request, "Campaign not found.")
+        return redirect("con_campaigns")
+
+    if request.method == "POST":
+        action = request.POST.get("action")
+        if action == "retry_failed":
+            count = outbox.retry_failed(campaign.id)
+            messages.success(request, f"{count} failed emails queued again.")
+        job_running = campaign.job is not None and campaign.job.status in ("QUEUED", "RUNNING")
+        if action in ("resume", "retry_failed") and not job_running:
+            campaign.job = send_campaign_job.enqueue(campaign.id)
+            campaign.save(update_fields=["job"])
+            messages.success(request, f"Campaign resumed (job #{campaign.job.id}).")
+        elif action == "resume":
+            messages.warning(request, "Campaign is already being sent.")
+        return redirect("con_campaign_detail", campaign_id=campaign.id)
+
+    return render(request, "appcontrol/campaign_detail.html", {
+        "campaign": campaign,
+        "failed_emails": campaign.emails.filter(status="FAILED")[:200],
+        "refresh": campaign.status == "SENDING" or (campaign.job is not None and campaign.job.status in ("QUEUED", "RUNNING")),
+    })
+
+
+@login_required
+def points_report(request, job_id):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    background_job = BackgroundJob.objects.filter(id=job_id, name__endswith=".points_update_job").first()
+    if background_job is None:
+        raise Http404("Job not found")
+
+    context = {
+        "job": background_job,
+        "season": Season.objects.filter(id=background_job.args[1]).first(),
+        "summary": background_job.result if background_job.status == "DONE" else None,
+        "refresh": background_job.status in ("QUEUED", "RUNNING"),
+    }
+    if context["summary"] is None:
+        return render(request, "appcontrol/points_report.html", context)
+
+    # Only the rows that were not applied are shown; they are streamed from the stored report
+    def failed_rows():
+        yield render_to_string("appcontrol/points_report.html", context, request=request)
+        for row in read_rows(context["summary"]["report"]):
+            if row["status"] != "UPDATED":
+                yield format_html(
+                    "<tr><td>{}</td><td>{}</td><td class=\"error\">{}</td></tr>\n",
+                    row["reg_id"], row["points"], row["status"],
+                )
+        yield "</tbody></table></div></body></html>"
+
+    return StreamingHttpResponse(failed_rows())
+
+
+@login_required
+def job_report(request, job_id):
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    background_job = BackgroundJob.objects.filter(id=job_id).first()
+    report = background_job.result.get("report") if background_job and isinstance(background_job.result, dict) else None
+    if not report:
+        raise Http404("No report for this job")
+    try:
+        handle = get_import_storage().open(report, "rb")
+    except FileNotFoundError:
+        raise Http404("Report file is gone")
+    return FileResponse(handle, as_attachment=True, filename=report.rsplit("/", 1)[-1])
+
+
+def _metrics_response():
+    return HttpResponse(
+        metrics.render_prometheus(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@login_required
+def request_metrics(request):
+    """Per-view request and per-job metrics in the Prometheus text format."""
+    if not request.user.is_superuser:
+        return HttpResponseForbidden("Invalid Access")
+
+    return _metrics_response()
+
+
+def request_metrics_scrape(request):
+    """request_metrics for Prometheus, which has no session.
+
+    Authenticates with an "Authorization: Bearer <METRICS_TOKEN>" header
+    instead of a login; disabled while METRICS_TOKEN is unset.
+    """
+    token = django_settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(authorization, f"Bearer {token}"):
+        return HttpResponseForbidden("Invalid Access")
+
+    return _metrics_response()
@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 
@@ -12,8 +13,11 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 
-# DEBUG = os.getenv("SECRET_KEY")== "0"
-DEBUG = True
+DEBUG = os.getenv("DEBUG", "1") == "1"
+
+# "sqlite" (default, db.sqlite3 next to manage.py) or "postgresql" (POSTGRES_* variables).
+# docker-compose uses postgresql so web and worker share one database; see README.md before switching.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
 
 ALLOWED_HOSTS = ['*']
 
@@ -41,14 +45,15 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    
+    'core.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Times template rendering for core.metrics
+        'BACKEND': 'core.metrics.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,14 +73,19 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-if DEBUG:
+if DB_ENGINE == "sqlite":
     DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Background workers write concurrently; take the write lock up front
+        # instead of failing with "database is locked" on upgrade
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
         }
     }
-else:
+elif DB_ENGINE == "postgresql":
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql',
@@ -86,9 +96,36 @@ else:
             'PORT': os.getenv('POSTGRES_PORT', '5432'),
         }
     }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {DB_ENGINE!r}; use 'sqlite' or 'postgresql'")
 
 
 
+# Cache
+# GeneralSettings is cached per process for GENERAL_SETTINGS_CACHE_TTL seconds.
+# With REDIS_URL (set by docker-compose) it is shared through redis, so invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tspl-default',
+    }
+}
+
+if os.getenv("REDIS_URL"):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv("REDIS_URL"),
+    }
+
+GENERAL_SETTINGS_CACHE_TTL = int(os.getenv("GENERAL_SETTINGS_CACHE_TTL", 60))
+GENERAL_SETTINGS_CACHE_ALIAS = 'shared' if 'shared' in CACHES else None
+
+# In-memory page cache for the staticpages views (anonymous visitors only)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 300))
+PAGE_CACHE_MAX_ENTRIES = 256
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -125,6 +162,8 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Spooled CSV uploads and import reports; private, unlike MEDIA_ROOT which nginx serves
+IMPORT_ROOT = os.path.join(BASE_DIR, 'imports')
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 LOGIN_URL = 'login'
@@ -143,6 +182,26 @@ CSRF_TRUSTED_ORIGINS = ['http://0.0.0.0:8000', 'http://127.0.0.1:8000','http://t
 # RazorPay
 RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET")
+RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET")
+# Point at stress/fake_razorpay.py for local tests and benchmarks
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL")
+RAZORPAY_CONNECT_TIMEOUT = 3.05
+RAZORPAY_READ_TIMEOUT = 10
+RAZORPAY_POOL_SIZE = 10
+RAZORPAY_MAX_RETRIES = 3
+# Create orders in the background and let the payment page poll for them
+RAZORPAY_ASYNC_ORDERS = os.getenv("RAZORPAY_ASYNC_ORDERS", "0") == "1"
+# Unpaid orders younger than this are reused on resubmission instead of creating new ones
+PAYMENT_REUSE_WINDOW = 6 * 60 * 60
+
+
+# Background jobs: concurrency per queue across all `manage.py run_jobs` workers
+JOB_QUEUES = {
+    "email": 10,
+    "bulk_email": 3,
+    "csv": 1,
+    "common": 5,
+}
 
 
 # Email Configuration
@@ -151,14 +210,59 @@ if DEBUG:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 else:
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Override to point at stress/fake_smtp.py for local tests and benchmarks
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", EMAIL_BACKEND)
 
 EMAIL_FILE_PATH = BASE_DIR / "sent_emails"
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587  
-EMAIL_USE_TLS = True
+EMAIL_HOST = os.getenv("EMAIL_HOST", 'smtp.gmail.com')
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "1") == "1"
 EMAIL_HOST_USER = os.getenv("EMAIL")
 EMAIL_HOST_PASSWORD = os.getenv("PASSWORD") 
 
+# Batch delivery (core.mailer): pooled SMTP connections and a shared token bucket
+EMAIL_RATE_PER_MINUTE = int(os.getenv("EMAIL_RATE_PER_MINUTE", "60"))
+EMAIL_BURST = 10
+EMAIL_POOL_SIZE = 2
+EMAIL_CHUNK_SIZE = 20
+EMAIL_MAX_MESSAGES_PER_CONNECTION = 100
+EMAIL_CONNECTION_IDLE_TIMEOUT = 60
+EMAIL_MAX_ATTEMPTS = 5
+# Provider throttling (421) pauses all senders for EMAIL_CIRCUIT_BASE_PAUSE seconds, doubling per
+# consecutive trip up to EMAIL_MAX_BACKOFF; use the shared cache so every worker sees the pause
+EMAIL_CIRCUIT_BASE_PAUSE = 15
+EMAIL_MAX_BACKOFF = 120
+EMAIL_CIRCUIT_CACHE_ALIAS = 'shared' if 'shared' in CACHES else 'default'
+# Outbox (core.outbox): rows inserted per query, rows claimed per chunk, seconds before a claim is considered abandoned
+EMAIL_OUTBOX_INSERT_BATCH = 1000
+EMAIL_OUTBOX_CLAIM_SIZE = 100
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600
+
+# Season CSV import (core.csv_import): rows written per transaction
+CSV_IMPORT_CHUNK_SIZE = 500
+# Imported accounts: the initial password is derived from the date of birth and mobile number stored
+# on the registration, so a full-strength hash protects nothing extra; it is upgraded at first login
+CSV_IMPORT_PASSWORD_ITERATIONS = 10000
+CSV_IMPORT_HASH_PROCESSES = int(os.getenv("CSV_IMPORT_HASH_PROCESSES", "2"))
+
+# Request and job instrumentation (core.metrics); superusers open /master/metrics
+REQUEST_METRICS_ENABLED = os.getenv("REQUEST_METRICS_ENABLED", "1") == "1"
+REQUEST_METRICS_CACHE_ALIAS = 'shared' if 'shared' in CACHES else None
+REQUEST_METRICS_FLUSH_INTERVAL = 15
+# Prometheus scrapes /master/metrics/scrape with "Authorization: Bearer <METRICS_TOKEN>"; unset disables it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Per-view limits on queries, db_ms, template_ms, external_ms and duration_ms; "default" applies to every view
+REQUEST_BUDGETS = {
+    "default": {"queries": 30, "db_ms": 300, "duration_ms": 2000},
+    "index": {"queries": 5},
+    "register_form": {"queries": 15},
+    "payment_handler": {"queries": 20, "external_ms": 3000, "duration_ms": 5000},
+    "allResultsApi": {"queries": 3},
+    "con_trigger_mail": {"queries": 10},
+    "con_send_remaining_payment_mail": {"queries": 10},
+    "con_send_selection_status_mail": {"queries": 10},
+}
+
 
 X_FRAME_OPTIONS = 'ALLOWALL'  # To allow all
 # OR
@@ -212,6 +316,13 @@ LOGGING = {
             'propagate': False,
         },
         # ------------------------------------------------
+
+        # One JSON line per request; set REQUEST_METRICS_LOG_LEVEL=WARNING to keep only budget warnings
+        'core.metrics': {
+            'handlers': ['console', 'rotating_file'],
+            'level': os.getenv("REQUEST_METRICS_LOG_LEVEL", "INFO"),
+            'propagate': False,
+        },
     },
 }
 
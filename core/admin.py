@@ -1,7 +1,7 @@
 from django.contrib import admin
 from import_export import resources
 from import_export.admin import ExportMixin
-from .models import PlayerRegistration, Season, GeneralSettings, Payment
+from .models import PlayerRegistration, Season, GeneralSettings, Payment, RegistrationSequence, WebhookEvent, BackgroundJob, EmailCampaign, OutboxEmail
 
 class PlayerRegistrationResource(resources.ModelResource):
     class Meta:
@@ -62,4 +62,38 @@ class PaymentAdmin(ExportMixin, admin.ModelAdmin):
 admin.site.register(PlayerRegistration, PlayerRegistrationAdmin)
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Season)
-admin.site.register(GeneralSettings)
\ No newline at end of file
+admin.site.register(GeneralSettings)
+admin.site.register(RegistrationSequence)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event', 'status', 'created_at', 'processed_at')
+    list_filter = ('event', 'status')
+    search_fields = ('event_id',)
+    readonly_fields = ('created_at', 'processed_at')
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'queue', 'status', 'attempts', 'progress', 'total', 'created_at', 'finished_at')
+    list_filter = ('queue', 'status')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'heartbeat_at', 'locked_by')
+
+
+@admin.register(EmailCampaign)
+class EmailCampaignAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'subject', 'status', 'total', 'sent', 'failed', 'created_at', 'finished_at')
+    list_filter = ('kind', 'audience', 'status')
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'campaign', 'to_email', 'status', 'attempts', 'sent_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('to_email',)
+    raw_id_fields = ('campaign',)
+    readonly_fields = ('created_at', 'updated_at', 'sent_at', 'claimed_at', 'claimed_by')
@@ -0,0 +1,432 @@
+"""Bulk import of player registrations from the season CSV.
+
+Rows are read in chunks of CSV_IMPORT_CHUNK_SIZE. For every chunk the users
+and registrations it touches are loaded with one query each, then written
+with bulk_create/bulk_update inside a single transaction. When a chunk
+fails (e.g. a duplicate Aadhaar number) it is replayed row by row so only
+the offending rows are rejected, and every rejected row ends up in the
+error report.
+
+Uploads are spooled to IMPORT_ROOT (kept out of the public media tree) and
+read back as a stream, so only one chunk of rows is in memory at a time.
+
+New accounts get a PBKDF2 hash with CSV_IMPORT_PASSWORD_ITERATIONS rounds,
+computed on CSV_IMPORT_HASH_PROCESSES worker processes. Django re-hashes
+it with the full iteration count the first time the player logs in.
+"""
+import csv
+import datetime
+import io
+import itertools
+import logging
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, connection, transaction
+
+from .constants import DISTRICT_ZONE_MAP
+from .models import PlayerRegistration, RegistrationSequence, highest_reg_number
+
+logger = logging.getLogger('core')
+
+REGISTRATION_FIELDS = [
+    "user", "player_name", "father_name", "category", "age", "dob", "gender", "tshirt_size",
+    "occupation", "mobile", "wathsapp_number", "email", "adhar_card", "player_image",
+    "district", "zone", "pin_code", "address", "first_preference", "batting_arm", "role",
+    "is_compleated", "tx_id", "is_selected", "points",
+]
+USER_FIELDS = ["first_name", "last_name", "email"]
+ERROR_REPORT_FIELDS = ["line", "reg_id", "user__username", "error"]
+
+
+def get_import_storage():
+    return FileSystemStorage(location=settings.IMPORT_ROOT)
+
+
+def spool_upload(uploaded_file):
+    """Save an uploaded CSV to import storage and return its name there."""
+    return get_import_storage().save(f"uploads/{uuid.uuid4().hex}.csv", uploaded_file)
+
+
+def read_rows(name):
+    """Yield the rows of a spooled CSV as dicts, reading the file incrementally."""
+    with get_import_storage().open(name, "rb") as handle:
+        # utf-8-sig drops the BOM spreadsheet exports put in front of the header
+        text = io.TextIOWrapper(handle, encoding="utf-8-sig", newline="")
+        yield from csv.DictReader(text)
+
+
+def count_rows(name):
+    with get_import_storage().open(name, "rb") as handle:
+        text = io.TextIOWrapper(handle, encoding="utf-8-sig", newline="")
+        return max(sum(1 for _ in csv.reader(text)) - 1, 0)
+
+
+def read_points(name):
+    """Map reg_id to points from a spooled reg_id,points CSV."""
+    points_map = {}
+    with get_import_storage().open(name, "rb") as handle:
+        reader = csv.reader(io.TextIOWrapper(handle, encoding="utf-8-sig", newline=""))
+        next(reader, None)
+        for pid, pts in reader:
+            points_map[pid.strip()] = int(pts)
+    return points_map
+
+
+def discard_upload(name):
+    try:
+        get_import_storage().delete(name)
+    except OSError as e:
+        logger.warning(f"Could not remove spooled upload {name}: {e}")
+
+
+def calculate_age(dob):
+    today = datetime.date.today()
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def parse_row(row):
+    """Validate one CSV row and return the cleaned values; raises ValueError/KeyError."""
+    username = row["user__username"].strip()
+    if not username:
+        raise ValueError("user__username is empty")
+    player_name = row["player_name"].strip()
+    name_parts = player_name.split(" ")
+    dob = datetime.datetime.strptime(row["dob"].strip(), "%Y-%m-%d").date()
+    mobile = row["mobile"].strip()
+    return {
+        "reg_id": (row.get("reg_id") or "").strip(),
+        "username": username,
+        "first_name": name_parts[0],
+        "last_name": " ".join(name_parts[1:]),
+        "email": row["email"].strip(),
+        "password": dob.strftime("%Y%m%d") + mobile[-4:],
+        "points": int(row.get("points") or 0),
+        "registration": {
+            "player_name": player_name,
+            "father_name": row["father_name"],
+            "category": "21 and Above",
+            "age": calculate_age(dob),
+            "dob": dob,
+            "gender": row["gender"],
+            "tshirt_size": row["tshirt_size"],
+            "occupation": 3,
+            "mobile": row["mobile"],
+            "wathsapp_number": row["wathsapp_number"],
+            "email": row["email"],
+            "adhar_card": row["adhar_card"],
+            "player_image": row["player_image"],
+            "district": row["district"],
+            # bulk writes skip PlayerRegistration.save(), which normally derives the zone
+            "zone": DISTRICT_ZONE_MAP.get(row["district"], "Unknown"),
+            "pin_code": int(row["pin_code"]),
+            "address": row["address"],
+            "first_preference": row["first_preference"],
+            "batting_arm": row["batting_arm"],
+            "role": row["role"],
+            "is_compleated": bool(int(row["is_paid"])),
+            "tx_id": row["tx_id"],
+            "is_selected": bool(int(row["is_selected"])),
+        },
+    }
+
+
+def hash_password(password, iterations):
+    # Same format as the default hasher, so check_password() verifies it and
+    # upgrades it (must_update) at the first successful login
+    hasher = PBKDF2PasswordHasher()
+    return hasher.encode(password, hasher.salt(), iterations)
+
+
+def _hash_passwords(passwords, iterations):
+    return [hash_password(password, iterations) for password in passwords]
+
+
+class RegistrationImporter:
+    """Imports CSV rows into one season; `run` returns a summary dict."""
+
+    def __init__(self, season, points_map=None, chunk_size=None):
+        self.season = season
+        self.points_map = points_map or {}
+        self.chunk_size = chunk_size or settings.CSV_IMPORT_CHUNK_SIZE
+        self.created = 0
+        self.updated = 0
+        self.users_created = 0
+        self.errors = []
+        self.hash_executor = None
+
+    def fail(self, line, row, error):
+        self.errors.append({
+            "line": line,
+            "reg_id": (row.get("reg_id") or "").strip(),
+            "user__username": (row.get("user__username") or "").strip(),
+            "error": str(error),
+        })
+
+    def run(self, rows, total=None, on_progress=None):
+        # Line 1 is the header
+        numbered = enumerate(rows, start=2)
+        processed = 0
+        try:
+            while True:
+                chunk = list(itertools.islice(numbered, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                processed += len(chunk)
+                if on_progress is not None:
+                    on_progress(processed, total)
+        finally:
+            if self.hash_executor is not None:
+                self.hash_executor.shutdown()
+
+        # Explicit reg_ids in the sheet must not be handed out again by the counter
+        RegistrationSequence.reserve_through(self.season, highest_reg_number(self.season))
+
+        summary = {
+            "rows": processed,
+            "created": self.created,
+            "updated": self.updated,
+            "users_created": self.users_created,
+            "failed": len(self.errors),
+            "report": self.save_error_report(),
+        }
+        logger.info(f"CSV import for season {self.season.id} done: {summary}")
+        return summary
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for line, row in chunk:
+            try:
+                values = parse_row(row)
+            except (KeyError, ValueError, TypeError) as e:
+                self.fail(line, row, e if not isinstance(e, KeyError) else f"missing column {e}")
+                continue
+            parsed.append((line, row, values))
+
+        self.assign_reg_ids(parsed)
+        parsed = self.drop_duplicates(parsed)
+        if not parsed:
+            return
+        # Hashing happens before the chunk transaction so it doesn't hold locks
+        self.hash_new_passwords([values for _, _, values in parsed])
+
+        try:
+            with transaction.atomic():
+                counts = self.write([values for _, _, values in parsed])
+        except DatabaseError as e:
+            logger.warning(f"CSV chunk at line {parsed[0][0]} rolled back ({e}), retrying row by row")
+            for line, row, values in parsed:
+                try:
+                    with transaction.atomic():
+                        counts = self.write([values])
+                except DatabaseError as row_error:
+                    self.fail(line, row, row_error)
+                else:
+                    self.add_counts(counts)
+        else:
+            self.add_counts(counts)
+        logger.info(f"CSV rows {chunk[0][0]}-{chunk[-1][0]} imported")
+
+    def add_counts(self, counts):
+        created, updated, users_created = counts
+        self.created += created
+        self.updated += updated
+        self.users_created += users_created
+
+    def assign_reg_ids(self, parsed):
+        """Give rows without a reg_id the player's reg_id in this season, else from an earlier season, else a new one."""
+        missing = [values for _, _, values in parsed if not values["reg_id"]]
+        if not missing:
+            return
+        previous = {}
+        known = (
+            PlayerRegistration.objects.filter(user__username__in={values["username"] for values in missing})
+            .order_by("user__username", "-created")
+            .values_list("user__username", "season_id", "reg_id")
+        )
+        for username, season_id, reg_id in known:
+            # Re-importing a sheet updates this season's registration instead of adding a second one
+            if season_id == self.season.id:
+                previous[username] = reg_id
+            else:
+                previous.setdefault(username, reg_id)
+
+        need_new = [values for values in missing if values["username"] not in previous]
+        new_reg_ids = iter(RegistrationSequence.allocate_reg_ids(self.season, len(need_new)))
+        for values in missing:
+            values["reg_id"] = previous.get(values["username"]) or next(new_reg_ids)
+
+    def drop_duplicates(self, parsed):
+        # One statement cannot write the same reg_id twice; like the sheet order, the last row wins
+        last_line = {values["reg_id"]: line for line, _, values in parsed}
+        kept = []
+        for line, row, values in parsed:
+            if last_line[values["reg_id"]] != line:
+                self.fail(line, row, f"duplicate reg_id {values['reg_id']}, replaced by line {last_line[values['reg_id']]}")
+            else:
+                kept.append((line, row, values))
+        return kept
+
+    def write(self, rows):
+        """Upsert the users and registrations of `rows`; returns (created, updated, users_created)."""
+        users, users_created = self.upsert_users(rows)
+
+        existing = dict(
+            PlayerRegistration.objects.filter(season=self.season, reg_id__in=[values["reg_id"] for values in rows])
+            .values_list("reg_id", "id")
+        )
+        to_create = []
+        to_update = []
+        for values in rows:
+            registration = PlayerRegistration(
+                season=self.season,
+                reg_id=values["reg_id"],
+                user=users[values["username"]],
+                points=self.points_map.get(values["reg_id"], values["points"]),
+                **values["registration"],
+            )
+            if values["reg_id"] in existing:
+                registration.id = existing[values["reg_id"]]
+                to_update.append(registration)
+            else:
+                to_create.append(registration)
+
+        if to_update:
+            PlayerRegistration.objects.bulk_update(to_update, REGISTRATION_FIELDS)
+        if to_create:
+            PlayerRegistration.objects.bulk_create(
+                to_create, **self.upsert_options(["season", "reg_id"], REGISTRATION_FIELDS)
+            )
+        return len(to_create), len(to_update), users_created
+
+    def upsert_users(self, rows):
+        latest = {values["username"]: values for values in rows}
+        users = User.objects.in_bulk(list(latest), field_name="username")
+
+        changed = []
+        for username, user in users.items():
+            values = latest[username]
+            if any(getattr(user, field) != values[field] for field in USER_FIELDS):
+                for field in USER_FIELDS:
+                    setattr(user, field, values[field])
+                changed.append(user)
+        if changed:
+            User.objects.bulk_update(changed, USER_FIELDS)
+
+        new_users = [
+            User(
+                username=username,
+                first_name=values["first_name"],
+                last_name=values["last_name"],
+                email=values["email"],
+                password=values.get("password_hash") or self.hash_passwords([values["password"]])[0],
+            )
+            for username, values in latest.items()
+            if username not in users
+        ]
+        if new_users:
+            User.objects.bulk_create(new_users, **self.upsert_options(["username"], USER_FIELDS))
+            if any(user.pk is None for user in new_users):
+                # Backends that can't return ids from a bulk insert
+                users.update(User.objects.in_bulk([user.username for user in new_users], field_name="username"))
+            else:
+                users.update((user.username, user) for user in new_users)
+        return users, len(new_users)
+
+    def hash_passwords(self, passwords):
+        iterations = settings.CSV_IMPORT_PASSWORD_ITERATIONS
+        processes = settings.CSV_IMPORT_HASH_PROCESSES
+        if processes <= 1 or len(passwords) < processes * 8:
+            return _hash_passwords(passwords, iterations)
+        if self.hash_executor is None:
+            self.hash_executor = ProcessPoolExecutor(max_workers=processes)
+        size = -(-len(passwords) // processes)
+        batches = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        futures = [self.hash_executor.submit(_hash_passwords, batch, iterations) for batch in batches]
+        return [hashed for future in futures for hashed in future.result()]
+
+    def hash_new_passwords(self, rows):
+        latest = {values["username"]: values for values in rows}
+        existing = set(User.objects.filter(username__in=list(latest)).values_list("username", flat=True))
+        pending = [values for username, values in latest.items() if username not in existing]
+        for values, hashed in zip(pending, self.hash_passwords([values["password"] for values in pending])):
+            values["password_hash"] = hashed
+
+    @staticmethod
+    def upsert_options(unique_fields, update_fields):
+        # A row inserted concurrently (e.g. a live registration) becomes an update instead of an error
+        if connection.features.supports_update_conflicts_with_target:
+            return {"update_conflicts": True, "unique_fields": unique_fields, "update_fields": update_fields}
+        return {}
+
+    def save_error_report(self):
+        if not self.errors:
+            return None
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=ERROR_REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(self.errors)
+        stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        name = get_import_storage().save(
+            f"reports/season{self.season.id}_{stamp}_errors.csv",
+            ContentFile(buffer.getvalue().encode("utf-8")),
+        )
+        logger.warning(f"CSV import for season {self.season.id}: {len(self.errors)} rows rejected, see {name}")
+        return name
+
+
+def apply_points_sheet(season, df):
+    """Set points from a reg_id,points DataFrame in one transaction.
+
+    Adds a `status` column (UPDATED, NOT FOUND or INVALID) to `df` and
+    returns a summary of the counts. When a reg_id appears more than once
+    the last row wins.
+    """
+    reg_ids = df["reg_id"].astype(str).str.strip()
+    points = pd.to_numeric(df["points"], errors="coerce")
+    valid = points.notna() & df["reg_id"].notna() & reg_ids.ne("")
+
+    existing = dict(
+        PlayerRegistration.objects.filter(season=season, reg_id__in=set(reg_ids[valid]))
+        .values_list("reg_id", "id")
+    )
+    matched = valid & reg_ids.isin(existing.keys())
+    df["status"] = np.select([matched, valid], ["UPDATED", "NOT FOUND"], default="INVALID")
+
+    latest = dict(zip(reg_ids[matched], points[matched].astype(int)))
+    registrations = [PlayerRegistration(id=existing[reg_id], points=value) for reg_id, value in latest.items()]
+    with transaction.atomic():
+        PlayerRegistration.objects.bulk_update(registrations, ["points"], batch_size=1000)
+
+    summary = {
+        "matched": int(matched.sum()),
+        "unmatched": int((valid & ~matched).sum()),
+        "invalid": int((~valid).sum()),
+    }
+    logger.info(f"Points sheet for season {season.id} applied: {summary}")
+    return summary
+
+
+def apply_points_file(season, name):
+    """Apply a spooled points sheet and store the per-row statuses as a report CSV."""
+    with get_import_storage().open(name, "rb") as handle:
+        df = pd.read_csv(handle, dtype={"reg_id": str})
+    if not {"reg_id", "points"}.issubset(df.columns):
+        raise ValueError("CSV must contain 'reg_id' and 'points' columns.")
+
+    summary = apply_points_sheet(season, df)
+    stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    summary["report"] = get_import_storage().save(
+        f"reports/points_season{season.id}_{stamp}.csv",
+        ContentFile(df.to_csv(index=False).encode("utf-8")),
+    )
+    return summary
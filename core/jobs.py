@@ -0,0 +1,192 @@
+"""Durable, database-backed background job queue.
+
+Jobs are rows in BackgroundJob, so they survive restarts, are visible from
+appcontrol and are claimed exactly once across gunicorn and worker
+processes. Functions become jobs with the @job decorator and are queued with
+``func.enqueue(*args, **kwargs)``; ``manage.py run_jobs`` executes them.
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import BackgroundJob
+
+logger = logging.getLogger('core')
+
+# Default concurrency per queue, shared by all worker processes
+DEFAULT_QUEUES = {
+    "email": 10,
+    "bulk_email": 3,
+    "csv": 1,
+    "common": 5,
+}
+
+_current = threading.local()
+
+
+def get_queue_limits():
+    return getattr(settings, "JOB_QUEUES", DEFAULT_QUEUES)
+
+
+def retry_delay(attempt):
+    """Exponential backoff with jitter for failed jobs, capped at 10 minutes."""
+    base = getattr(settings, "JOB_RETRY_BASE_DELAY", 10)
+    delay = min(600, base * (2 ** (attempt - 1)))
+    return delay + random.uniform(0, delay / 2)
+
+
+def job(queue="common", max_attempts=3):
+    """Register a module-level function as a background job."""
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def enqueue(*args, run_after=None, unique=False, **kwargs):
+            return enqueue_job(name, queue, args, kwargs, max_attempts, run_after, unique)
+
+        func.job_name = name
+        func.job_queue = queue
+        func.enqueue = enqueue
+        return func
+
+    return decorator
+
+
+def enqueue_job(name, queue, args=(), kwargs=None, max_attempts=3, run_after=None, unique=False):
+    """Insert the job row; with unique=True nothing is queued if the same job is already waiting."""
+    if unique and BackgroundJob.objects.filter(name=name, status="QUEUED").exists():
+        return None
+
+    background_job = BackgroundJob(
+        queue=queue,
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        max_attempts=max_attempts,
+        run_after=run_after or timezone.now(),
+    )
+    background_job.save()
+    logger.info(f"Queued job {background_job.id} {name} on '{queue}'")
+    return background_job
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_jobs(queue, limit, worker):
+    """Atomically move up to `limit` due jobs of the queue to RUNNING.
+
+    The queue's concurrency limit is enforced globally by counting RUNNING
+    rows, so several worker processes never exceed it together.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Serialise claims per queue so the RUNNING count below stays accurate
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"jobs:{queue}"])
+        running = BackgroundJob.objects.filter(queue=queue, status="RUNNING").count()
+        limit = min(limit, get_queue_limits().get(queue, 1) - running)
+        if limit <= 0:
+            return []
+        jobs = list(
+            BackgroundJob.objects.select_for_update(skip_locked=skip_locked)
+            .filter(queue=queue, status="QUEUED", run_after__lte=timezone.now())
+            .order_by("run_after", "id")[:limit]
+        )
+        if not jobs:
+            return []
+        now = timezone.now()
+        BackgroundJob.objects.filter(id__in=[j.id for j in jobs]).update(
+            status="RUNNING",
+            locked_by=worker,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+    for claimed in jobs:
+        claimed.status = "RUNNING"
+        claimed.attempts += 1
+    return jobs
+
+
+def run_job(background_job):
+    """Execute a claimed job and record its outcome."""
+    _current.job_id = background_job.id
+    try:
+        func = import_string(background_job.name)
+        with metrics.track_job(background_job.name):
+            result = func(*background_job.args, **background_job.kwargs)
+    except Exception as e:
+        logger.exception(f"Job {background_job.id} {background_job.name} failed: {e}")
+        if background_job.attempts < background_job.max_attempts:
+            run_after = timezone.now() + datetime.timedelta(seconds=retry_delay(background_job.attempts))
+            BackgroundJob.objects.filter(id=background_job.id).update(
+                status="QUEUED", error=str(e), run_after=run_after, locked_by="",
+            )
+        else:
+            BackgroundJob.objects.filter(id=background_job.id).update(
+                status="FAILED", error=str(e), finished_at=timezone.now(),
+            )
+        return False
+    finally:
+        _current.job_id = None
+
+    BackgroundJob.objects.filter(id=background_job.id).update(
+        status="DONE",
+        result=result if isinstance(result, (dict, list, str, int, float, bool)) else None,
+        error="",
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+def report_progress(done, total=None):
+    """Record progress for the job running in this thread (no-op outside a job)."""
+    job_id = getattr(_current, "job_id", None)
+    if job_id is None:
+        return
+    values = {"progress": done, "heartbeat_at": timezone.now()}
+    if total is not None:
+        values["total"] = total
+    BackgroundJob.objects.filter(id=job_id).update(**values)
+
+
+def heartbeat(job_ids):
+    """Mark jobs as still alive; called by the worker loop for the jobs it is running."""
+    if job_ids:
+        BackgroundJob.objects.filter(id__in=job_ids, status="RUNNING").update(heartbeat_at=timezone.now())
+
+
+def requeue_stale_jobs(timeout):
+    """Put RUNNING jobs whose worker stopped sending heartbeats back on the queue.
+
+    The claim already counted the attempt, so jobs that used their last one
+    are marked FAILED instead of being run again. Returns the number requeued.
+    """
+    now = timezone.now()
+    stale = BackgroundJob.objects.filter(status="RUNNING", heartbeat_at__lt=now - datetime.timedelta(seconds=timeout))
+    count = stale.filter(attempts__lt=F("max_attempts")).update(
+        status="QUEUED", locked_by="", run_after=now,
+    )
+    failed = stale.update(
+        status="FAILED", error="Worker stopped sending heartbeats", finished_at=now,
+    )
+    if count:
+        logger.warning(f"Requeued {count} stale jobs")
+    if failed:
+        logger.error(f"Failed {failed} stale jobs that used all their attempts")
+    return count
@@ -0,0 +1,506 @@
+"""Shared mail delivery engine used by every mail path.
+
+Keeps a small pool of long-lived SMTP connections per process, paces sends
+with a token bucket that halves its rate whenever the provider throttles us
+and slowly recovers afterwards, and reports throughput for every batch.
+
+Failures are classified as permanent, transient, throttled or auth. Permanent
+ones (hard bounces) fail at once, transient ones are retried with backoff, and
+a throttle trips a circuit breaker kept in the cache that pauses every sender
+thread and worker until the provider has had time to cool down. An auth
+failure is not the recipient's fault: it trips the breaker too and aborts the
+whole delivery, leaving the unsent messages for the caller to put back.
+"""
+import contextvars
+import itertools
+import logging
+import queue
+import random
+import smtplib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.mail import get_connection
+
+from . import metrics
+
+logger = logging.getLogger('core')
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+AUTH = "auth"
+
+
+def classify_smtp_error(error):
+    """Return PERMANENT, TRANSIENT, THROTTLED or AUTH for a delivery exception."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return PERMANENT if codes and all(code >= 500 for code in codes) else TRANSIENT
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Bad credentials fail every message alike and won't fix themselves between attempts
+        return AUTH
+    if isinstance(error, smtplib.SMTPResponseException):
+        code = error.smtp_code
+        detail = error.smtp_error.decode(errors="replace") if isinstance(error.smtp_error, bytes) else str(error.smtp_error)
+        # 421 is "slow down"; Gmail reports an exhausted sending quota as 550 5.4.5
+        if code == 421 or code == 454 or "5.4.5" in detail or "rate limit" in detail.lower():
+            return THROTTLED
+        return PERMANENT if code >= 500 else TRANSIENT
+    if isinstance(error, (smtplib.SMTPException, ConnectionError, socket.timeout, OSError)):
+        # Dropped connections, timeouts and handshake failures
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for transient failures."""
+
+    def __init__(self, max_attempts, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        return kind in (TRANSIENT, THROTTLED) and attempt < self.max_attempts
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+
+class CircuitBreaker:
+    """Pause every sender after the provider throttles one of them.
+
+    State lives in the cache (EMAIL_CIRCUIT_CACHE_ALIAS), so all threads and,
+    with a shared cache such as redis, all worker processes see it. A trip
+    opens the circuit for a pause that doubles with each consecutive trip.
+    When it expires the circuit is half-open: one sender at a time probes
+    until a send succeeds and closes it again.
+    """
+
+    OPEN_KEY = "mail:circuit:open_until"
+    TRIPS_KEY = "mail:circuit:trips"
+    PROBE_KEY = "mail:circuit:probe"
+
+    def __init__(self, base_pause, max_pause):
+        self.base_pause = base_pause
+        self.max_pause = max_pause
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "EMAIL_CIRCUIT_CACHE_ALIAS", "default")]
+
+    def wait(self):
+        """Block while the circuit is open; returns True if this sender is the half-open probe."""
+        while True:
+            state = self.cache.get_many([self.OPEN_KEY, self.TRIPS_KEY])
+            remaining = state.get(self.OPEN_KEY, 0) - time.time()
+            if remaining > 0:
+                time.sleep(min(remaining, 5))
+                continue
+            if not state.get(self.TRIPS_KEY):
+                return False
+            if self.cache.add(self.PROBE_KEY, 1, timeout=60):
+                return True
+            time.sleep(1)
+
+    def trip(self, reason="Mail provider throttled us"):
+        """Open the circuit; returns the pause in seconds."""
+        self.cache.add(self.TRIPS_KEY, 0, timeout=3600)
+        try:
+            trips = self.cache.incr(self.TRIPS_KEY)
+        except ValueError:
+            # The key expired between add and incr
+            self.cache.set(self.TRIPS_KEY, 1, timeout=3600)
+            trips = 1
+        pause = min(self.max_pause, self.base_pause * 2 ** (trips - 1))
+        self.cache.set(self.OPEN_KEY, time.time() + pause, timeout=int(pause) + 60)
+        self.cache.delete(self.PROBE_KEY)
+        logger.warning(f"{reason} (trip {trips}), pausing all senders for {pause:g}s")
+        return pause
+
+    def release_probe(self):
+        self.cache.delete(self.PROBE_KEY)
+
+    def reset(self):
+        self.cache.delete_many([self.OPEN_KEY, self.TRIPS_KEY, self.PROBE_KEY])
+        logger.info("Mail circuit closed")
+
+
+class TokenBucket:
+    """Token bucket rate limiter with adaptive slow-down on provider throttling."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.max_rate = rate_per_minute / 60.0
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one message may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now > self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self):
+        """Halve the send rate; the circuit breaker takes care of pausing."""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+        logger.warning(f"Mail send rate lowered to {self.rate * 60:.1f} msg/min")
+
+    def recover(self):
+        """Creep back towards the configured rate after a successful send."""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+
+
+class PooledConnection:
+    def __init__(self):
+        self.backend = get_connection(fail_silently=False)
+        with metrics.external("smtp"):
+            self.backend.open()
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def send(self, message):
+        with metrics.external("smtp"):
+            self.backend.send_messages([message])
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.backend.close()
+        except Exception:
+            pass
+
+
+class SMTPConnectionPool:
+    """At most `size` open, authenticated connections, reused across batches."""
+
+    def __init__(self, size, max_messages, idle_timeout):
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _checkout(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return PooledConnection()
+            # Providers drop idle sessions; reconnecting beats a failed send
+            if time.monotonic() - conn.last_used < self.idle_timeout:
+                return conn
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                if conn.sent >= self.max_messages:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+@dataclass
+class DeliveryReport:
+    sent: int = 0
+    failed: int = 0
+    rate_limited: int = 0
+    build_seconds: float = 0.0
+    send_seconds: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+    finished: float = None
+    failures: list = field(default_factory=list)
+    # The auth error that stopped the delivery; messages not sent by then have no outcome
+    aborted: Exception = None
+    # (item, error) per item, error None when sent; lets callers record per-recipient state
+    outcomes: list = field(default_factory=list, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def seconds(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def per_minute(self):
+        return self.sent * 60 / self.seconds if self.seconds else 0.0
+
+    def add_sent(self, item=None):
+        with self.lock:
+            self.sent += 1
+            self.outcomes.append((item, None))
+
+    def add_failure(self, recipient, error, item=None):
+        with self.lock:
+            self.failed += 1
+            self.failures.append({"to": recipient, "error": str(error)[:200]})
+            self.outcomes.append((item, error))
+
+    def as_dict(self):
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "seconds": round(self.seconds, 1),
+            "per_minute": round(self.per_minute, 1),
+            "build_seconds": round(self.build_seconds, 2),
+            "send_seconds": round(self.send_seconds, 2),
+            "failures": self.failures[:50],
+            "aborted": str(self.aborted) if self.aborted else None,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.sent} sent, {self.failed} failed, {self.rate_limited} rate limited "
+            f"in {self.seconds:.1f}s ({self.per_minute:.1f} msg/min; "
+            f"build {self.build_seconds:.1f}s, send {self.send_seconds:.1f}s)"
+        )
+
+
+_engine_lock = threading.Lock()
+_bucket = None
+_pool = None
+_breaker = None
+
+
+def get_rate_limiter():
+    """Process-wide bucket, so concurrent batches share the provider limit."""
+    global _bucket
+    with _engine_lock:
+        if _bucket is None:
+            _bucket = TokenBucket(settings.EMAIL_RATE_PER_MINUTE, settings.EMAIL_BURST)
+        return _bucket
+
+
+def get_circuit_breaker():
+    global _breaker
+    with _engine_lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(settings.EMAIL_CIRCUIT_BASE_PAUSE, settings.EMAIL_MAX_BACKOFF)
+        return _breaker
+
+
+def get_retry_policy():
+    return RetryPolicy(settings.EMAIL_MAX_ATTEMPTS)
+
+
+def get_connection_pool():
+    global _pool
+    with _engine_lock:
+        if _pool is None:
+            _pool = SMTPConnectionPool(
+                settings.EMAIL_POOL_SIZE,
+                settings.EMAIL_MAX_MESSAGES_PER_CONNECTION,
+                settings.EMAIL_CONNECTION_IDLE_TIMEOUT,
+            )
+        return _pool
+
+
+def _item_label(item):
+    if isinstance(item, dict):
+        return item.get("to_email")
+    if isinstance(item, (tuple, list)) and item:
+        return _item_label(item[0])
+    return getattr(item, "to_email", None) or str(item)
+
+
+def _recipient(message):
+    return ", ".join(message.to)
+
+
+def _deliver_chunk(chunk, report):
+    """Send a chunk of (item, message) pairs over pooled connections.
+
+    Iterative: a failed message goes back to the front of the queue with its
+    attempt count, on a fresh connection, until it is sent or the retry
+    policy gives up on it. After an auth failure (here or in another sender
+    thread) the rest of the chunk is left unsent.
+    """
+    bucket = get_rate_limiter()
+    breaker = get_circuit_breaker()
+    policy = get_retry_policy()
+    pool = get_connection_pool()
+    pending = [(item, message, 1) for item, message in chunk]
+
+    while pending:
+        probing = False
+        try:
+            with pool.connection() as conn:
+                while pending:
+                    if report.aborted is not None:
+                        return
+                    item, message, attempt = pending[0]
+                    probing = breaker.wait()
+                    bucket.acquire()
+                    conn.send(message)
+                    pending.pop(0)
+                    report.add_sent(item)
+                    bucket.recover()
+                    if probing:
+                        breaker.reset()
+                        probing = False
+        except Exception as e:
+            # The pool has discarded the connection; retries start on a new one
+            item, message, attempt = pending.pop(0)
+            kind = classify_smtp_error(e)
+            if kind == AUTH:
+                logger.error(f"SMTP authentication failed, stopping delivery: {e}")
+                report.aborted = e
+                breaker.trip("SMTP authentication failed")
+                return
+            if kind == THROTTLED:
+                with report.lock:
+                    report.rate_limited += 1
+                breaker.trip()
+                bucket.throttle()
+            elif probing:
+                # Not a throttle, so let the next sender probe instead of waiting for the key to expire
+                breaker.release_probe()
+            if not policy.should_retry(kind, attempt):
+                logger.error(f"Failed to send to {_recipient(message)} ({kind}, attempt {attempt}): {e}")
+                report.add_failure(_recipient(message), e, item)
+                continue
+            logger.warning(f"Retrying {_recipient(message)} ({kind}, attempt {attempt}/{policy.max_attempts}): {e}")
+            if kind == TRANSIENT:
+                time.sleep(policy.delay(attempt))
+            pending.insert(0, (item, message, attempt + 1))
+
+
+def send_message(message):
+    """Send a single message through the shared engine.
+
+    Returns True when sent and False for a permanent failure; raises the last
+    error when transient failures outlast the retry policy or authentication
+    fails, so a calling job can be retried later.
+    """
+    report = DeliveryReport()
+    _deliver_chunk([(None, message)], report)
+    if report.sent:
+        return True
+    if report.aborted is not None:
+        raise report.aborted
+    error = report.outcomes[-1][1]
+    if classify_smtp_error(error) == PERMANENT:
+        return False
+    raise error
+
+
+def deliver(items, build_message, on_progress=None, on_outcomes=None):
+    """Build and send one message per item; returns a DeliveryReport.
+
+    Items are consumed lazily in chunks of EMAIL_CHUNK_SIZE by
+    EMAIL_POOL_SIZE sender threads; time spent producing and building
+    messages is reported apart from time spent sending them.
+    `build_message(item)` returns an EmailMessage; items whose message
+    can't be built count as failed. `on_progress(done)` and
+    `on_outcomes(new_outcomes)` are called periodically from the calling
+    thread, the latter with the (item, error) pairs finished since the
+    previous call. After an auth failure no further chunks are taken and
+    `report.aborted` holds the error.
+    """
+    report = DeliveryReport()
+    items = iter(items)
+    items_lock = threading.Lock()
+
+    def next_chunk():
+        if report.aborted is not None:
+            return [], []
+        started = time.perf_counter()
+        with items_lock:
+            raw = list(itertools.islice(items, settings.EMAIL_CHUNK_SIZE))
+        chunk = []
+        for item in raw:
+            try:
+                chunk.append((item, build_message(item)))
+            except Exception as e:
+                logger.error(f"Could not build message for {_item_label(item)}: {e}")
+                report.add_failure(_item_label(item), e, item)
+        with report.lock:
+            report.build_seconds += time.perf_counter() - started
+        return raw, chunk
+
+    def sender():
+        while True:
+            raw, chunk = next_chunk()
+            if not raw:
+                return
+            started = time.perf_counter()
+            _deliver_chunk(chunk, report)
+            with report.lock:
+                report.send_seconds += time.perf_counter() - started
+
+    # Each sender runs in a copy of the caller's context, so SMTP time counts towards its request or job
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(sender,), name=f"mail-sender-{i}", daemon=True)
+        for i in range(settings.EMAIL_POOL_SIZE)
+    ]
+    for thread in threads:
+        thread.start()
+    # Progress is reported from the calling thread, which owns the job context
+    reported = 0
+    flushed = 0
+
+    def publish():
+        nonlocal reported, flushed
+        done = report.sent + report.failed
+        if on_progress is not None and done != reported:
+            on_progress(done)
+            reported = done
+        if on_outcomes is not None:
+            with report.lock:
+                new_outcomes = report.outcomes[flushed:]
+            if new_outcomes:
+                on_outcomes(new_outcomes)
+                flushed += len(new_outcomes)
+
+    while True:
+        alive = [thread for thread in threads if thread.is_alive()]
+        if not alive:
+            break
+        alive[0].join(timeout=0.5)
+        publish()
+
+    report.finished = time.monotonic()
+    publish()
+    return report
@@ -0,0 +1,178 @@
+import datetime
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from core.models import Payment, PlayerRegistration, Season
+
+BENCH_SEASON_TITLE = "Index benchmark"
+BENCH_USER_PREFIX = "idxbench"
+
+# Indexes added for the hot registration / payment lookups, dropped for the "before" pass
+NEW_INDEXES = {
+    PlayerRegistration: ["reg_user_season", "reg_season_completed_mail", "reg_season_created"],
+    Payment: ["payment_reg_user_created"],
+}
+TRIGRAM_INDEXES = ["reg_reg_id_trgm", "reg_player_name_trgm"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot PlayerRegistration / Payment queries with and without their indexes. "
+        "Seeds a synthetic season on first run and prints timings plus query plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100000, help="Registrations to seed (default: 100000)")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the median is reported")
+        parser.add_argument("--no-plans", action="store_true", help="Only print timings")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the benchmark data and exit")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            Season.objects.filter(title=BENCH_SEASON_TITLE).delete()
+            deleted, _ = User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f"Benchmark data removed ({deleted} rows)"))
+            return
+
+        season = self.seed(options["rows"])
+        # Fresh planner statistics, otherwise SQLite guesses index selectivity
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.repeat = options["repeat"]
+        self.show_plans = not options["no_plans"]
+
+        with transaction.atomic():
+            self.drop_indexes()
+            before = self.run_queries(season, "without indexes")
+            transaction.set_rollback(True)
+        after = self.run_queries(season, "with indexes")
+
+        self.stdout.write("")
+        self.stdout.write(f"{'query':<28} {'before ms':>10} {'after ms':>10}")
+        for name in before:
+            self.stdout.write(f"{name:<28} {before[name]:>10.2f} {after[name]:>10.2f}")
+
+    def seed(self, rows):
+        season = Season.objects.filter(title=BENCH_SEASON_TITLE).first()
+        if season is not None:
+            existing = PlayerRegistration.objects.filter(season=season).count()
+            self.stdout.write(f"Using existing benchmark season #{season.id} ({existing} registrations)")
+            return season
+
+        admin = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser(
+            f"{BENCH_USER_PREFIX}-admin", "", None
+        )
+        today = datetime.date.today()
+        season = Season.objects.create(
+            user=admin, title=BENCH_SEASON_TITLE, year=str(today.year),
+            start_date=today, end_date=today, amount=499,
+        )
+        self.stdout.write(f"Seeding {rows} registrations into season #{season.id}...")
+
+        batch_size = 5000
+        for start in range(0, rows, batch_size):
+            count = min(batch_size, rows - start)
+            users = User.objects.bulk_create([
+                User(username=f"{BENCH_USER_PREFIX}{start + i}", email=f"{BENCH_USER_PREFIX}{start + i}@example.com")
+                for i in range(count)
+            ])
+            if not users[0].pk:
+                users = list(User.objects.filter(
+                    username__in=[user.username for user in users]
+                ).order_by("id"))
+            registrations = PlayerRegistration.objects.bulk_create([
+                PlayerRegistration(
+                    season=season,
+                    reg_id=f"IB{start + i:07d}",
+                    user=user,
+                    player_name=f"Bench Player {start + i}",
+                    father_name="Bench",
+                    category="Senior",
+                    age=25,
+                    dob=datetime.date(2000, 1, 1),
+                    gender="Male",
+                    tshirt_size="M",
+                    mobile="9000000000",
+                    wathsapp_number="9000000000",
+                    email=user.email,
+                    adhar_card=f"{start + i:012d}",
+                    district="Hyderabad",
+                    pin_code=500001,
+                    address="Benchmark",
+                    is_selected=(start + i) % 10 == 0,
+                    points=(start + i) % 100,
+                    is_compleated=(start + i) % 3 != 0,
+                    is_mail_sent=(start + i) % 5 == 0,
+                )
+                for i, user in enumerate(users)
+            ])
+            Payment.objects.bulk_create([
+                Payment(
+                    user=registration.user,
+                    registration=registration,
+                    recpt_id=f"idxbench-{registration.reg_id}",
+                    amount=49900,
+                    status="PAID",
+                    is_compleated=True,
+                )
+                for registration in registrations
+                if registration.is_compleated
+            ])
+        return season
+
+    def drop_indexes(self):
+        # Plain DROP INDEX: the SQLite schema editor refuses to run inside a transaction
+        names = [name for names in NEW_INDEXES.values() for name in names]
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            if connection.vendor == "postgresql":
+                for name in TRIGRAM_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def queries(self, season):
+        sample = PlayerRegistration.objects.filter(season=season).order_by("reg_id").values("user_id", "id")[
+            PlayerRegistration.objects.filter(season=season).count() // 2
+        ]
+        latest_payment = Payment.objects.filter(
+            registration=OuterRef("pk"), user=OuterRef("user")
+        ).order_by("-created_at", "-id")
+        listing = PlayerRegistration.objects.filter(season=season).select_related("user").annotate(
+            payment_amount=Subquery(latest_payment.values("amount")[:1])
+        )
+        return {
+            "own registration": PlayerRegistration.objects.filter(user_id=sample["user_id"], season=season)[:1],
+            "mail listing page": listing.filter(is_compleated=True, is_mail_sent=False).order_by("-created", "id")[:100],
+            "full listing page": listing.order_by("-created", "id")[:100],
+            "search reg_id/name": listing.filter(
+                Q(reg_id__icontains="0012") | Q(player_name__icontains="player 12")
+            ).order_by("-created", "id")[:100],
+            "results listing": PlayerRegistration.objects.filter(
+                season=season, is_selected=True
+            ).order_by("-points", "reg_id")[:100],
+            "latest payment": Payment.objects.filter(
+                registration_id=sample["id"], user_id=sample["user_id"]
+            ).order_by("-created_at", "-id")[:1],
+        }
+
+    def run_queries(self, season, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label} =="))
+        timings = {}
+        for name, queryset in self.queries(season).items():
+            runs = []
+            for _ in range(self.repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                runs.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(runs)
+            self.stdout.write(f"{name}: {timings[name]:.2f} ms")
+            if self.show_plans:
+                options = {"analyze": True} if connection.vendor == "postgresql" else {}
+                for line in queryset.explain(**options).splitlines():
+                    self.stdout.write(f"    {line}")
+        return timings
@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import paymentHandler
+
+
+class Command(BaseCommand):
+    help = (
+        "Complete registrations whose Razorpay capture never reached us. "
+        "Pages through the gateway's payment list in bulk; run it periodically from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24, help="How far back to look (default: 24)")
+        parser.add_argument("--webhooks", action="store_true", help="Also drain pending webhook events first")
+
+    def handle(self, *args, **options):
+        if options["webhooks"]:
+            handled = paymentHandler.process_webhook_events()
+            self.stdout.write(f"Webhook events handled: {handled}")
+
+        since = timezone.now() - datetime.timedelta(hours=options["hours"])
+        try:
+            seen, applied = paymentHandler.reconcile_payments(since)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Payments seen: {seen}, newly completed: {applied}"))
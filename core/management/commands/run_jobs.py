@@ -0,0 +1,94 @@
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core import jobs
+
+logger = logging.getLogger('core')
+
+
+class Command(BaseCommand):
+    help = "Run background jobs from the BackgroundJob table (one thread pool per queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queue", action="append", dest="queues",
+            help="Queue to serve; repeat for several (default: all configured queues)",
+        )
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls when idle")
+        parser.add_argument(
+            "--stale-after", type=int, default=300,
+            help="Requeue RUNNING jobs without a heartbeat for this many seconds",
+        )
+        parser.add_argument("--once", action="store_true", help="Drain the due jobs and exit")
+
+    def handle(self, *args, **options):
+        import core.task  # noqa: F401  make sure job functions are importable
+
+        limits = jobs.get_queue_limits()
+        queues = options["queues"] or list(limits)
+        unknown = [queue for queue in queues if queue not in limits]
+        if unknown:
+            raise CommandError(f"Unknown queue(s): {', '.join(unknown)}")
+
+        worker = jobs.worker_id()
+        pools = {queue: ThreadPoolExecutor(max_workers=limits[queue], thread_name_prefix=f"job-{queue}") for queue in queues}
+        running = {queue: set() for queue in queues}
+        lock = threading.Lock()
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            logger.info("Worker stopping, waiting for running jobs...")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def execute(queue, background_job):
+            try:
+                jobs.run_job(background_job)
+            finally:
+                with lock:
+                    running[queue].discard(background_job.id)
+                close_old_connections()
+
+        self.stdout.write(f"Worker {worker} serving queues: {', '.join(queues)}")
+        last_maintenance = 0.0
+        while not stopping.is_set():
+            claimed_any = False
+            now = time.monotonic()
+            if now - last_maintenance > 30:
+                with lock:
+                    alive = [job_id for ids in running.values() for job_id in ids]
+                jobs.heartbeat(alive)
+                jobs.requeue_stale_jobs(options["stale_after"])
+                last_maintenance = now
+
+            for queue in queues:
+                with lock:
+                    free = limits[queue] - len(running[queue])
+                if free <= 0:
+                    continue
+                for background_job in jobs.claim_jobs(queue, free, worker):
+                    claimed_any = True
+                    with lock:
+                        running[queue].add(background_job.id)
+                    pools[queue].submit(execute, queue, background_job)
+
+            close_old_connections()
+            if options["once"] and not claimed_any:
+                with lock:
+                    busy = any(running.values())
+                if not busy:
+                    break
+            if not claimed_any:
+                stopping.wait(options["poll"])
+
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+        self.stdout.write("Worker stopped")
@@ -0,0 +1,240 @@
+import datetime
+import random
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.constants import (
+    BOWLING_ARMS, DISTRICT_ZONE_MAP, FIRST_PREFERENCES, GENDERS, OCCUPATION, ROLE, TSHIRT_SIZES,
+)
+from core.models import GeneralSettings, Payment, PlayerRegistration, RegistrationSequence, Season
+
+# Relative registration volume per district; the metros send the most players
+DISTRICT_WEIGHTS = {
+    "Chennai": 12, "Coimbatore": 7, "Madurai": 6, "Tiruchi": 5, "Salem": 5,
+    "Tiruppur": 4, "Erode": 4, "Vellore": 4, "Tirunelveli": 4, "Kanchipuram": 3,
+    "Chengalpattu": 3, "Tiruvallur": 3, "Thanjavur": 3, "Thoothukudi": 3,
+}
+DISTRICTS = list(DISTRICT_ZONE_MAP)
+DISTRICT_SHARES = [DISTRICT_WEIGHTS.get(district, 1) for district in DISTRICTS]
+
+SEASON_TITLE = "Load Test"
+
+# Share of registrations per payment outcome; "NONE" registered but never reached the gateway
+PAYMENT_OUTCOMES = {"PAID": 70, "PENDING": 15, "FAILED": 5, "NONE": 10}
+
+FIRST_NAMES = [
+    "Arun", "Karthik", "Vijay", "Surya", "Praveen", "Dinesh", "Ramesh", "Manoj", "Senthil", "Bala",
+    "Ganesh", "Harish", "Naveen", "Prakash", "Rajesh", "Saravanan", "Vignesh", "Yuvaraj", "Divya", "Priya",
+]
+LAST_NAMES = [
+    "Kumar", "Raj", "Murugan", "Selvam", "Krishnan", "Pandian", "Subramani", "Velu", "Rajan", "Mani",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, registrations and payments for load tests and benchmarks. "
+        "Districts, categories and payment outcomes follow realistic proportions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users to create (default: 1000)")
+        parser.add_argument(
+            "--registered", type=float, default=0.9,
+            help="Fraction of the users that get a registration (default: 0.9)",
+        )
+        parser.add_argument("--season", type=int, help="Seed into this season (default: create one)")
+        parser.add_argument("--prefix", default="load", help="Usernames are <prefix><n>@example.com")
+        parser.add_argument("--password", default="loadtest123", help="Password of every seeded user")
+        parser.add_argument("--admin", action="store_true", help="Also create superuser <prefix>-admin@example.com")
+        parser.add_argument(
+            "--current", action="store_true",
+            help="Make the season current and open registrations and results in the general settings",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--random-seed", type=int, help="Seed for reproducible data")
+        parser.add_argument(
+            "--cleanup", action="store_true",
+            help=f"Delete the users with this prefix and the '{SEASON_TITLE}' seasons, then exit",
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if options["cleanup"]:
+            self.cleanup(prefix)
+            return
+
+        self.random = random.Random(options["random_seed"])
+        self.adhar_numbers = set()
+        # One hash for everyone; logins still pay the full hasher cost
+        self.password = make_password(options["password"])
+
+        season = self.get_season(options["season"])
+        if options["admin"]:
+            self.create_admin(prefix, options["password"])
+        if options["current"]:
+            self.make_current(season)
+
+        offset = User.objects.filter(username__startswith=prefix).count()
+        total = options["users"]
+        counts = {"users": 0, "registrations": 0, "payments": 0}
+        for start in range(0, total, options["batch_size"]):
+            size = min(options["batch_size"], total - start)
+            with transaction.atomic():
+                for key, value in self.seed_batch(season, prefix, offset + start, size, options["registered"]).items():
+                    counts[key] += value
+            self.stdout.write(f"  {start + size}/{total} users")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Season #{season.id}: {counts['users']} users, {counts['registrations']} registrations, "
+            f"{counts['payments']} payments (password '{options['password']}')"
+        ))
+
+    def cleanup(self, prefix):
+        with transaction.atomic():
+            seasons = Season.objects.filter(title=SEASON_TITLE)
+            # current_season cascades; keep the general settings row when its season goes
+            GeneralSettings.objects.filter(current_season__in=seasons).update(current_season=None)
+            season_rows, _ = seasons.delete()
+            user_rows, _ = User.objects.filter(username__startswith=prefix, email__endswith="@example.com").delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {user_rows} rows for users '{prefix}*' and {season_rows} rows for '{SEASON_TITLE}' seasons"
+        ))
+
+    def get_season(self, season_id):
+        if season_id:
+            season = Season.objects.filter(id=season_id).first()
+            if season is None:
+                raise CommandError(f"Season {season_id} does not exist")
+            return season
+
+        admin = User.objects.filter(is_superuser=True).first()
+        if admin is None:
+            raise CommandError("Create a superuser first, or pass --admin")
+        today = timezone.localdate()
+        return Season.objects.create(
+            user=admin,
+            title=SEASON_TITLE,
+            year=str(today.year),
+            start_date=today - datetime.timedelta(days=30),
+            end_date=today + datetime.timedelta(days=30),
+            amount=499,
+            accept_response=True,
+        )
+
+    def create_admin(self, prefix, password):
+        username = f"{prefix}-admin@example.com"
+        if not User.objects.filter(username=username).exists():
+            User.objects.create_superuser(username, username, password)
+            self.stdout.write(f"Superuser {username} created")
+
+    def make_current(self, season):
+        general = GeneralSettings.objects.first()
+        if general is None:
+            general = GeneralSettings(user=User.objects.filter(is_superuser=True).first())
+        general.current_season = season
+        general.enable_registration = True
+        general.show_points_table = True
+        general.enable_results = True
+        general.razorpay_key_id = general.razorpay_key_id or settings.RAZORPAY_KEY_ID or ""
+        general.save()
+        Season.objects.filter(id=season.id).update(accept_response=True)
+        self.stdout.write(f"Season #{season.id} is now the current season")
+
+    def seed_batch(self, season, prefix, offset, size, registered):
+        rnd = self.random
+        people = [(rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)) for _ in range(size)]
+        users = User.objects.bulk_create([
+            User(
+                username=f"{prefix}{offset + i}@example.com",
+                email=f"{prefix}{offset + i}@example.com",
+                first_name=first_name,
+                last_name=last_name,
+                password=self.password,
+            )
+            for i, (first_name, last_name) in enumerate(people)
+        ])
+        if users and users[0].pk is None:
+            users = list(User.objects.filter(username__in=[user.username for user in users]).order_by("id"))
+
+        players = [(user, people[i]) for i, user in enumerate(users) if rnd.random() < registered]
+        reg_ids = RegistrationSequence.allocate_reg_ids(season, len(players))
+        outcomes = rnd.choices(list(PAYMENT_OUTCOMES), weights=list(PAYMENT_OUTCOMES.values()), k=len(players))
+        registrations = PlayerRegistration.objects.bulk_create([
+            self.build_registration(season, user, first_name, last_name, reg_id, outcome == "PAID")
+            for (user, (first_name, last_name)), reg_id, outcome in zip(players, reg_ids, outcomes)
+        ])
+
+        # auto_now_add stamps the insert time; spread the rows over the registration window
+        window = max((season.end_date - season.start_date).days, 1) * 86400
+        start = timezone.make_aware(datetime.datetime.combine(season.start_date, datetime.time()))
+        for registration in registrations:
+            registration.created = start + datetime.timedelta(seconds=rnd.randrange(window))
+        PlayerRegistration.objects.bulk_update(registrations, ["created"])
+
+        payments = Payment.objects.bulk_create([
+            self.build_payment(registration, outcome, season.amount)
+            for registration, outcome in zip(registrations, outcomes)
+            if outcome != "NONE"
+        ])
+        return {"users": len(users), "registrations": len(registrations), "payments": len(payments)}
+
+    def build_registration(self, season, user, first_name, last_name, reg_id, paid):
+        rnd = self.random
+        age = max(16, min(45, int(rnd.gauss(24, 5))))
+        district = rnd.choices(DISTRICTS, weights=DISTRICT_SHARES)[0]
+        mobile = f"{rnd.choice('6789')}{rnd.randrange(10 ** 9):09d}"
+        return PlayerRegistration(
+            season=season,
+            reg_id=reg_id,
+            user=user,
+            player_name=f"{first_name} {last_name}",
+            father_name=f"{rnd.choice(FIRST_NAMES)} {last_name}",
+            category="Under 21" if age < 21 else "21 and Above",
+            age=age,
+            dob=datetime.date(timezone.localdate().year - age, rnd.randint(1, 12), rnd.randint(1, 28)),
+            gender=rnd.choices([value for value, _ in GENDERS], weights=[9, 1])[0],
+            occupation=rnd.choices([value for value, _ in OCCUPATION], weights=[5, 2, 1, 2])[0],
+            tshirt_size=rnd.choice([value for value, _ in TSHIRT_SIZES]),
+            mobile=mobile,
+            wathsapp_number=mobile,
+            email=user.email,
+            adhar_card=self.adhar_number(),
+            district=district,
+            zone=DISTRICT_ZONE_MAP[district],
+            pin_code=rnd.randint(600001, 643253),
+            address=f"{rnd.randint(1, 200)}, Main Road, {district}",
+            first_preference=rnd.choice([value for value, _ in FIRST_PREFERENCES]),
+            batting_arm=rnd.choices([value for value, _ in BOWLING_ARMS], weights=[1, 4])[0],
+            role=rnd.choice([value for value, _ in ROLE]),
+            is_compleated=paid,
+            is_mail_sent=paid and rnd.random() < 0.8,
+            is_selected=paid and rnd.random() < 0.1,
+            points=max(0, int(rnd.gauss(50, 20))) if paid else -99,
+        )
+
+    def adhar_number(self):
+        while True:
+            number = f"{self.random.randrange(2, 10)}{self.random.randrange(10 ** 11):011d}"
+            if number not in self.adhar_numbers:
+                self.adhar_numbers.add(number)
+                return number
+
+    def build_payment(self, registration, outcome, amount):
+        token = uuid.uuid4().hex[:14]
+        return Payment(
+            user=registration.user,
+            registration=registration,
+            order_id=f"order_seed{token}",
+            recpt_id=f"seed_{token}",
+            amount=amount,
+            status=outcome,
+            payment_id=f"pay_seed{token}" if outcome == "PAID" else None,
+            is_compleated=outcome == "PAID",
+        )
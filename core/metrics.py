@@ -0,0 +1,369 @@
+"""Per-request and per-job instrumentation.
+
+RequestMetricsMiddleware records, for every request, the number of SQL
+queries and the time spent in the database, in template rendering and in
+external calls (Razorpay, SMTP), keyed by the resolved view name. Each
+request is logged as one JSON line on the 'core.metrics' logger and added to
+a per-process registry that /master/metrics (and, with a bearer token,
+/master/metrics/scrape) exposes in the Prometheus text format. With a shared
+cache (REQUEST_METRICS_CACHE_ALIAS) every process publishes its registry
+there, so a scrape sees all workers.
+
+Views over their REQUEST_BUDGETS entry log a warning with the statements
+that cost the most, grouped so N+1 patterns stand out.
+
+Background jobs are measured the same way by track_job, around every run in
+core.jobs, so SMTP and Razorpay calls made by `manage.py run_jobs` are
+counted per job name. The worker publishes through the shared cache too, so
+its counters only reach /master/metrics when REQUEST_METRICS_CACHE_ALIAS is set.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger('core.metrics')
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_IN_WARNING = 10
+WORKERS_KEY = "core:metrics:workers"
+
+METRICS = {
+    "tspl_requests_total": ("counter", "Requests handled, by view and status class"),
+    "tspl_request_duration_seconds": ("histogram", "Time spent in the view and inner middleware"),
+    "tspl_db_queries_total": ("counter", "SQL queries executed"),
+    "tspl_db_seconds_total": ("counter", "Time spent executing SQL"),
+    "tspl_template_seconds_total": ("counter", "Time spent rendering templates"),
+    "tspl_external_calls_total": ("counter", "Calls to external services"),
+    "tspl_external_seconds_total": ("counter", "Time spent in calls to external services"),
+    "tspl_budget_exceeded_total": ("counter", "Requests over their REQUEST_BUDGETS entry"),
+    "tspl_job_runs_total": ("counter", "Background job runs, by job and outcome"),
+    "tspl_job_seconds_total": ("counter", "Time spent running background jobs"),
+    "tspl_job_db_queries_total": ("counter", "SQL queries executed by background jobs"),
+    "tspl_job_external_calls_total": ("counter", "Calls to external services from background jobs"),
+    "tspl_job_external_seconds_total": ("counter", "Time spent in calls to external services from background jobs"),
+}
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestSample:
+    """What one request or job spent; filled in by the database, template and external-call hooks."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Mail sender threads of one delivery report external calls concurrently
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.external_calls = defaultdict(int)
+        self.external_seconds = defaultdict(float)
+        # sql -> [count, seconds]; statements repeated with different parameters share an entry
+        self.statements = {}
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += elapsed
+            entry = self.statements.get(sql)
+            if entry is None:
+                self.statements[sql] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def costliest_statements(self, limit=SQL_IN_WARNING):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return ranked[:limit]
+
+
+@contextlib.contextmanager
+def external(service):
+    """Time a call to an external service against the current request or job, if any."""
+    sample = _current.get()
+    if sample is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with sample.lock:
+            sample.external_calls[service] += 1
+            sample.external_seconds[service] += elapsed
+
+
+class TimedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return super().render(context, request)
+        # Templates rendered while rendering another one are already counted
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_depth -= 1
+            if not sample.template_depth:
+                sample.template_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The Django template backend, timing each render for the request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class MetricsRegistry:
+    """Prometheus counters for this process, keyed by (metric, labels)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+        self.flushed_at = 0.0
+
+    def add(self, name, labels, value=1):
+        self.values[(name, labels)] += value
+
+    def record(self, view, status, sample, duration, over_budget):
+        labels = (("view", view),)
+        with self.lock:
+            self.add("tspl_requests_total", labels + (("status", f"{status // 100}xx"),))
+            for bucket in DURATION_BUCKETS:
+                if duration <= bucket:
+                    self.add("tspl_request_duration_seconds_bucket", labels + (("le", str(bucket)),))
+            self.add("tspl_request_duration_seconds_bucket", labels + (("le", "+Inf"),))
+            self.add("tspl_request_duration_seconds_sum", labels, duration)
+            self.add("tspl_request_duration_seconds_count", labels)
+            self.add("tspl_db_queries_total", labels, sample.queries)
+            self.add("tspl_db_seconds_total", labels, sample.db_seconds)
+            self.add("tspl_template_seconds_total", labels, sample.template_seconds)
+            for service, calls in sample.external_calls.items():
+                service_labels = labels + (("service", service),)
+                self.add("tspl_external_calls_total", service_labels, calls)
+                self.add("tspl_external_seconds_total", service_labels, sample.external_seconds[service])
+            if over_budget:
+                self.add("tspl_budget_exceeded_total", labels)
+        self.maybe_publish()
+
+    def record_job(self, name, ok, sample, duration):
+        labels = (("job", name),)
+        with self.lock:
+            self.add("tspl_job_runs_total", labels + (("status", "done" if ok else "failed"),))
+            self.add("tspl_job_seconds_total", labels, duration)
+            self.add("tspl_job_db_queries_total", labels, sample.queries)
+            for service, calls in sample.external_calls.items():
+                service_labels = labels + (("service", service),)
+                self.add("tspl_job_external_calls_total", service_labels, calls)
+                self.add("tspl_job_external_seconds_total", service_labels, sample.external_seconds[service])
+        self.maybe_publish()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def maybe_publish(self, force=False):
+        """Copy this process's counters to the shared cache every REQUEST_METRICS_FLUSH_INTERVAL seconds."""
+        cache = _shared_cache()
+        interval = getattr(settings, "REQUEST_METRICS_FLUSH_INTERVAL", 15)
+        if cache is None or (not force and time.monotonic() - self.flushed_at < interval):
+            return
+        self.flushed_at = time.monotonic()
+        from .jobs import worker_id
+
+        key = f"core:metrics:{worker_id()}"
+        try:
+            cache.set(key, self.snapshot(), timeout=interval * 40)
+            workers = cache.get(WORKERS_KEY) or []
+            if key not in workers:
+                cache.set(WORKERS_KEY, [*workers, key], timeout=None)
+        except Exception as e:
+            logger.error(f"Could not publish request metrics: {e}")
+
+
+registry = MetricsRegistry()
+
+
+def _shared_cache():
+    alias = getattr(settings, "REQUEST_METRICS_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+def collect():
+    """The counters of every process that published recently, or of this one without a shared cache."""
+    cache = _shared_cache()
+    if cache is None:
+        return registry.snapshot()
+    registry.maybe_publish(force=True)
+    workers = cache.get(WORKERS_KEY) or []
+    snapshots = cache.get_many(workers)
+    # Workers that stopped publishing drop out of the index
+    if len(snapshots) < len(workers):
+        cache.set(WORKERS_KEY, [key for key in workers if key in snapshots], timeout=None)
+    totals = defaultdict(float)
+    for snapshot in snapshots.values():
+        for key, value in snapshot.items():
+            totals[key] += value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(values):
+    """Format counters as the Prometheus text exposition format."""
+    by_metric = defaultdict(list)
+    for (name, labels), value in values.items():
+        base = name.rsplit("_", 1)[0] if name.endswith(("_bucket", "_sum", "_count")) else name
+        by_metric[base].append((name, labels, value))
+
+    lines = []
+    for base, (kind, description) in METRICS.items():
+        lines.append(f"# HELP {base} {description}")
+        lines.append(f"# TYPE {base} {kind}")
+        for name, labels, value in sorted(by_metric.get(base, []), key=_sample_order):
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _sample_order(sample):
+    name, labels, _ = sample
+    labels = dict(labels)
+    le = labels.pop("le", None)
+    bucket = float("inf") if le == "+Inf" else float(le or 0)
+    return tuple(labels.items()), name, bucket
+
+
+@contextlib.contextmanager
+def track_job(name):
+    """Measure one run of a background job: queries, external calls and duration.
+
+    Threads started inside the job only count towards it when they run in a
+    copy of the caller's context (see core.mailer.deliver).
+    """
+    if not getattr(settings, "REQUEST_METRICS_ENABLED", True):
+        yield
+        return
+
+    sample = RequestSample()
+    token = _current.set(sample)
+    ok = False
+    try:
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sample.execute))
+            yield
+        ok = True
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - sample.started
+        registry.record_job(name, ok, sample, duration)
+        logger.info(json.dumps({
+            "event": "job",
+            "job": name,
+            "status": "done" if ok else "failed",
+            "duration_ms": round(duration * 1000, 1),
+            "queries": sample.queries,
+            "db_ms": round(sample.db_seconds * 1000, 1),
+            "external": {
+                service: {"calls": calls, "ms": round(sample.external_seconds[service] * 1000, 1)}
+                for service, calls in sample.external_calls.items()
+            },
+        }))
+
+
+def get_budget(view):
+    budgets = getattr(settings, "REQUEST_BUDGETS", {})
+    return {**budgets.get("default", {}), **budgets.get(view, {})}
+
+
+def over_budget(budget, measured):
+    return [
+        f"{key} {measured[key]:g} > {limit:g}"
+        for key, limit in budget.items()
+        if key in measured and measured[key] > limit
+    ]
+
+
+class RequestMetricsMiddleware:
+    """Record queries, DB, template and external-call time for every request; see the module docstring.
+
+    Sits last in MIDDLEWARE, so static files served by WhiteNoise are not
+    counted. Streaming responses are measured up to the first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "REQUEST_METRICS_ENABLED", True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        sample = RequestSample()
+        token = _current.set(sample)
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sample.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        duration = time.perf_counter() - sample.started
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        measured = {
+            "duration_ms": round(duration * 1000, 1),
+            "queries": sample.queries,
+            "db_ms": round(sample.db_seconds * 1000, 1),
+            "template_ms": round(sample.template_seconds * 1000, 1),
+            "external_ms": round(sum(sample.external_seconds.values()) * 1000, 1),
+        }
+        violations = over_budget(get_budget(view), measured)
+        registry.record(view, response.status_code, sample, duration, bool(violations))
+
+        logger.info(json.dumps({
+            "event": "request",
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            **measured,
+            "external": {
+                service: {"calls": calls, "ms": round(sample.external_seconds[service] * 1000, 1)}
+                for service, calls in sample.external_calls.items()
+            },
+        }))
+        if violations:
+            statements = "\n".join(
+                f"    {seconds * 1000:8.1f} ms  x{count:<4} {sql}"
+                for sql, (count, seconds) in sample.costliest_statements()
+            )
+            logger.warning(
+                f"Budget exceeded by {view} ({'; '.join(violations)}) on {request.method} {request.path}\n"
+                f"  Costliest SQL:\n{statements}"
+            )
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_playerregistration_is_mail_sent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playerregistration',
+            index=models.Index(fields=['season', 'is_selected', '-points', 'reg_id'], name='reg_season_selected_points'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_playerregistration_results_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_number', models.PositiveIntegerField(default=0, verbose_name='Last Issued Number')),
+                ('season', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reg_sequence', to='core.season', verbose_name='Season')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+def blank_order_ids_to_null(apps, schema_editor):
+    Payment = apps.get_model('core', 'Payment')
+    Payment.objects.filter(order_id='').update(order_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_registrationsequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='order_id',
+            field=models.CharField(blank=True, default=None, max_length=200, null=True, unique=True),
+        ),
+        migrations.RunPython(blank_order_ids_to_null, migrations.RunPython.noop),
+    ]
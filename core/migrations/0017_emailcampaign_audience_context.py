@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:33
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_emailcampaign_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailcampaign',
+            name='audience',
+            field=models.CharField(blank=True, choices=[('', 'Listed Recipients'), ('ALL_USERS', 'All Users With Email')], default='', max_length=30, verbose_name='Audience'),
+        ),
+        migrations.AddField(
+            model_name='emailcampaign',
+            name='context',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_emailcampaign_audience_context'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailcampaign',
+            name='kind',
+            field=models.CharField(choices=[('PAYMENT_REMINDER', 'Payment Reminder'), ('SELECTION_STATUS', 'Selection Status'), ('REGISTRATION_SUCCESS', 'Registration Success'), ('CUSTOM', 'Custom')], max_length=30, verbose_name='Kind'),
+        ),
+    ]
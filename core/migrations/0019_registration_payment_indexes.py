@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+# icontains on PostgreSQL compiles to UPPER(column::text) LIKE UPPER(%s), so the
+# trigram indexes are built on that expression. Other databases have no equivalent.
+TRIGRAM_INDEXES = {
+    'reg_reg_id_trgm': 'reg_id',
+    'reg_player_name_trgm': 'player_name',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON core_playerregistration '
+            f'USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_alter_emailcampaign_kind'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['registration', 'user', '-created_at'], name='payment_reg_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='playerregistration',
+            index=models.Index(fields=['user', 'season'], name='reg_user_season'),
+        ),
+        migrations.AddIndex(
+            model_name='playerregistration',
+            index=models.Index(fields=['season', 'is_compleated', 'is_mail_sent', '-created'], name='reg_season_completed_mail'),
+        ),
+        migrations.AddIndex(
+            model_name='playerregistration',
+            index=models.Index(fields=['season', '-created'], name='reg_season_created'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
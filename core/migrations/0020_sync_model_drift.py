@@ -0,0 +1,89 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:00
+
+"""Model changes that were made without a committed migration.
+
+Older deployments generated these on start (entrypoint.sh ran makemigrations),
+so an existing database may already have some or all of the columns. The
+column operations below check the table first and only touch what is missing
+or still there, so the migration runs unchanged on fresh and drifted schemas.
+"""
+
+from django.db import migrations, models
+
+
+def _has_column(schema_editor, model, name):
+    column = model._meta.get_field(name).column
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        description = connection.introspection.get_table_description(cursor, model._meta.db_table)
+    return any(info.name == column for info in description)
+
+
+class AddFieldIfMissing(migrations.AddField):
+    """AddField that leaves an existing column alone."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not _has_column(schema_editor, model, self.name):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if _has_column(schema_editor, model, self.name):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class RemoveFieldIfPresent(migrations.RemoveField):
+    """RemoveField that skips a column that is already gone."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if _has_column(schema_editor, model, self.name):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not _has_column(schema_editor, model, self.name):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_registration_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='payment',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='season',
+            options={'ordering': ['-id']},
+        ),
+        RemoveFieldIfPresent(
+            model_name='playerregistration',
+            name='is_paid',
+        ),
+        AddFieldIfMissing(
+            model_name='generalsettings',
+            name='alert_message',
+            field=models.TextField(blank=True, default='Welcome', null=True, verbose_name='Alert Message'),
+        ),
+        AddFieldIfMissing(
+            model_name='generalsettings',
+            name='points_table_url',
+            field=models.URLField(default='', max_length=500, verbose_name='Points Table URL'),
+        ),
+        AddFieldIfMissing(
+            model_name='playerregistration',
+            name='social_media_link',
+            field=models.CharField(default='', max_length=255, verbose_name='Social Media Profile'),
+        ),
+        migrations.AlterField(
+            model_name='generalsettings',
+            name='show_points_table',
+            field=models.BooleanField(default=False, verbose_name='Show Points Table to Public'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_sync_model_drift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailcampaign',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='emailcampaign',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'QUEUED'), ('SENDING', 'SENDING'), ('PAUSED', 'PAUSED'), ('DONE', 'DONE')], default='QUEUED', max_length=20),
+        ),
+    ]
@@ -1,4 +1,10 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+import datetime
+import re
 import uuid
 from .constants import *
 from django.contrib.auth.models import User
@@ -100,6 +106,22 @@ class PlayerRegistration(models.Model):
                 name='unique_adhar_per_season'
             ),
         ]
+        indexes = [
+            # Public results listing: filter on season + is_selected, ordered by points
+            models.Index(
+                fields=['season', 'is_selected', '-points', 'reg_id'],
+                name='reg_season_selected_points',
+            ),
+            # The player's own registration (register form, player result)
+            models.Index(fields=['user', 'season'], name='reg_user_season'),
+            # Admin mail listings: completed / mail sent filters, newest first
+            models.Index(
+                fields=['season', 'is_compleated', 'is_mail_sent', '-created'],
+                name='reg_season_completed_mail',
+            ),
+            models.Index(fields=['season', '-created'], name='reg_season_created'),
+            # reg_id / player_name icontains searches use trigram indexes on PostgreSQL (migration 0019)
+        ]
 
     def save(self, *args, **kwargs):
         self.zone = DISTRICT_ZONE_MAP.get(self.district, 'Unknown')
@@ -117,7 +139,8 @@ class Payment(models.Model):
     )
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
     registration = models.ForeignKey(PlayerRegistration, on_delete=models.CASCADE, verbose_name="Player Registration")
-    order_id = models.CharField(max_length=200, blank=True, unique=True)
+    # NULL until the gateway order exists, so pending rows don't collide on the unique index
+    order_id = models.CharField(max_length=200, blank=True, null=True, default=None, unique=True)
     recpt_id = models.CharField(max_length=200, blank=True, unique=True)
     currency = models.CharField(max_length=10, default="INR")
     amount = models.IntegerField(default=0)
@@ -132,9 +155,174 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-id']
+        indexes = [
+            # Latest payment of a registration
+            models.Index(fields=['registration', 'user', '-created_at'], name='payment_reg_user_created'),
+        ]
+
+    def __str__(self):
+        return self.order_id or self.recpt_id
+
+
+class WebhookEvent(models.Model):
+    """Razorpay webhook delivery, stored once per event id and applied in batches."""
+    STATUS_CHOICES = (
+        ("PENDING", "PENDING"),
+        ("PROCESSED", "PROCESSED"),
+        ("IGNORED", "IGNORED"),
+        ("FAILED", "FAILED"),
+    )
+    event_id = models.CharField(max_length=100, unique=True, verbose_name="Event ID")
+    event = models.CharField(max_length=100, verbose_name="Event Type")
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_status_id'),
+        ]
 
     def __str__(self):
-        return self.order_id
+        return f"{self.event} ({self.event_id})"
+
+
+class BackgroundJob(models.Model):
+    """A unit of background work, executed by `manage.py run_jobs` (see core.jobs)."""
+    STATUS_CHOICES = (
+        ("QUEUED", "QUEUED"),
+        ("RUNNING", "RUNNING"),
+        ("DONE", "DONE"),
+        ("FAILED", "FAILED"),
+    )
+    queue = models.CharField(max_length=50, default="common", verbose_name="Queue")
+    name = models.CharField(max_length=255, verbose_name="Job")
+    args = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="QUEUED")
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Run After")
+
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, default="")
+
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['queue', 'status', 'run_after'], name='job_queue_status_run_after'),
+        ]
+
+    def get_short_name(self):
+        return self.name.rsplit(".", 1)[-1]
+
+    def get_percent(self):
+        if not self.total:
+            return 100 if self.status == "DONE" else 0
+        return min(100, round(self.progress * 100 / self.total))
+
+    def __str__(self):
+        return f"{self.get_short_name()} #{self.id} ({self.status})"
+
+
+class EmailCampaign(models.Model):
+    """One bulk mail send; its recipients live in OutboxEmail (see core.outbox)."""
+    KIND_CHOICES = (
+        ("PAYMENT_REMINDER", "Payment Reminder"),
+        ("SELECTION_STATUS", "Selection Status"),
+        ("REGISTRATION_SUCCESS", "Registration Success"),
+        ("CUSTOM", "Custom"),
+    )
+    STATUS_CHOICES = (
+        ("QUEUED", "QUEUED"),
+        ("SENDING", "SENDING"),
+        # Stopped by an SMTP authentication failure; resumed from appcontrol
+        ("PAUSED", "PAUSED"),
+        ("DONE", "DONE"),
+    )
+    # Recipients are either stored when the campaign is created, or selected by the send job
+    AUDIENCE_CHOICES = (
+        ("", "Listed Recipients"),
+        ("ALL_USERS", "All Users With Email"),
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name="Kind")
+    audience = models.CharField(max_length=30, choices=AUDIENCE_CHOICES, blank=True, default="", verbose_name="Audience")
+    subject = models.CharField(max_length=255, verbose_name="Subject")
+    template_name = models.CharField(max_length=255, blank=True, default="", verbose_name="Template Name")
+    html_template = models.TextField(blank=True, default="", verbose_name="HTML Template")
+    text_template = models.TextField(blank=True, default="", verbose_name="Text Template")
+    # Template variables shared by every recipient; each OutboxEmail.context is merged over it
+    context = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="QUEUED")
+    error = models.TextField(blank=True, default="")
+
+    total = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    job = models.ForeignKey(BackgroundJob, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Job")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def get_pending(self):
+        return max(0, self.total - self.sent - self.failed)
+
+    def get_percent(self):
+        if not self.total:
+            return 100 if self.status == "DONE" else 0
+        return min(100, round((self.sent + self.failed) * 100 / self.total))
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} - {self.subject}"
+
+
+class OutboxEmail(models.Model):
+    """One recipient of an EmailCampaign and its delivery state."""
+    STATUS_CHOICES = (
+        ("PENDING", "PENDING"),
+        ("SENDING", "SENDING"),
+        ("SENT", "SENT"),
+        ("FAILED", "FAILED"),
+    )
+    campaign = models.ForeignKey(EmailCampaign, on_delete=models.CASCADE, related_name="emails", verbose_name="Campaign")
+    to_email = models.CharField(max_length=254, verbose_name="To")
+    context = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # Overrides the campaign template, e.g. selected / not selected mails
+    template_name = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    claimed_by = models.CharField(max_length=100, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'id'], name='outbox_campaign_status_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} ({self.status})"
 
 
 class GeneralSettings(models.Model):
@@ -158,11 +346,92 @@ class GeneralSettings(models.Model):
         
     def __str__(self):
         return f"General Settings"
+
+
+def format_reg_id(number, date=None):
+    date = date or datetime.datetime.now()
+    return f"TSPL{date.strftime('%m')}{date.strftime('%y')}{number:04d}"
+
+
+REG_ID_NUMBER = re.compile(r"^TSPL\d{4}(\d+)$")
+# Taken numbers are only skipped when an import bypassed reserve_through; give up well before looping for long
+REG_ID_ALLOCATION_ATTEMPTS = 100
+
+
+def highest_reg_number(season):
+    """The largest counter number in the season's reg_ids, whichever month/year prefix they carry."""
+    reg_ids = (
+        PlayerRegistration.objects.filter(season=season, reg_id__startswith="TSPL")
+        .values_list("reg_id", flat=True)
+        .iterator(chunk_size=5000)
+    )
+    highest = 0
+    for reg_id in reg_ids:
+        match = REG_ID_NUMBER.match(reg_id)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+class RegistrationSequence(models.Model):
+    """Per-season counter that hands out reg_id numbers without counting rows."""
+    season = models.OneToOneField(Season, on_delete=models.CASCADE, related_name="reg_sequence", verbose_name="Season")
+    last_number = models.PositiveIntegerField(default=0, verbose_name="Last Issued Number")
+
+    def __str__(self):
+        return f"{self.season} - {self.last_number}"
+
+    @classmethod
+    def allocate(cls, season, count=1):
+        """Atomically reserve `count` consecutive numbers for the season and return the first one.
+
+        The UPDATE takes the row lock, so concurrent callers are serialised on the
+        counter row instead of racing on the unique reg_id constraint.
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(season=season).update(last_number=F("last_number") + count)
+            if not updated:
+                # First allocation for this season, start after the highest number already used
+                seed = highest_reg_number(season)
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(season=season, last_number=seed + count)
+                except IntegrityError:
+                    cls.objects.filter(season=season).update(last_number=F("last_number") + count)
+            last_number = cls.objects.filter(season=season).values_list("last_number", flat=True).get()
+        return last_number - count + 1
+
+    @classmethod
+    def allocate_reg_ids(cls, season, count):
+        """Pre-allocate a block of reg_ids, e.g. for bulk imports."""
+        if count <= 0:
+            return []
+        first = cls.allocate(season, count)
+        now = datetime.datetime.now()
+        return [format_reg_id(number, now) for number in range(first, first + count)]
+
+    @classmethod
+    def reserve_through(cls, season, number):
+        """Make sure future allocations start after `number` (after imports with explicit reg_ids)."""
+        updated = cls.objects.filter(season=season).update(last_number=Greatest(F("last_number"), number))
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(season=season, last_number=number)
+            except IntegrityError:
+                cls.objects.filter(season=season).update(last_number=Greatest(F("last_number"), number))
+
     
 # Signals
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-import datetime
+
+@receiver([post_save, post_delete], sender=GeneralSettings)
+@receiver([post_save, post_delete], sender=Season)
+def invalidate_general_settings_cache(sender, instance, **kwargs):
+    # Settings are cached together with current_season, so season edits invalidate too
+    from .utils import invalidate_general_settings
+    transaction.on_commit(invalidate_general_settings)
 
 @receiver(pre_save, sender=PlayerRegistration)
 def generate_user_id(sender, instance, **kwargs):
@@ -176,10 +445,13 @@ def generate_user_id(sender, instance, **kwargs):
         except Exception as e:
             logger.error(f"Error fetching last registration: {e}")
             
-        current_date = datetime.datetime.now()
-        month = current_date.strftime('%m')
-        year = current_date.strftime('%y')
-
-        last_number = sender.objects.filter(season=instance.season).count()
-        new_number = last_number + 1  # sequential number
-        instance.reg_id = f"TSPL{month}{year}{new_number:04d}"
+        # Numbers come from the per-season counter; skip any that were taken by an import
+        for _ in range(REG_ID_ALLOCATION_ATTEMPTS):
+            reg_id = format_reg_id(RegistrationSequence.allocate(instance.season))
+            if not sender.objects.filter(season=instance.season, reg_id=reg_id).exists():
+                instance.reg_id = reg_id
+                return
+        raise RuntimeError(
+            f"No free reg_id for season {instance.season_id} after {REG_ID_ALLOCATION_ATTEMPTS} attempts; "
+            "move its counter past the imported ids with RegistrationSequence.reserve_through"
+        )
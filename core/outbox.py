@@ -0,0 +1,296 @@
+"""Persistent outbox for bulk mail.
+
+Every recipient of an EmailCampaign is an OutboxEmail row. Senders claim
+rows in chunks, deliver them through core.mailer and record the outcome per
+row, so a campaign interrupted by a restart resumes where it stopped and
+the admin can see exactly who got the mail.
+"""
+import datetime
+import itertools
+import logging
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import mailer
+from .jobs import worker_id
+from .models import EmailCampaign, OutboxEmail, PlayerRegistration
+from .rendering import BulkRenderer, RenderError
+
+logger = logging.getLogger('core')
+
+DEFAULT_TEXT = "You have a new notification."
+
+
+def create_campaign(kind, subject, recipients, template_name="", html_template="", text_template="",
+                    audience="", context=None):
+    """Store a campaign and one outbox row per recipient.
+
+    `recipients` is an iterable of dicts with to_email, context and an
+    optional template_name overriding the campaign template. Campaigns with
+    an `audience` start without rows; send_campaign selects them.
+    """
+    with transaction.atomic():
+        campaign = EmailCampaign.objects.create(
+            kind=kind,
+            subject=subject,
+            template_name=template_name,
+            html_template=html_template,
+            text_template=text_template,
+            audience=audience,
+            context=context or {},
+        )
+        total = add_recipients(campaign, recipients)
+    logger.info(f"Campaign {campaign.id} created with {total} recipients")
+    return campaign
+
+
+def add_recipients(campaign, recipients):
+    """Insert outbox rows for `recipients` in batches, consuming the iterable lazily; returns how many."""
+    batch_size = settings.EMAIL_OUTBOX_INSERT_BATCH
+    recipients = iter(recipients)
+    total = 0
+    with transaction.atomic():
+        while True:
+            batch = list(itertools.islice(recipients, batch_size))
+            if not batch:
+                break
+            OutboxEmail.objects.bulk_create([
+                OutboxEmail(
+                    campaign=campaign,
+                    to_email=recipient["to_email"],
+                    context=recipient.get("context") or {},
+                    template_name=recipient.get("template_name", ""),
+                )
+                for recipient in batch
+            ])
+            total += len(batch)
+        if total:
+            EmailCampaign.objects.filter(id=campaign.id).update(total=F("total") + total)
+            campaign.total += total
+    return total
+
+
+def all_user_recipients():
+    """Every user with an email address, streamed from the database in chunks."""
+    users = (
+        User.objects.exclude(email__isnull=True).exclude(email="")
+        .order_by("id")
+        .values_list("username", "first_name", "last_name", "email")
+        .iterator(chunk_size=2000)
+    )
+    for username, first_name, last_name, email in users:
+        yield {
+            "to_email": email,
+            "context": {"username": username, "first_name": first_name, "last_name": last_name, "email": email},
+        }
+
+
+AUDIENCES = {
+    "ALL_USERS": all_user_recipients,
+}
+
+
+def select_audience(campaign_id):
+    """Store the outbox rows of an audience campaign, once."""
+    with transaction.atomic():
+        campaign = EmailCampaign.objects.select_for_update().get(id=campaign_id)
+        if not campaign.audience or campaign.emails.exists():
+            return 0
+        total = add_recipients(campaign, AUDIENCES[campaign.audience]())
+    logger.info(f"Campaign {campaign_id}: selected {total} recipients ({campaign.get_audience_display()})")
+    return total
+
+
+def _claimable():
+    # SENDING rows whose claim is older than the timeout belong to a worker that died mid-chunk
+    stale = timezone.now() - datetime.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+    return Q(status="PENDING") | Q(status="SENDING", claimed_at__lt=stale)
+
+
+def claim_outbox(campaign_id, limit, claimer):
+    """Mark up to `limit` unsent rows of the campaign as SENDING for `claimer`.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where supported. Elsewhere (SQLite)
+    the conditional UPDATE does the arbitration: a row another sender claimed
+    in the meantime no longer matches and is left out.
+    """
+    candidates = OutboxEmail.objects.filter(campaign_id=campaign_id).filter(_claimable()).order_by("id")
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        OutboxEmail.objects.filter(id__in=ids).filter(_claimable()).update(
+            status="SENDING",
+            claimed_by=claimer,
+            claimed_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+    return list(OutboxEmail.objects.filter(id__in=ids, claimed_by=claimer, status="SENDING"))
+
+
+def mark_registration_mail_sent(rows):
+    PlayerRegistration.objects.filter(
+        id__in=[row.context["registration_id"] for row in rows if "registration_id" in row.context]
+    ).update(is_mail_sent=True)
+
+
+# Per-kind follow-up for delivered rows, run in the transaction that marks them SENT
+ON_SENT = {
+    "REGISTRATION_SUCCESS": mark_registration_mail_sent,
+}
+
+
+def _record_outcomes(campaign, outcomes):
+    sent = []
+    failures = []
+    for item, error in outcomes:
+        row = item[0]
+        if error is None:
+            sent.append(row)
+        else:
+            row.status = "FAILED"
+            row.last_error = str(error)[:1000]
+            failures.append(row)
+
+    now = timezone.now()
+    with transaction.atomic():
+        if sent:
+            OutboxEmail.objects.filter(id__in=[row.id for row in sent]).update(status="SENT", sent_at=now, last_error="")
+            if campaign.kind in ON_SENT:
+                ON_SENT[campaign.kind](sent)
+        if failures:
+            OutboxEmail.objects.bulk_update(failures, ["status", "last_error"])
+        EmailCampaign.objects.filter(id=campaign.id).update(
+            sent=F("sent") + len(sent),
+            failed=F("failed") + len(failures),
+        )
+
+
+def pause_campaign(campaign_id, claimer, error):
+    """Stop the campaign after an SMTP auth failure and put this sender's unsent rows back.
+
+    The claim counted an attempt for each row; it is given back, since the
+    recipients were never tried.
+    """
+    released = OutboxEmail.objects.filter(campaign_id=campaign_id, claimed_by=claimer, status="SENDING").update(
+        status="PENDING", claimed_by="", claimed_at=None, attempts=F("attempts") - 1,
+    )
+    EmailCampaign.objects.filter(id=campaign_id).update(status="PAUSED", error=str(error)[:1000])
+    logger.error(f"Campaign {campaign_id} paused, {released} emails left pending: {error}")
+
+
+class CampaignSender:
+    """Delivers one campaign chunk by chunk; templates are compiled once per run."""
+
+    def __init__(self, campaign):
+        self.campaign = campaign
+        self.claimer = f"{worker_id()}:{uuid.uuid4().hex[:8]}"
+        self.renderers = {}
+        self.text_renderer = BulkRenderer.from_string(campaign.text_template) if campaign.text_template else None
+
+    def get_renderer(self, template_name):
+        template_name = template_name or self.campaign.template_name
+        if template_name not in self.renderers:
+            if template_name:
+                self.renderers[template_name] = BulkRenderer.from_name(template_name)
+            else:
+                self.renderers[template_name] = BulkRenderer.from_string(self.campaign.html_template)
+        return self.renderers[template_name]
+
+    def render(self, rows):
+        """Yield (row, html) pairs, streaming each template group through its renderer."""
+        groups = defaultdict(list)
+        for row in rows:
+            groups[row.template_name or self.campaign.template_name].append(row)
+        for template_name, group in groups.items():
+            renderer = self.get_renderer(template_name)
+            yield from zip(group, renderer.stream(self.context(row) for row in group))
+
+    def context(self, row):
+        return {**self.campaign.context, **row.context}
+
+    def build_message(self, item):
+        row, html = item
+        if isinstance(html, RenderError):
+            raise ValueError(f"Template rendering failed: {html}")
+        text = self.text_renderer.render(self.context(row)) if self.text_renderer else DEFAULT_TEXT
+        message = EmailMultiAlternatives(self.campaign.subject, text, settings.EMAIL_HOST_USER, [row.to_email])
+        message.attach_alternative(html, "text/html")
+        return message
+
+    def render_stats(self):
+        stats = defaultdict(int)
+        for renderer in self.renderers.values():
+            for key, value in renderer.stats().items():
+                stats[key] += value
+        stats["render_seconds"] = round(stats["render_seconds"], 2)
+        return dict(stats)
+
+    def run(self, on_progress=None):
+        campaign = self.campaign
+        EmailCampaign.objects.filter(id=campaign.id, started_at__isnull=True).update(started_at=timezone.now())
+        EmailCampaign.objects.filter(id=campaign.id).exclude(status="DONE").update(status="SENDING", error="")
+
+        sent = failed = 0
+        while True:
+            rows = claim_outbox(campaign.id, settings.EMAIL_OUTBOX_CLAIM_SIZE, self.claimer)
+            if not rows:
+                break
+            # Outcomes are written as they arrive, so a crash leaves at most a
+            # moment's worth of sent mail unrecorded
+            report = mailer.deliver(
+                self.render(rows), self.build_message,
+                on_outcomes=lambda outcomes: _record_outcomes(campaign, outcomes),
+            )
+            sent += report.sent
+            failed += report.failed
+            if report.aborted is not None:
+                pause_campaign(campaign.id, self.claimer, report.aborted)
+                return {"campaign": campaign.id, "sent": sent, "failed": failed, "paused": str(report.aborted)}
+            logger.info(f"Campaign {campaign.id}: chunk of {len(rows)} done, {report}")
+            if on_progress is not None:
+                campaign.refresh_from_db(fields=["sent", "failed", "total"])
+                on_progress(campaign.sent + campaign.failed, campaign.total)
+
+        finish_campaign(campaign.id)
+        return {"campaign": campaign.id, "sent": sent, "failed": failed, **self.render_stats()}
+
+
+def finish_campaign(campaign_id):
+    """Recount the campaign from its rows and mark it done once nothing is left to send."""
+    counts = dict(
+        OutboxEmail.objects.filter(campaign_id=campaign_id)
+        .order_by()
+        .values("status")
+        .annotate(count=Count("id"))
+        .values_list("status", "count")
+    )
+    values = {"sent": counts.get("SENT", 0), "failed": counts.get("FAILED", 0)}
+    # Rows still claimed by another sender are finished by that sender
+    if not counts.get("PENDING") and not counts.get("SENDING"):
+        values.update(status="DONE", finished_at=timezone.now())
+    EmailCampaign.objects.filter(id=campaign_id).update(**values)
+
+
+def retry_failed(campaign_id):
+    """Put the campaign's failed rows back in the queue; returns how many."""
+    count = OutboxEmail.objects.filter(campaign_id=campaign_id, status="FAILED").update(status="PENDING")
+    if count:
+        EmailCampaign.objects.filter(id=campaign_id).update(status="QUEUED", failed=F("failed") - count, finished_at=None)
+    return count
+
+
+def send_campaign(campaign_id, on_progress=None):
+    select_audience(campaign_id)
+    campaign = EmailCampaign.objects.get(id=campaign_id)
+    logger.info(f"Sending campaign {campaign.id} ({campaign.get_kind_display()}), {campaign.get_pending()} pending")
+    return CampaignSender(campaign).run(on_progress)
@@ -1,73 +1,257 @@
 import time
+import uuid
+import random
 import logging
+import datetime
+import hmac
+import hashlib
 
 import razorpay
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.db import transaction, connection
+from django.utils import timezone
 
-from .models import Payment, PlayerRegistration
+from . import metrics
+from .models import Payment, PlayerRegistration, WebhookEvent
 
 logger = logging.getLogger('core')
 
 
+# Gateway HTTP tuning, overridable from settings
+RAZORPAY_TIMEOUT = (
+	getattr(settings, "RAZORPAY_CONNECT_TIMEOUT", 3.05),
+	getattr(settings, "RAZORPAY_READ_TIMEOUT", 10),
+)
+RAZORPAY_POOL_SIZE = getattr(settings, "RAZORPAY_POOL_SIZE", 10)
+RAZORPAY_MAX_RETRIES = getattr(settings, "RAZORPAY_MAX_RETRIES", 3)
+RAZORPAY_BACKOFF = getattr(settings, "RAZORPAY_BACKOFF", 0.3)
+
+# How long an unpaid order is handed back instead of creating a new one
+PAYMENT_REUSE_WINDOW = getattr(settings, "PAYMENT_REUSE_WINDOW", 6 * 60 * 60)
+
+WEBHOOK_BATCH_SIZE = getattr(settings, "RAZORPAY_WEBHOOK_BATCH_SIZE", 100)
+RECONCILE_PAGE_SIZE = 100  # Razorpay's maximum page size for list endpoints
+
+
+class GatewaySession(requests.Session):
+	"""requests session that applies a default (connect, read) timeout to every call."""
+
+	def __init__(self, timeout):
+		super().__init__()
+		self.timeout = timeout
+
+	def request(self, method, url, **kwargs):
+		kwargs.setdefault("timeout", self.timeout)
+		with metrics.external("razorpay"):
+			return super().request(method, url, **kwargs)
+
+
+def build_gateway_session():
+	"""Session with a pooled adapter; only idempotent GETs are retried by urllib3."""
+	session = GatewaySession(RAZORPAY_TIMEOUT)
+	retry = Retry(
+		total=RAZORPAY_MAX_RETRIES,
+		connect=RAZORPAY_MAX_RETRIES,
+		read=RAZORPAY_MAX_RETRIES,
+		status=RAZORPAY_MAX_RETRIES,
+		backoff_factor=RAZORPAY_BACKOFF,
+		backoff_jitter=RAZORPAY_BACKOFF,
+		status_forcelist=(429, 500, 502, 503, 504),
+		allowed_methods=frozenset({"GET"}),
+		raise_on_status=False,
+	)
+	adapter = HTTPAdapter(
+		pool_connections=RAZORPAY_POOL_SIZE,
+		pool_maxsize=RAZORPAY_POOL_SIZE,
+		max_retries=retry,
+	)
+	session.mount("https://", adapter)
+	session.mount("http://", adapter)
+	return session
+
+
+def build_client():
+	options = {}
+	if getattr(settings, "RAZORPAY_BASE_URL", None):
+		# Points the client at a local fake gateway for tests and benchmarks
+		options["base_url"] = settings.RAZORPAY_BASE_URL
+	return razorpay.Client(
+		session=build_gateway_session(),
+		auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+		**options,
+	)
+
+
 # Initialize Razorpay client once for the module
 try:
-	client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
+	client = build_client()
 	logger.info("Razorpay client initialized")
 except Exception as e:
 	client = None
 	logger.exception("Failed to initialize Razorpay client: %s", e)
 
 
-def create_payment_for_registration(user, registration, amount):
+def _backoff_delay(attempt):
+	"""Exponential backoff with full jitter, capped at 5s."""
+	return random.uniform(0, min(5.0, RAZORPAY_BACKOFF * (2 ** attempt)))
+
+
+def _find_order_by_receipt(receipt):
+	"""Look up an order we may already have created (GET, so safe to retry)."""
+	orders = client.order.all({"receipt": receipt})
+	items = orders.get("items") or []
+	return items[0] if items else None
+
+
+def _create_order(payment):
+	"""Create the Razorpay order for the payment.
+
+	Order creation is not idempotent on the gateway side, so after a network
+	failure the receipt is looked up first and the POST only repeated when no
+	order exists for it.
+	"""
+	data = {
+		"amount": payment.amount * 100,
+		"currency": payment.currency,
+		"receipt": payment.recpt_id,
+		"payment_capture": 1,
+	}
+	for attempt in range(RAZORPAY_MAX_RETRIES + 1):
+		try:
+			return client.order.create(data)
+		except (requests.ConnectionError, requests.Timeout) as e:
+			if attempt >= RAZORPAY_MAX_RETRIES:
+				raise
+			logger.warning("Razorpay order create failed (attempt %s): %s", attempt + 1, e)
+			time.sleep(_backoff_delay(attempt))
+			existing = _find_order_by_receipt(payment.recpt_id)
+			if existing:
+				return existing
+
+
+def create_remote_order(payment):
+	"""Create the gateway order for an existing PENDING payment row.
+
+	Call this outside any transaction: no row lock is held while the gateway
+	responds. The order id is attached with a conditional UPDATE, so when a
+	resubmission and the background job race, the first order id stays on the
+	row and the other caller picks it up; the extra gateway order is never
+	paid and expires on Razorpay's side.
+
+	Returns (payment, None) on success or (None, error_message) on failure.
+	"""
+	if client is None:
+		return None, "Payment gateway is not configured."
+	if payment.order_id:
+		return payment, None
+	if payment.status != "PENDING":
+		return None, "Payment is no longer pending."
+
+	try:
+		razorpay_order = _create_order(payment)
+	except Exception as e:
+		logger.exception("Failed to create Razorpay order: %s", e)
+		if Payment.objects.filter(pk=payment.pk, order_id__isnull=True, status="PENDING").update(status="FAILED"):
+			payment.status = "FAILED"
+			return None, str(e)
+		# Another caller attached an order (or settled the row) meanwhile
+		_reload_order_state(payment)
+		return (payment, None) if payment.order_id else (None, str(e))
+
+	order_id = razorpay_order.get('id')
+	if Payment.objects.filter(pk=payment.pk, order_id__isnull=True).update(order_id=order_id):
+		payment.order_id = order_id
+	else:
+		_reload_order_state(payment)
+		logger.info("Payment %s already has order %s, dropping %s", payment.pk, payment.order_id, order_id)
+	return payment, None
+
+
+def _reload_order_state(payment):
+	# Keep the caller's instance (and its cached registration) in step with the row
+	payment.order_id, payment.status = Payment.objects.filter(pk=payment.pk).values_list("order_id", "status").get()
+
+
+def create_payment_for_registration(user, registration, amount, defer=False):
 	"""Create a Payment DB record and corresponding Razorpay order.
 
+	With defer=True the order is created in the background after the payment
+	row is committed; the payment page polls for the order id.
+
 	Returns (payment, None) on success or (None, error_message) on failure.
 	"""
 	if client is None:
 		return None, "Payment gateway is not configured."
 
-	payment = Payment.objects.create(
+	payment = _new_payment_row(user, registration, amount)
+
+	if defer:
+		from .task import submit_order_creation
+		transaction.on_commit(lambda: submit_order_creation(payment.id))
+		return payment, None
+
+	return create_remote_order(payment)
+
+
+def _new_payment_row(user, registration, amount):
+	order_receipt = f"rcpt_{user.id}_{uuid.uuid4().hex}"[:40]
+	return Payment.objects.create(
 		user=user,
 		registration=registration,
 		amount=int(amount),
 		status="PENDING",
+		recpt_id=order_receipt,
 	)
 
-	order_receipt = f"rcpt_{user.id}_{payment.id}_{int(time.time())}"[:40]
-	payment.recpt_id = order_receipt
 
-	try:
-		razorpay_order = client.order.create({
-			"amount": payment.amount * 100,
-			"currency": payment.currency,
-			"receipt": order_receipt,
-			"payment_capture": 1,
-		})
-	except Exception as e:
-		logger.exception("Failed to create Razorpay order: %s", e)
-		payment.status = "FAILED"
-		payment.save()
-		return None, str(e)
+def _find_pending_payment(user, registration, amount):
+	"""Latest PENDING payment for the same registration and amount that is still inside the reuse window."""
+	window = timezone.now() - datetime.timedelta(seconds=PAYMENT_REUSE_WINDOW)
+	return Payment.objects.filter(
+		user=user,
+		registration=registration,
+		amount=int(amount),
+		status="PENDING",
+		is_compleated=False,
+		created_at__gte=window,
+	).order_by("-id").first()
 
-	payment.order_id = razorpay_order.get('id')
-	payment.save()
-	return payment, None
 
+def get_or_create_pending_payment(user, registration, amount, defer=False):
+	"""Return a still-valid PENDING payment for (registration, amount, season) or create a new one.
 
-def get_or_create_pending_payment(user, registration, amount_cents):
-	"""Return an existing pending payment for (user, registration) or create a new one.
+	Form resubmissions and page refreshes land here, so reusing the open order
+	keeps them from creating a new Payment row and gateway order every time.
 
 	Returns (payment, None) or (None, error_message).
 	"""
-	try:
-		payment = Payment.objects.get(user=user, registration=registration)
-		# If payment exists and is not completed, return it
-		if not payment.is_compleated:
-			return payment, None
-		# If already completed, return it as-is (caller can decide next steps)
+	if client is None:
+		return None, "Payment gateway is not configured."
+
+	# Lock only long enough to reserve the row; the gateway call happens after the commit
+	with transaction.atomic():
+		# Serialise concurrent submissions for the same registration
+		list(PlayerRegistration.objects.select_for_update().filter(pk=registration.pk).values_list("pk", flat=True))
+		payment = _find_pending_payment(user, registration, amount)
+		created = payment is None
+		if created:
+			payment = _new_payment_row(user, registration, amount)
+
+	if payment.order_id:
+		logger.info("Reusing pending payment %s for registration %s", payment.id, registration.pk)
+		return payment, None
+
+	if defer:
+		# A reused row without an order id is already being created in the background
+		if created:
+			from .task import submit_order_creation
+			submit_order_creation(payment.id)
 		return payment, None
-	except Payment.DoesNotExist:
-		return create_payment_for_registration(user, registration, amount_cents)
+
+	return create_remote_order(payment)
 
 
 def verify_payment_signature_and_fetch(payment_id, order_id, signature):
@@ -100,22 +284,176 @@ def verify_payment_signature_and_fetch(payment_id, order_id, signature):
 
 
 def handle_successful_capture(payment_obj, payment_details):
-	"""Mark payment and registration as completed and return the registration."""
-	# update payment record
+	"""Move the payment to PAID and complete its registration, at most once.
+
+	The browser callback and the webhook / reconcile path can see the same
+	capture; the conditional UPDATE lets only one of them through, and only
+	that one queues the success mail. Returns (registration, completed) where
+	completed is False when the payment was already PAID.
+	"""
 	payment_obj.payment_id = payment_details.get('id') or payment_obj.payment_id
 	payment_obj.signature = payment_obj.signature or ''
 	payment_obj.is_compleated = True
 	payment_obj.status = "PAID"
-	payment_obj.save()
-
-	# update registration
 	registration = payment_obj.registration
 	registration.is_compleated = True
 	registration.tx_id = payment_obj.payment_id
-	registration.save()
 
-	return registration
+	with transaction.atomic():
+		completed = Payment.objects.filter(pk=payment_obj.pk).exclude(status="PAID").update(
+			status="PAID",
+			is_compleated=True,
+			payment_id=payment_obj.payment_id,
+			signature=payment_obj.signature,
+		)
+		if completed:
+			PlayerRegistration.objects.filter(pk=registration.pk).update(is_compleated=True, tx_id=registration.tx_id)
+			_send_capture_mail(payment_obj, registration)
+	return registration, bool(completed)
+
 
+def handle_failed_capture(payment_obj):
+	"""Mark the payment FAILED unless it has been completed meanwhile."""
+	if Payment.objects.filter(pk=payment_obj.pk, is_compleated=False).update(status="FAILED"):
+		payment_obj.status = "FAILED"
 
 
+def _send_capture_mail(payment_obj, registration):
+	"""Queue the success mail once the PAID transition commits."""
+	from .task import send_success_email
+	from .utils import get_general_settings
+
+	if registration.is_mail_sent:
+		return
+	context = {
+		"id": payment_obj.payment_id,
+		"reg_id": registration.reg_id,
+		"order_id": payment_obj.order_id,
+		"amount": payment_obj.amount,
+		"zone": registration.zone,
+		"settings": get_general_settings(),
+	}
+	to = registration.user.email
+	transaction.on_commit(lambda: send_success_email(subject="Registration Completed", to=to, context=context))
+	PlayerRegistration.objects.filter(pk=registration.pk).update(is_mail_sent=True)
+	registration.is_mail_sent = True
 
+
+def apply_captured_payments(captured):
+	"""Apply gateway payment entities to our Payment rows in one lookup.
+
+	`captured` maps order_id -> Razorpay payment entity. Payments that are
+	already completed are skipped, so repeated deliveries are harmless.
+	Returns the number of payments newly completed.
+	"""
+	if not captured:
+		return 0
+	applied = 0
+	payments = Payment.objects.filter(
+		order_id__in=list(captured), is_compleated=False
+	).select_related("registration", "registration__user")
+	for payment in payments:
+		_, completed = handle_successful_capture(payment, captured[payment.order_id])
+		applied += completed
+	return applied
+
+
+def verify_webhook_signature(body, signature):
+	"""Check the X-Razorpay-Signature HMAC locally; no gateway round trip."""
+	secret = getattr(settings, "RAZORPAY_WEBHOOK_SECRET", None)
+	if not secret or not signature:
+		return False
+	expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+	return hmac.compare_digest(expected, signature)
+
+
+def record_webhook_event(event_id, payload):
+	"""Store the event; a redelivered event id is dropped by the unique index."""
+	WebhookEvent.objects.bulk_create(
+		[WebhookEvent(event_id=event_id, event=payload.get("event", ""), payload=payload)],
+		ignore_conflicts=True,
+	)
+
+
+def process_webhook_events(batch_size=WEBHOOK_BATCH_SIZE):
+	"""Apply pending webhook events in batches until none are left.
+
+	Each batch is claimed with SELECT ... FOR UPDATE (SKIP LOCKED where the
+	database supports it) so several workers can drain the table together.
+	Returns the number of events handled.
+	"""
+	skip_locked = connection.features.has_select_for_update_skip_locked
+	handled = 0
+	while True:
+		with transaction.atomic():
+			events = list(
+				WebhookEvent.objects.select_for_update(skip_locked=skip_locked)
+				.filter(status="PENDING")
+				.order_by("id")[:batch_size]
+			)
+			if not events:
+				return handled
+
+			captured = {}
+			failed_orders = set()
+			for event in events:
+				entity = (event.payload.get("payload", {}).get("payment") or {}).get("entity") or {}
+				order_id = entity.get("order_id")
+				if event.event in ("payment.captured", "order.paid") and order_id:
+					captured[order_id] = entity
+					event.status = "PROCESSED"
+				elif event.event == "payment.failed" and order_id:
+					failed_orders.add(order_id)
+					event.status = "PROCESSED"
+				else:
+					event.status = "IGNORED"
+				event.processed_at = timezone.now()
+
+			try:
+				# Savepoint, so a failing batch can still be marked on the events
+				with transaction.atomic():
+					apply_captured_payments(captured)
+					for payment in Payment.objects.filter(order_id__in=failed_orders - set(captured)):
+						handle_failed_capture(payment)
+			except Exception as e:
+				logger.exception("Failed to apply webhook batch: %s", e)
+				for event in events:
+					event.status = "FAILED"
+					event.error = str(e)
+
+			WebhookEvent.objects.bulk_update(events, ["status", "processed_at", "error"])
+			handled += len(events)
+			logger.info("Applied %s webhook events (%s captures)", len(events), len(captured))
+
+
+def reconcile_payments(since, until=None):
+	"""Page through captured gateway payments and complete any we missed.
+
+	Uses the bulk payments listing (100 per call) instead of one fetch per
+	Payment row. Returns (seen, applied).
+	"""
+	if client is None:
+		raise RuntimeError("Payment gateway is not configured.")
+
+	params = {
+		"from": int(since.timestamp()),
+		"to": int((until or timezone.now()).timestamp()),
+		"count": RECONCILE_PAGE_SIZE,
+	}
+	seen = applied = skip = 0
+	while True:
+		page = client.payment.all({**params, "skip": skip})
+		items = page.get("items") or []
+		captured = {
+			item["order_id"]: item
+			for item in items
+			if item.get("status") == "captured" and item.get("order_id")
+		}
+		with transaction.atomic():
+			applied += apply_captured_payments(captured)
+		seen += len(items)
+		if len(items) < RECONCILE_PAGE_SIZE:
+			break
+		skip += RECONCILE_PAGE_SIZE
+	logger.info("Reconciled payments: %s seen, %s applied", seen, applied)
+	return seen, applied
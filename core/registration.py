@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db.models import Prefetch
+
+from .models import PlayerRegistration, Season, Payment
+
+# Payment states the register_form view dispatches on
+PAYMENT_NONE = "NONE"
+PAYMENT_FAILED = "FAILED"
+PAYMENT_PENDING = "PENDING"
+PAYMENT_COMPLETED = "COMPLETED"
+
+
+@dataclass
+class RegistrationState:
+    """Everything register_form needs to know about a user for one season."""
+    season: Season
+    registration: Optional[PlayerRegistration] = None
+    last_registration: Optional[PlayerRegistration] = None
+    payment: Optional[Payment] = None
+
+    @property
+    def is_registered(self):
+        return self.registration is not None
+
+    @property
+    def payment_state(self):
+        if self.payment is None:
+            return PAYMENT_NONE
+        if self.payment.status == "FAILED":
+            return PAYMENT_FAILED
+        if not self.payment.is_compleated:
+            return PAYMENT_PENDING
+        return PAYMENT_COMPLETED
+
+    @property
+    def is_paid(self):
+        """Payment captured and the registration marked as completed."""
+        return (
+            self.payment is not None
+            and self.payment.is_compleated
+            and self.payment.status == "PAID"
+            and self.registration.is_compleated
+        )
+
+
+def load_registration_state(user, season_id):
+    """Load the season, the user's registrations and the latest payment.
+
+    Costs three queries whatever the user's state: the season, the user's
+    registrations across seasons, and their payments (prefetched).
+    Returns None if the season does not exist.
+    """
+    season = Season.objects.filter(id=season_id).first()
+    if season is None:
+        return None
+
+    registrations = list(
+        PlayerRegistration.objects.filter(user=user)
+        .order_by("-created")
+        .prefetch_related(
+            Prefetch(
+                "payment_set",
+                queryset=Payment.objects.filter(user=user).order_by("-id"),
+                to_attr="latest_payments",
+            )
+        )
+    )
+
+    state = RegistrationState(season=season)
+    for registration in registrations:
+        if registration.season_id == season.id:
+            if state.registration is None:
+                registration.season = season
+                state.registration = registration
+                state.payment = registration.latest_payments[0] if registration.latest_payments else None
+        elif state.last_registration is None:
+            state.last_registration = registration
+    return state
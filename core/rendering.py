@@ -0,0 +1,105 @@
+"""Bulk template rendering for batch mail.
+
+A BulkRenderer compiles its template once, caches the output for identical
+contexts and keeps render timings apart from delivery, so a 5,000 recipient
+batch parses the admin-supplied HTML once instead of 5,000 times.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template import Context, Template
+from django.template.loader import get_template
+
+
+class RenderError:
+    """Stands in for the output of a context that failed to render."""
+
+    def __init__(self, error):
+        self.error = error
+
+    def __str__(self):
+        return str(self.error)
+
+
+def _compile(source=None, template_name=None):
+    if template_name is not None:
+        return get_template(template_name)
+    return Template(source)
+
+
+def _render(template, context):
+    # Engine templates (from get_template) take a dict, raw Templates a Context
+    if isinstance(template, Template):
+        return template.render(Context(context))
+    return template.render(context)
+
+
+class BulkRenderer:
+    """Render one template for many contexts."""
+
+    def __init__(self, source=None, template_name=None, cache_size=1024):
+        self.source = source
+        self.template_name = template_name
+        self.template = _compile(source, template_name)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_string(cls, source, **kwargs):
+        return cls(source=source, **kwargs)
+
+    @classmethod
+    def from_name(cls, template_name, **kwargs):
+        return cls(template_name=template_name, **kwargs)
+
+    @staticmethod
+    def _cache_key(context):
+        data = json.dumps(context, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+        return hashlib.sha1(data.encode(), usedforsecurity=False).hexdigest()
+
+    def render(self, context):
+        """Render one context, reusing the output of an identical earlier context."""
+        started = time.perf_counter()
+        key = self._cache_key(context)
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+        if html is None:
+            html = _render(self.template, context)
+            with self._lock:
+                self._cache[key] = html
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        with self._lock:
+            self.rendered += 1
+            self.seconds += time.perf_counter() - started
+        return html
+
+    def stream(self, contexts):
+        """Yield the HTML for each context in order, as RenderError on failure."""
+        for context in contexts:
+            try:
+                yield self.render(context)
+            except Exception as e:
+                self.errors += 1
+                yield RenderError(e)
+
+    def stats(self):
+        return {
+            "rendered": self.rendered,
+            "cache_hits": self.cache_hits,
+            "render_errors": self.errors,
+            "render_seconds": round(self.seconds, 2),
+        }
+
@@ -1,74 +1,97 @@
-import concurrent.futures
-from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.contrib.auth.models import User
 from core.models import PlayerRegistration, Season
+from core.jobs import job, report_progress
+from core import csv_import, mailer, outbox
+from django.db import transaction
 from django.conf import settings
-from django.template import Template, Context
-import csv, io
 import logging
-import smtplib
-import time, random
-import atexit
-
-email_executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
-bulk_email_executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
-csv_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-common_executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
-
-email_executor._shutdown = False
-csv_executor._shutdown = False
-bulk_email_executor._shutdown = False
-common_executor._shutdown = False
-
-# Register proper cleanup on application exit
-def cleanup_executors():
-    """Gracefully shutdown executors on application exit"""
-    logger.info("Shutting down thread pool executors...")
-    email_executor.shutdown(wait=False)
-    csv_executor.shutdown(wait=False)
-    bulk_email_executor.shutdown(wait=False)
-    common_executor.shutdown(wait=False)
-
-atexit.register(cleanup_executors)
+from collections import defaultdict
 
 logger = logging.getLogger('core')
 
+# All background work runs through the durable job queue in core.jobs;
+# start a worker with `python manage.py run_jobs`.
+
+
 def send_success_email(subject, to, context):
-    logger.info("Submitting email task to thread pool")
+    logger.info("Queueing registration success email")
+    # The template only needs plain values; model instances can't be stored on the job
+    context = {key: value for key, value in context.items() if key != "settings"}
+    return success_email_job.enqueue(subject, to, context)
+
+
+@job(queue="email", max_attempts=3)
+def success_email_job(subject, to, context):
+    html_content = render_to_string('email/success_email.html', context)
+    text_content = 'Your registration has been completed successfully.'
+    from_email = settings.EMAIL_HOST_USER
 
-    def send_email():
-        try:
-            html_content = render_to_string('email/success_email.html', context)
-            text_content = 'Your registration has been completed successfully.'
-            from_email = settings.EMAIL_HOST_USER
+    message = EmailMultiAlternatives(subject, text_content, from_email, [to,])
+    message.attach_alternative(html_content, "text/html")
 
-            message = EmailMultiAlternatives(subject, text_content, from_email, [to,])
-            message.attach_alternative(html_content, "text/html")
+    # Transient failures raise, so the job is retried later; hard bounces are not retried
+    if mailer.send_message(message):
+        logger.info(f"Email sent to {to}")
+    else:
+        logger.error(f"Email to {to} permanently rejected")
 
-            message.send()
-            logger.info(f"Email sent to {to}")
-        except Exception as e:
-            logger.error(f"Error sending email to {to}: {e}")
-            # print(f"Error sending email to {to}: {e}")
+def send_batch_success_emails(registrations):
+    """
+    Queues registration success emails for registrations annotated with `payment_amount`.
+
+    Each registration's is_mail_sent is set once its email is delivered.
+    """
+    recipients = (
+        {
+            "to_email": reg.user.email,
+            "context": {
+                "id": reg.tx_id,
+                "reg_id": reg.reg_id,
+                "amount": reg.payment_amount,
+                "zone": reg.zone,
+                "registration_id": str(reg.id),
+            },
+        }
+        for reg in registrations
+    )
+    return _start_campaign(
+        "REGISTRATION_SUCCESS", "Registration Completed", recipients,
+        template_name="email/success_email.html",
+        text_template="Your registration has been completed successfully.",
+    )
+
+
+def _start_campaign(kind, subject, recipients, **options):
+    """Store the campaign's outbox rows and queue the job that sends them."""
+    with transaction.atomic():
+        campaign = outbox.create_campaign(kind, subject, recipients, **options)
+        campaign.job = send_campaign_job.enqueue(campaign.id)
+        campaign.save(update_fields=["job"])
+    logger.info(f"Campaign {campaign.id} queued as job {campaign.job.id}")
+    return campaign
+
+
+@job(queue="bulk_email", max_attempts=1)
+def send_campaign_job(campaign_id):
+    result = outbox.send_campaign(campaign_id, on_progress=report_progress)
+    logger.info(f"Campaign {campaign_id} run finished: {result}")
+    return result
 
-    email_executor.submit(send_email)
 
 def send_batch_payment_reminder_emails(email_data_list, subject, settings_data):
     """
-    Sends payment reminder emails in batches with rate limiting.
+    Queues payment reminder emails to be sent in batches with rate limiting.
     
     Parameters:
     - email_data_list (list): List of dicts with keys: to_email, reg_id, tx_id, amount, zone, player_name
     - subject (str): Email subject
     - settings_data (dict): General settings data (current_season_title, etc.)
     """
-    
-    def _send_single_email(email_data, subject, attempt=1, max_retries=10):
-        """Send a single email with retry logic"""
-        try:
-            # Build context for this email
-            context = {
+    recipients = (
+        {
+            "to_email": email_data["to_email"],
+            "context": {
                 "id": email_data.get("tx_id"),
                 "reg_id": email_data["reg_id"],
                 "amount": email_data["amount"],
@@ -76,214 +99,52 @@ def send_batch_payment_reminder_emails(email_data_list, subject, settings_data):
                 "player_name": email_data.get("player_name", ""),
                 "season_id": email_data.get("season_id"),  # Pass season_id directly
                 "settings": settings_data,
-            }
-            
-            # Render HTML content
-            html_content = render_to_string('email/payment_reminder_email.html', context)
-            text_content = f"Hello {context.get('player_name', '')}, your remaining payment of {context.get('amount', '')} is due."
-            
-            from_email = settings.EMAIL_HOST_USER
-            
-            # Create fresh connection for each email to avoid connection issues
-            with get_connection() as connection:
-                message = EmailMultiAlternatives(
-                    subject, 
-                    text_content, 
-                    from_email, 
-                    [email_data["to_email"]],
-                    connection=connection
-                )
-                message.attach_alternative(html_content, "text/html")
-                message.send()
-            
-            logger.info(f"Payment reminder sent to {email_data['to_email']} (reg_id={email_data['reg_id']})")
-            return True
-            
-        except smtplib.SMTPResponseException as e:
-            if e.smtp_code == 421:
-                logger.warning(f"Rate limited at {email_data['to_email']} (attempt {attempt}/{max_retries}). Sleeping 15s...")
-                time.sleep(15)
-            else:
-                logger.error(f"SMTP error for {email_data['to_email']}: {e.smtp_code} {e.smtp_error}")
-                time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send payment reminder to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except (ConnectionError, BrokenPipeError, OSError) as e:
-            logger.warning(f"Connection error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            sleep_time = min(2 ** attempt, 30)  # Exponential backoff, max 30s
-            time.sleep(sleep_time)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send payment reminder to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Unexpected error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send payment reminder to {email_data['to_email']} after {max_retries} attempts")
-                return False
-    
-    def _send_batch():
-        logger.info(f"Starting batch payment reminder emails for {len(email_data_list)} recipients")
-        success_count = 0
-        failed_count = 0
-        
-        for idx, email_data in enumerate(email_data_list):
-            logger.info(f"[{idx+1}/{len(email_data_list)}] Processing {email_data['to_email']}...")
-            
-            # Rate limiting: sleep between emails (5-8 seconds)
-            if idx > 0:
-                sleep_duration = random.uniform(3.0, 5.0)
-                logger.info(f"Sleeping {sleep_duration:.1f}s before next email...")
-                time.sleep(sleep_duration)
-            
-            # Send with retry logic
-            if _send_single_email(email_data, subject):
-                success_count += 1
-            else:
-                failed_count += 1
-        
-        logger.info(f"Batch payment reminder emails completed: {success_count} sent, {failed_count} failed out of {len(email_data_list)} total")
-    
-    # Submit to thread pool with error handling
-    try:
-        bulk_email_executor.submit(_send_batch)
-        logger.info(f"Batch payment reminder task submitted successfully to bulk_email_executor")
-    except RuntimeError as e:
-        logger.error(f"Failed to submit batch payment task: {e}. Executing synchronously as fallback.")
+            },
+        }
+        for email_data in email_data_list
+    )
+    return _start_campaign(
+        "PAYMENT_REMINDER", subject, recipients,
+        template_name='email/payment_reminder_email.html',
+        text_template="{% autoescape off %}Hello {{ player_name }}, your remaining payment of {{ amount }} is due.{% endautoescape %}",
+    )
 
 
 def send_batch_selection_status_emails(email_data_list, subject, settings_data):
     """
-    Sends selection status emails in batches with rate limiting.
+    Queues selection status emails to be sent in batches with rate limiting.
     
     Parameters:
     - email_data_list (list): List of dicts with keys: to_email, reg_id, player_name, is_selected, points, zone, category
     - subject (str): Email subject
     - settings_data (dict): General settings data
     """
-    
-    def _send_single_email(email_data, subject, attempt=1, max_retries=10):
-        """Send a single email with retry logic"""
-        try:
-            # Build a minimal object-like dict for templates
-            player_obj = {
-                "player_name": email_data["player_name"],
-                "reg_id": email_data["reg_id"],
-                "is_selected": email_data["is_selected"],
-                "points": email_data.get("points", 0),
-                "zone": email_data["zone"],
-                "category": email_data.get("category", ""),
-            }
-            
+    recipients = (
+        {
+            "to_email": email_data["to_email"],
             # Choose template based on selection status
-            if email_data["is_selected"]:
-                html_content = render_to_string('selected.html', {"data": player_obj})
-            else:
-                html_content = render_to_string('notSelected.html', {"data": player_obj})
-            
-            text_content = f"Hello {email_data['player_name']}, your selection status has been updated."
-            from_email = settings.EMAIL_HOST_USER
-            
-            # Create fresh connection for each email to avoid connection issues
-            with get_connection() as connection:
-                message = EmailMultiAlternatives(
-                    subject, 
-                    text_content, 
-                    from_email, 
-                    [email_data["to_email"]],
-                    connection=connection
-                )
-                message.attach_alternative(html_content, "text/html")
-                message.send()
-            
-            logger.info(f"Selection status sent to {email_data['to_email']} (reg_id={email_data['reg_id']})")
-            return True
-            
-        except smtplib.SMTPResponseException as e:
-            if e.smtp_code == 421:
-                logger.warning(f"Rate limited at {email_data['to_email']} (attempt {attempt}/{max_retries}). Sleeping 15s...")
-                time.sleep(15)
-            else:
-                logger.error(f"SMTP error for {email_data['to_email']}: {e.smtp_code} {e.smtp_error}")
-                time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send selection status to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except (ConnectionError, BrokenPipeError, OSError) as e:
-            logger.warning(f"Connection error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            sleep_time = min(2 ** attempt, 30)  # Exponential backoff, max 30s
-            time.sleep(sleep_time)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send selection status to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Unexpected error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send selection status to {email_data['to_email']} after {max_retries} attempts")
-                return False
-    
-    def _send_batch():
-        logger.info(f"Starting batch selection status emails for {len(email_data_list)} recipients")
-        success_count = 0
-        failed_count = 0
-        
-        for idx, email_data in enumerate(email_data_list):
-            logger.info(f"[{idx+1}/{len(email_data_list)}] Processing {email_data['to_email']}...")
-            
-            # Rate limiting: sleep between emails (5-8 seconds)
-            if idx > 0:
-                sleep_duration = random.uniform(5.0, 8.0)
-                logger.info(f"Sleeping {sleep_duration:.1f}s before next email...")
-                time.sleep(sleep_duration)
-            
-            # Send with retry logic
-            if _send_single_email(email_data, subject):
-                success_count += 1
-            else:
-                failed_count += 1
-        
-        logger.info(f"Batch selection status emails completed: {success_count} sent, {failed_count} failed out of {len(email_data_list)} total")
-    
-    # Submit to thread pool with error handling
-    try:
-        bulk_email_executor.submit(_send_batch)
-        logger.info(f"Batch selection status task submitted successfully to bulk_email_executor")
-    except RuntimeError as e:
-        logger.error(f"Failed to submit batch selection task: {e}. Executing synchronously as fallback.")
-
-def process_csv_upload(data_bytes, points_bytes, season_id):
-    """Process the entire CSV in a single safe background thread."""
-    
-    def calculate_age(dob_str):
-        from datetime import datetime, date
-        dob = datetime.strptime(dob_str, "%Y-%m-%d").date()
-        today = date.today()
-        return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-
+            "template_name": 'selected.html' if email_data["is_selected"] else 'notSelected.html',
+            # Build a minimal object-like dict for templates
+            "context": {
+                "data": {
+                    "player_name": email_data["player_name"],
+                    "reg_id": email_data["reg_id"],
+                    "is_selected": email_data["is_selected"],
+                    "points": email_data.get("points", 0),
+                    "zone": email_data["zone"],
+                    "category": email_data.get("category", ""),
+                },
+            },
+        }
+        for email_data in email_data_list
+    )
+    return _start_campaign(
+        "SELECTION_STATUS", subject, recipients,
+        text_template="{% autoescape off %}Hello {{ data.player_name }}, your selection status has been updated.{% endautoescape %}",
+    )
+
+def process_csv_upload(data_name, points_name, season_id):
+    """Import a spooled season CSV in chunks (see core.csv_import)."""
     try:
         season = Season.objects.get(id=season_id)
     except Season.DoesNotExist:
@@ -291,235 +152,169 @@ def process_csv_upload(data_bytes, points_bytes, season_id):
         return "SEASON_NOT_FOUND"
 
     # -------- Optional Points CSV --------
-    points_map = {}
-    if points_bytes:
-        points_str = points_bytes.decode("utf-8")
-        p_reader = csv.reader(io.StringIO(points_str))
-        next(p_reader, None)
-        for pid, pts in p_reader:
-            points_map[pid.strip()] = int(pts)
+    points_map = csv_import.read_points(points_name) if points_name else {}
 
     # -------- Main CSV --------
-    data_str = data_bytes.decode("utf-8")
-    csv_reader = csv.DictReader(io.StringIO(data_str))
-
-    created = 0
-    updated = 0
-    user_created = 0
-
-    for row in csv_reader:
-        try:
-            reg_id = row["reg_id"].strip()
-            username = row["user__username"].strip()
-            player_name = row["player_name"].strip()
-            email = row["email"].strip()
-            dob = row["dob"].strip()
-            mobile = row["mobile"].strip()
-
-            # Split name
-            name_parts = player_name.split(" ")
-            first_name = name_parts[0]
-            last_name = " ".join(name_parts[1:]) if len(name_parts) > 1 else ""
-
-            # Generate password
-            password = dob.replace("-", "") + mobile[-4:]
-
-            # Create / update user
-            user, new_user = User.objects.get_or_create(
-                username=username,
-                defaults={
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "email": email,
-                }
-            )
-
-            if new_user:
-                user.set_password(password)
-                user.save()
-                user_created += 1
-            else:
-                user.first_name = first_name
-                user.last_name = last_name
-                user.email = email
-                user.save()
-
-            # Age
-            age = calculate_age(dob)
-            category = "21 and Above"
-
-            # Create/update PlayerRegistration
-            pr, is_created = PlayerRegistration.objects.update_or_create(
-                season=season,
-                reg_id=reg_id,
-                defaults={
-                    "user": user,
-                    "player_name": player_name,
-                    "father_name": row["father_name"],
-                    "category": category,
-                    "age": age,
-                    "dob": row["dob"],
-                    "gender": row["gender"],
-                    "tshirt_size": row["tshirt_size"],
-                    "occupation": 3,
-                    "mobile": row["mobile"],
-                    "wathsapp_number": row["wathsapp_number"],
-                    "email": row["email"],
-                    "adhar_card": row["adhar_card"],
-                    "player_image": row["player_image"],
-                    "district": row["district"],
-                    "zone": row["zone"],
-                    "pin_code": row["pin_code"],
-                    "address": row["address"],
-                    "first_preference": row["first_preference"],
-                    "batting_arm": row["batting_arm"],
-                    "role": row["role"],
-                    "is_compleated": bool(int(row["is_paid"])),
-                    "tx_id": row["tx_id"],
-                    "is_selected": bool(int(row["is_selected"])),
-                    "points": points_map.get(reg_id, int(row.get("points", 0))),
-                }
-            )
-
-            if is_created:
-                created += 1
-                logger.info(f"reg_id={reg_id} - CREATED")
-            else:
-                updated += 1
-                logger.info(f"reg_id={reg_id} - UPDATED")
-
-        except Exception as e:
-            logger.error(f"[ERROR] reg_id={row.get('reg_id')} - {e}")
-            continue
-
-    summary = f"Done: Players Created={created}, Updated={updated}, Users Created={user_created}"
-    logger.info(summary)
-    return summary
+    importer = csv_import.RegistrationImporter(season, points_map)
+    return importer.run(
+        csv_import.read_rows(data_name),
+        total=csv_import.count_rows(data_name),
+        on_progress=report_progress,
+    )
 
 
 def send_batch_custom_emails(email_data_list, subject, html_template):
     """
-    Sends custom HTML emails in batches with rate limiting.
+    Queues custom HTML emails to be sent in batches with rate limiting.
     
     Parameters:
     - email_data_list (list): List of dicts with keys: to_email, context (dict with template variables)
     - subject (str): Email subject
     - html_template (str): HTML template string with Django template variables
     """
-    
-    def _send_single_email(email_data, subject, html_template, attempt=1, max_retries=10):
-        """Send a single custom email with retry logic"""
-        try:
-            # Render HTML content with user's context
-            t = Template(html_template)
-            c = Context(email_data["context"])
-            rendered_html = t.render(c)
-            
-            text_content = "You have a new notification."
-            from_email = settings.EMAIL_HOST_USER
-            
-            # Create fresh connection for each email to avoid connection issues
-            with get_connection() as connection:
-                message = EmailMultiAlternatives(
-                    subject, 
-                    text_content, 
-                    from_email, 
-                    [email_data["to_email"]],
-                    connection=connection
-                )
-                message.attach_alternative(rendered_html, "text/html")
-                time.sleep(random.uniform(0.5, 2.5))
-                message.send()
-            
-            logger.info(f"Custom bulk email sent to {email_data['to_email']}")
-            return True
-            
-        except smtplib.SMTPResponseException as e:
-            if e.smtp_code == 421:
-                logger.warning(f"Rate limited at {email_data['to_email']} (attempt {attempt}/{max_retries}). Sleeping 15s...")
-                time.sleep(8)
-            else:
-                logger.error(f"SMTP error for {email_data['to_email']}: {e.smtp_code} {e.smtp_error}")
-                time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, html_template, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send custom email to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except (ConnectionError, BrokenPipeError, OSError) as e:
-            logger.warning(f"Connection error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            sleep_time = min(2 ** attempt, 60)  # Exponential backoff, max 30s
-            time.sleep(sleep_time)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, html_template, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send custom email to {email_data['to_email']} after {max_retries} attempts")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Unexpected error for {email_data['to_email']} (attempt {attempt}/{max_retries}): {e}")
-            time.sleep(3)
-            
-            if attempt < max_retries:
-                return _send_single_email(email_data, subject, html_template, attempt + 1, max_retries)
-            else:
-                logger.error(f"Failed to send custom email to {email_data['to_email']} after {max_retries} attempts")
-                return False
-    
-    def _send_batch():
-        logger.info(f"Starting batch custom emails for {len(email_data_list)} recipients")
-        success_count = 0
-        failed_count = 0
-        
-        for idx, email_data in enumerate(email_data_list):
-            logger.info(f"[{idx+1}/{len(email_data_list)}] Processing {email_data['to_email']}...")
-            
-            # Rate limiting: sleep between emails (5-8 seconds)
-            if idx > 0:
-                sleep_duration = random.uniform(3.0, 8.0)
-                logger.info(f"Sleeping {sleep_duration:.1f}s before next email...")
-                time.sleep(sleep_duration)
-            
-            # Send with retry logic
-            if _send_single_email(email_data, subject, html_template):
-                success_count += 1
-            else:
-                failed_count += 1
-        
-        logger.info(f"Batch custom emails completed: {success_count} sent, {failed_count} failed out of {len(email_data_list)} total")
-    
-    # Submit to thread pool with error handling
+    return _start_campaign("CUSTOM", subject, iter(email_data_list), html_template=html_template)
+
+
+def send_custom_email_to_all_users(subject, html_template, context):
+    """
+    Queues a custom HTML email to every user with an email address.
+
+    Returns the campaign right away; the send job selects the recipients.
+    `context` holds the template variables shared by all recipients.
+    """
+    return _start_campaign(
+        "CUSTOM", subject, [], html_template=html_template, audience="ALL_USERS", context=context,
+    )
+
+
+@job(queue="common", max_attempts=3)
+def create_order_task(payment_id):
+    """Create the Razorpay order for a payment row outside the request."""
+    from core.models import Payment
+    from core import paymentHandler
+
     try:
-        bulk_email_executor.submit(_send_batch)
-        logger.info(f"Batch custom email task submitted successfully to bulk_email_executor")
-    except RuntimeError as e:
-        logger.error(f"Failed to submit batch custom email task: {e}. Executing synchronously as fallback.")
+        payment = Payment.objects.select_related("registration").get(id=payment_id)
+    except Payment.DoesNotExist:
+        logger.error(f"Payment {payment_id} not found for order creation")
+        return
+    if payment.order_id:
+        return
+    _, err = paymentHandler.create_remote_order(payment)
+    if err:
+        logger.error(f"Deferred order creation failed for payment={payment_id}: {err}")
 
 
-def submit_csv_task(data_bytes, points_bytes, season_id):
-    """Submit CSV processing job to the single-thread executor."""
-    return csv_executor.submit(process_csv_upload, data_bytes, points_bytes, season_id)
+def submit_order_creation(payment_id):
+    """Queue deferred Razorpay order creation on the common queue."""
+    return create_order_task.enqueue(payment_id)
 
 
-def reg_id_migration(a,b):
-    updated_count = 0
-    reg_a = PlayerRegistration.objects.filter(season=a)
-    reg_b = PlayerRegistration.objects.filter(season=b)
-    reg_a_map = {reg.user.id: reg.reg_id for reg in reg_a}
-    
-    for reg in reg_b:
-        if reg.user.id in reg_a_map:
-            old_reg_id = reg.reg_id
-            reg.reg_id = reg_a_map[reg.user.id]
-            reg.save()
-            updated_count += 1
-            logger.info(f"Updated reg_id for user_id={reg.user.id} from {old_reg_id} to {reg.reg_id}")
-    logger.info(f"Total registrations updated: {updated_count}")
-    return updated_count
-    
-def reg_id_migration_task(a,b):
-    
-    return csv_executor.submit(reg_id_migration,a,b)
\ No newline at end of file
+@job(queue="common", max_attempts=1)
+def drain_webhook_events():
+    """Apply pending webhook events."""
+    from core import paymentHandler
+
+    return paymentHandler.process_webhook_events()
+
+
+def submit_webhook_processing():
+    """Queue a webhook drain unless one is already waiting."""
+    return drain_webhook_events.enqueue(unique=True)
+
+
+@job(queue="csv", max_attempts=1)
+def csv_upload_job(data_name, points_name, season_id):
+    try:
+        return process_csv_upload(data_name, points_name, season_id)
+    finally:
+        for name in (data_name, points_name):
+            if name:
+                csv_import.discard_upload(name)
+
+
+def submit_csv_task(data_file, points_file, season_id):
+    """Spool the uploads to import storage and queue them on the single-slot csv queue."""
+    return csv_upload_job.enqueue(
+        csv_import.spool_upload(data_file),
+        csv_import.spool_upload(points_file) if points_file else None,
+        season_id,
+    )
+
+
+@job(queue="csv", max_attempts=1)
+def points_update_job(points_name, season_id):
+    try:
+        season = Season.objects.get(id=season_id)
+        return csv_import.apply_points_file(season, points_name)
+    finally:
+        csv_import.discard_upload(points_name)
+
+
+def submit_points_update(points_file, season_id):
+    """Spool a points sheet and queue it on the csv queue."""
+    return points_update_job.enqueue(csv_import.spool_upload(points_file), season_id)
+
+
+def plan_reg_id_migration(a, b):
+    """Work out which season B registrations take the user's reg_id from season A.
+
+    Returns (changes, conflicts): changes maps registration id to its new
+    reg_id, conflicts lists the moves left out because the new reg_id would
+    clash with another registration of season B (unique_reg_id_per_season).
+    """
+    # Like before, a user with several season A registrations keeps the oldest reg_id
+    source = dict(
+        PlayerRegistration.objects.filter(season=a).order_by("-created").values_list("user_id", "reg_id")
+    )
+    current = {}
+    changes = {}
+    for pk, user_id, reg_id in PlayerRegistration.objects.filter(season=b).values_list("id", "user_id", "reg_id"):
+        current[pk] = reg_id
+        if user_id in source and source[user_id] != reg_id:
+            changes[pk] = source[user_id]
+
+    # Dropping a move keeps that row's old reg_id, which can clash with another move; repeat until stable
+    conflicts = []
+    while True:
+        holders = defaultdict(list)
+        for pk, reg_id in current.items():
+            holders[changes.get(pk, reg_id)].append(pk)
+        clashing = {pk for pks in holders.values() if len(pks) > 1 for pk in pks if pk in changes}
+        if not clashing:
+            return changes, conflicts
+        for pk in clashing:
+            conflicts.append({"id": str(pk), "reg_id": current[pk], "wanted": changes.pop(pk)})
+
+
+@job(queue="csv", max_attempts=1)
+def reg_id_migration(a, b, dry_run=False):
+    """Give season B registrations the reg_id their user had in season A."""
+    with transaction.atomic():
+        changes, conflicts = plan_reg_id_migration(a, b)
+        if not dry_run and changes:
+            rows = [PlayerRegistration(id=pk) for pk in changes]
+            # Two passes so reg_ids swapped between rows never collide mid-update
+            for index, row in enumerate(rows):
+                row.reg_id = f"~{index}"
+            PlayerRegistration.objects.bulk_update(rows, ["reg_id"], batch_size=1000)
+            for row in rows:
+                row.reg_id = changes[row.id]
+            PlayerRegistration.objects.bulk_update(rows, ["reg_id"], batch_size=1000)
+
+    for conflict in conflicts:
+        logger.warning(f"reg_id migration skipped {conflict['reg_id']}: {conflict['wanted']} is taken in season {b}")
+    summary = {
+        "dry_run": dry_run,
+        "updated": len(changes),
+        "conflicts": len(conflicts),
+        "conflicting_reg_ids": sorted(conflict["wanted"] for conflict in conflicts)[:50],
+    }
+
+    logger.info(f"reg_id migration {a} -> {b}: {summary}")
+    return summary
+
+
+def reg_id_migration_task(a, b, dry_run=False):
+    # Seasons are passed by id so the job arguments stay JSON serialisable
+    return reg_id_migration.enqueue(getattr(a, "id", a), getattr(b, "id", b), dry_run=dry_run)
@@ -0,0 +1,1387 @@
+import base64
+import csv
+import datetime
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import shutil
+import smtplib
+import socket
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+import requests
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import connection
+from django.template import Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import csv_import, jobs, mailer, metrics, outbox, paymentHandler, rendering, task, utils
+from .models import (
+    REG_ID_ALLOCATION_ATTEMPTS, REG_ID_NUMBER, BackgroundJob, EmailCampaign, GeneralSettings, OutboxEmail, Payment,
+    PlayerRegistration, RegistrationSequence, Season, WebhookEvent, format_reg_id, highest_reg_number,
+)
+from .utils import get_general_settings, invalidate_general_settings
+
+MEDIA_ROOT = tempfile.mkdtemp()
+IMPORT_ROOT = tempfile.mkdtemp()
+
+# Session and authenticated user, paid by every request
+REQUEST_QUERIES = 2
+# load_registration_state: season, the user's registrations, their payments (skipped with no registrations)
+STATE_QUERIES = 3
+# get_or_create_pending_payment: savepoint, registration lock, pending lookup, insert, release
+NEW_PAYMENT_QUERIES = 5
+# create_remote_order: the conditional order_id update, outside any transaction
+REMOTE_ORDER_QUERIES = 1
+
+# 1x1 PNG, enough for the ImageField validation
+PLAYER_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+def tearDownModule():
+    # Shared by every import test class
+    shutil.rmtree(IMPORT_ROOT, ignore_errors=True)
+
+
+class RegistrationTestCase(TestCase):
+    """A current season open for registrations and a player without a registration."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin@example.com", "admin@example.com", "admin")
+        today = datetime.date.today()
+        cls.season = Season.objects.create(
+            user=cls.admin,
+            title="Test Season",
+            year=str(today.year),
+            start_date=today - datetime.timedelta(days=1),
+            end_date=today + datetime.timedelta(days=30),
+            amount=499,
+            accept_response=True,
+        )
+        GeneralSettings.objects.create(user=cls.admin, current_season=cls.season, razorpay_key_id="rzp_test")
+        cls.player = User.objects.create_user("player@example.com", "player@example.com", "player")
+
+    @classmethod
+    def register(cls, status=None, editable=True, **fields):
+        Season.objects.filter(id=cls.season.id).update(registration_form_editable=editable)
+        fields = {
+            "season": cls.season,
+            "user": cls.player,
+            "player_name": "Test Player",
+            "father_name": "Test Senior",
+            "category": "21 and Above",
+            "age": 24,
+            "dob": datetime.date(2002, 5, 17),
+            "gender": "male",
+            "tshirt_size": "M",
+            "mobile": "9876543210",
+            "wathsapp_number": "9876543210",
+            "email": "player@example.com",
+            "adhar_card": "234567890123",
+            "player_image": "player_images/player.png",
+            "district": "Chennai",
+            "pin_code": 600001,
+            "address": "1, Main Road",
+            "is_compleated": status == "PAID",
+            **fields,
+        }
+        registration = PlayerRegistration.objects.create(**fields)
+        if status is not None:
+            Payment.objects.create(
+                user=registration.user,
+                registration=registration,
+                order_id=f"order_{status.lower()}",
+                recpt_id=f"rcpt_{status.lower()}",
+                amount=cls.season.amount,
+                status=status,
+                payment_id="pay_paid" if status == "PAID" else None,
+                is_compleated=status == "PAID",
+            )
+        return registration
+
+
+SHARED_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-default"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests-shared"},
+}
+
+
+class GeneralSettingsCacheTests(RegistrationTestCase):
+    """get_general_settings serves a per-process copy until the row or the current season changes."""
+
+    def setUp(self):
+        invalidate_general_settings()
+
+    def test_cached_until_saved(self):
+        self.assertEqual(get_general_settings().current_season, self.season)
+        with self.assertNumQueries(0):
+            get_general_settings()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GeneralSettings.objects.get().save()
+            self.season.title = "Renamed Season"
+            self.season.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_general_settings().current_season.title, "Renamed Season")
+
+    @override_settings(GENERAL_SETTINGS_CACHE_TTL=0)
+    def test_expires_after_the_ttl(self):
+        get_general_settings()
+        with self.assertNumQueries(1):
+            get_general_settings()
+
+    @override_settings(CACHES=SHARED_CACHES, GENERAL_SETTINGS_CACHE_ALIAS="shared")
+    def test_invalidation_reaches_other_processes(self):
+        get_general_settings()
+        # Another process starting up finds the row in the shared cache
+        utils._settings_cache["expires_at"] = 0.0
+        with self.assertNumQueries(0):
+            get_general_settings()
+
+        # Another process invalidates: only the shared version key changes
+        caches["shared"].set(utils.GENERAL_SETTINGS_VERSION_KEY, "bumped-elsewhere", None)
+        GeneralSettings.objects.update(alert_message="Changed elsewhere")
+        with self.assertNumQueries(1):
+            self.assertEqual(get_general_settings().alert_message, "Changed elsewhere")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RAZORPAY_ASYNC_ORDERS=False)
+class RegisterFormQueryTests(RegistrationTestCase):
+    """Query counts of register_form for every branch it dispatches on.
+
+    The tests run inside a transaction, so atomic blocks show up as
+    savepoints; the general settings come from the per-process cache.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        invalidate_general_settings()
+        get_general_settings()
+        self.client.force_login(self.player)
+        self.url = reverse("register_form", args=[self.season.id])
+
+        order_ids = (f"order_test{n}" for n in itertools.count())
+        patches = [
+            mock.patch.object(paymentHandler, "client", mock.Mock()),
+            mock.patch.object(paymentHandler, "_create_order", side_effect=lambda payment: {"id": next(order_ids)}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def form_data(self, **overrides):
+        return {
+            "player_name": "Test Player",
+            "father_name": "Test Senior",
+            "category": "21 and Above",
+            "age": 24,
+            "dob": "2002-05-17",
+            "gender": "male",
+            "occupation": "student",
+            "tshirt_size": "M",
+            "mobile": "9876543210",
+            "wathsapp_number": "9876543210",
+            "email": "player@example.com",
+            "adhar_card": "234567890123",
+            "player_image": SimpleUploadedFile("player.png", PLAYER_IMAGE, content_type="image/png"),
+            "social_media_link": "https://instagram.com/test.player",
+            "district": "Chennai",
+            "pin_code": 600001,
+            "address": "1, Main Road",
+            "first_preference": "batting",
+            "batting_arm": "right",
+            "role": "BATTING",
+            **overrides,
+        }
+
+    def test_unregistered_get(self):
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES - 1):
+            response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "core/form.html")
+
+    def test_first_time_post(self):
+        # pre_save: previous-season lookup, the season's first counter allocation (8), reg_id check; insert
+        registration_queries = 1 + 8 + 1 + 1
+        with self.assertNumQueries(
+            REQUEST_QUERIES + STATE_QUERIES - 1 + registration_queries + NEW_PAYMENT_QUERIES + REMOTE_ORDER_QUERIES
+        ):
+            response = self.client.post(self.url, self.form_data())
+        self.assertTemplateUsed(response, "core/payment.html")
+        self.assertEqual(Payment.objects.get().order_id, "order_test0")
+
+    def test_editable_get(self):
+        self.register("PENDING")
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES):
+            response = self.client.get(self.url)
+        self.assertTrue(response.context["edit_mode"])
+
+    def test_editable_post(self):
+        self.register("PAID")
+        # Only the registration UPDATE on top of the state
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES + 1):
+            response = self.client.post(self.url, self.form_data(player_name="Renamed Player"))
+        self.assertTemplateUsed(response, "core/success.html")
+        self.assertEqual(PlayerRegistration.objects.get().player_name, "Renamed Player")
+
+    def test_pending_payment(self):
+        self.register("PENDING", editable=False)
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES):
+            response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "core/payment.html")
+        self.assertEqual(response.context["payment"].order_id, "order_pending")
+
+    def test_failed_payment(self):
+        self.register("FAILED", editable=False)
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES + NEW_PAYMENT_QUERIES + REMOTE_ORDER_QUERIES):
+            response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "core/payment.html")
+        self.assertEqual(Payment.objects.filter(status="PENDING").get().order_id, "order_test0")
+
+    def test_paid(self):
+        self.register("PAID", editable=False)
+        with self.assertNumQueries(REQUEST_QUERIES + STATE_QUERIES):
+            response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "core/success.html")
+
+
+class RegistrationSequenceTests(RegistrationTestCase):
+    """reg_id numbers come from the per-season counter and never collide with imported ids."""
+
+    def register_as(self, n, **fields):
+        email = f"seq{n}@example.com"
+        return self.register(
+            user=User.objects.create_user(email, email, "player"), email=email, adhar_card=f"3456789012{n:02d}", **fields,
+        )
+
+    def test_interleaved_allocations_do_not_overlap(self):
+        self.register_as(0, reg_id="TSPL01250007")
+        first_block = RegistrationSequence.allocate(self.season, 3)
+        single = RegistrationSequence.allocate(self.season)
+        block_ids = RegistrationSequence.allocate_reg_ids(self.season, 2)
+
+        self.assertEqual((first_block, single), (8, 11))
+        self.assertEqual([REG_ID_NUMBER.match(reg_id).group(1) for reg_id in block_ids], ["0012", "0013"])
+
+    def test_reserve_through_after_an_import(self):
+        self.assertEqual(RegistrationSequence.allocate(self.season), 1)
+        self.register_as(0, reg_id=format_reg_id(50))
+        RegistrationSequence.reserve_through(self.season, highest_reg_number(self.season))
+        # A lower number never moves the counter back
+        RegistrationSequence.reserve_through(self.season, 10)
+
+        self.assertEqual(self.register_as(1).reg_id, format_reg_id(51))
+
+    def test_taken_numbers_are_skipped(self):
+        self.register_as(0, reg_id=format_reg_id(1))
+        self.register_as(1, reg_id=format_reg_id(2))
+        RegistrationSequence.objects.create(season=self.season, last_number=0)
+
+        self.assertEqual(self.register_as(2).reg_id, format_reg_id(3))
+
+    def test_allocation_gives_up(self):
+        self.register_as(0, reg_id=format_reg_id(1))
+        with mock.patch.object(RegistrationSequence, "allocate", return_value=1) as allocate:
+            with self.assertRaisesMessage(RuntimeError, "No free reg_id"):
+                self.register_as(1)
+        self.assertEqual(allocate.call_count, REG_ID_ALLOCATION_ATTEMPTS)
+
+    def test_highest_number_ignores_legacy_ids(self):
+        for n, reg_id in enumerate(("TSPL01250007", "TSPL-OLD-99", "TSPL123", "TSPL0125A900", "LEGACY0999")):
+            self.register_as(n, reg_id=reg_id)
+        self.assertEqual(highest_reg_number(self.season), 7)
+
+
+@override_settings(IMPORT_ROOT=IMPORT_ROOT, CSV_IMPORT_HASH_PROCESSES=1)
+class RegistrationImporterTests(RegistrationTestCase):
+    """Season CSV imports: rejected rows are reported, re-imports update in place."""
+
+    @staticmethod
+    def row(n, **overrides):
+        return {
+            "reg_id": "",
+            "user__username": f"imported{n}",
+            "player_name": f"Imported Player{n}",
+            "father_name": "Imported Senior",
+            "dob": "2001-02-03",
+            "gender": "male",
+            "tshirt_size": "L",
+            "mobile": f"98765{n:05d}",
+            "wathsapp_number": f"98765{n:05d}",
+            "email": f"imported{n}@example.com",
+            "adhar_card": f"4567890123{n:02d}",
+            "player_image": "player_images/player.png",
+            "district": "Chennai",
+            "pin_code": "600001",
+            "address": "2, Main Road",
+            "first_preference": "batting",
+            "batting_arm": "right",
+            "role": "BATTING",
+            "is_paid": "1",
+            "tx_id": f"pay_{n}",
+            "is_selected": "0",
+            "points": "0",
+            **overrides,
+        }
+
+    def run_import(self, rows):
+        return csv_import.RegistrationImporter(self.season, chunk_size=10).run(rows)
+
+    def test_rejected_rows_land_in_the_report(self):
+        summary = self.run_import([
+            self.row(0),
+            self.row(1, dob="03/02/2001"),
+            self.row(2, adhar_card=self.row(0)["adhar_card"]),
+            self.row(3),
+        ])
+
+        self.assertEqual((summary["created"], summary["failed"]), (2, 2))
+        with csv_import.get_import_storage().open(summary["report"]) as report:
+            rejected = list(csv.DictReader(io.TextIOWrapper(report, encoding="utf-8")))
+        self.assertEqual([(row["line"], row["user__username"]) for row in rejected], [("3", "imported1"), ("4", "imported2")])
+        self.assertIn("does not match format", rejected[0]["error"])
+        self.assertIn("adhar_card", rejected[1]["error"])
+        self.assertEqual(
+            set(PlayerRegistration.objects.values_list("user__username", flat=True)), {"imported0", "imported3"},
+        )
+
+    def test_reimport_updates_in_place(self):
+        self.run_import([self.row(0), self.row(1)])
+        reg_ids = dict(PlayerRegistration.objects.values_list("user__username", "reg_id"))
+
+        summary = self.run_import([self.row(0, address="3, New Road"), self.row(1)])
+
+        self.assertEqual((summary["created"], summary["updated"], summary["users_created"]), (0, 2, 0))
+        self.assertEqual(dict(PlayerRegistration.objects.values_list("user__username", "reg_id")), reg_ids)
+        self.assertEqual(PlayerRegistration.objects.get(user__username="imported0").address, "3, New Road")
+
+    def test_cheap_hash_is_upgraded_at_first_login(self):
+        self.run_import([self.row(0)])
+        user = User.objects.get(username="imported0")
+        self.assertEqual(user.password.split("$")[1], str(settings.CSV_IMPORT_PASSWORD_ITERATIONS))
+
+        # Password is the date of birth followed by the last four digits of the mobile number
+        self.assertTrue(self.client.login(username="imported0", password="200102030000"))
+
+        user.refresh_from_db()
+        self.assertEqual(user.password.split("$")[1], str(PBKDF2PasswordHasher.iterations))
+
+
+@override_settings(CSV_IMPORT_PASSWORD_ITERATIONS=1000)
+class ImportPasswordHashTests(RegistrationTestCase):
+    """Imported accounts get a cheap hash, computed in parallel and only for new users."""
+
+    def test_hashes_verify_and_keep_their_order(self):
+        passwords = [f"2001020398{n:02d}" for n in range(20)]
+        importer = csv_import.RegistrationImporter(self.season)
+
+        with override_settings(CSV_IMPORT_HASH_PROCESSES=2):
+            hashes = importer.hash_passwords(passwords)
+        # Enough passwords for the process pool, which run() would shut down
+        self.assertIsNotNone(importer.hash_executor)
+        importer.hash_executor.shutdown()
+
+        self.assertEqual(len(set(hashes)), len(passwords))
+        for password, encoded in zip(passwords, hashes):
+            self.assertTrue(encoded.startswith("pbkdf2_sha256$1000$"))
+            self.assertTrue(check_password(password, encoded))
+
+    @override_settings(CSV_IMPORT_HASH_PROCESSES=1)
+    def test_only_new_users_are_hashed(self):
+        importer = csv_import.RegistrationImporter(self.season)
+        rows = [{"username": "player@example.com", "password": "x"}, {"username": "new@example.com", "password": "y"}]
+
+        with mock.patch.object(importer, "hash_passwords", wraps=importer.hash_passwords) as hash_passwords:
+            importer.hash_new_passwords(rows)
+
+        hash_passwords.assert_called_once_with(["y"])
+        self.assertNotIn("password_hash", rows[0])
+        self.assertTrue(check_password("y", rows[1]["password_hash"]))
+
+
+@override_settings(IMPORT_ROOT=IMPORT_ROOT, CSV_IMPORT_HASH_PROCESSES=1)
+class SpooledUploadTests(RegistrationTestCase):
+    """Admin CSV uploads are spooled to IMPORT_ROOT and streamed by the csv job."""
+
+    def csv_file(self, name, rows):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        # Spreadsheet exports start with a BOM
+        return SimpleUploadedFile(name, ("\ufeff" + buffer.getvalue()).encode(), content_type="text/csv")
+
+    def test_upload_is_spooled_and_imported(self):
+        self.client.force_login(self.admin)
+        rows = [RegistrationImporterTests.row(n, reg_id=f"TSPL0125{n + 1:04d}") for n in range(3)]
+        points = [{"reg_id": "TSPL01250002", "points": "30"}]
+
+        response = self.client.post(reverse("con_upload"), {
+            "season_id": self.season.id,
+            "data_file": self.csv_file("players.csv", rows),
+            "points_file": self.csv_file("points.csv", points),
+        })
+
+        self.assertRedirects(response, reverse("con_upload"))
+        background_job = BackgroundJob.objects.get(name="core.task.csv_upload_job")
+        data_name, points_name, _ = background_job.args
+        storage = csv_import.get_import_storage()
+        self.assertTrue(storage.exists(data_name) and storage.exists(points_name))
+        self.assertEqual(csv_import.count_rows(data_name), 3)
+        self.assertEqual(next(csv_import.read_rows(data_name))["reg_id"], "TSPL01250001")
+
+        self.assertTrue(jobs.run_job(background_job))
+
+        background_job.refresh_from_db()
+        self.assertEqual((background_job.result["created"], background_job.result["failed"]), (3, 0))
+        self.assertEqual(PlayerRegistration.objects.get(reg_id="TSPL01250002").points, 30)
+        self.assertFalse(storage.exists(data_name) or storage.exists(points_name))
+
+
+@override_settings(IMPORT_ROOT=IMPORT_ROOT)
+class PointsSheetTests(RegistrationTestCase):
+    """A points sheet updates matching reg_ids and reports a status for every row."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.registration = cls.register(reg_id="TSPL01250001", points=5)
+        other = User.objects.create_user("other@example.com", "other@example.com", "player")
+        cls.other = cls.register(user=other, email=other.email, adhar_card="678901234567", reg_id="TSPL01250002", points=7)
+
+    SHEET = (
+        "reg_id,points\n"
+        "TSPL01250001,40\n"
+        "TSPL01259999,12\n"
+        "TSPL01250002,not a number\n"
+        ",15\n"
+        " TSPL01250001 ,45\n"
+    )
+
+    def test_statuses_and_points(self):
+        df = pd.read_csv(io.StringIO(self.SHEET), dtype={"reg_id": str})
+
+        summary = csv_import.apply_points_sheet(self.season, df)
+
+        self.assertEqual(summary, {"matched": 2, "unmatched": 1, "invalid": 2})
+        self.assertEqual(list(df["status"]), ["UPDATED", "NOT FOUND", "INVALID", "INVALID", "UPDATED"])
+        # The last row for a reg_id wins; invalid rows leave the points alone
+        self.assertEqual(
+            dict(PlayerRegistration.objects.values_list("reg_id", "points")), {"TSPL01250001": 45, "TSPL01250002": 7},
+        )
+
+    def test_report_is_stored(self):
+        name = csv_import.get_import_storage().save("uploads/points.csv", ContentFile(self.SHEET.encode()))
+
+        summary = task.points_update_job(name, self.season.id)
+
+        with csv_import.get_import_storage().open(summary["report"]) as report:
+            statuses = [row["status"] for row in csv.DictReader(io.TextIOWrapper(report, encoding="utf-8"))]
+        self.assertEqual(statuses, ["UPDATED", "NOT FOUND", "INVALID", "INVALID", "UPDATED"])
+        self.assertFalse(csv_import.get_import_storage().exists(name))
+
+
+class RegIdMigrationTests(RegistrationTestCase):
+    """Season B registrations take their user's season A reg_id, except where it would clash."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.previous = Season.objects.create(
+            user=cls.admin, title="Previous Season", year="2020",
+            start_date=datetime.date(2020, 1, 1), end_date=datetime.date(2020, 2, 1), amount=499,
+        )
+        cls.users = [User.objects.create_user(f"moved{n}@example.com", f"moved{n}@example.com", "player") for n in range(4)]
+        # Users 0 and 1 swap reg_ids; user 3 already holds the reg_id user 2 had in the previous season
+        for n, (previous, current) in enumerate(
+            (("TSPL01200001", "TSPL01250002"), ("TSPL01200002", "TSPL01250001"), ("TSPL01200003", "TSPL01250010"), (None, "TSPL01200003"))
+        ):
+            if previous:
+                cls.enroll(cls.previous, n, previous)
+            cls.enroll(cls.season, n, current)
+
+    @classmethod
+    def enroll(cls, season, n, reg_id):
+        return cls.register(
+            season=season, user=cls.users[n], email=cls.users[n].email, adhar_card=f"5678901234{n:02d}", reg_id=reg_id,
+        )
+
+    def current_reg_ids(self):
+        return dict(PlayerRegistration.objects.filter(season=self.season).values_list("user__username", "reg_id"))
+
+    def test_plan(self):
+        changes, conflicts = task.plan_reg_id_migration(self.previous, self.season)
+
+        self.assertEqual(
+            {PlayerRegistration.objects.get(pk=pk).user.username: reg_id for pk, reg_id in changes.items()},
+            {"moved0@example.com": "TSPL01200001", "moved1@example.com": "TSPL01200002"},
+        )
+        self.assertEqual(
+            [(conflict["reg_id"], conflict["wanted"]) for conflict in conflicts], [("TSPL01250010", "TSPL01200003")],
+        )
+
+    def test_swap_and_conflict_are_applied(self):
+        summary = task.reg_id_migration(self.previous.id, self.season.id)
+
+        self.assertEqual((summary["updated"], summary["conflicts"]), (2, 1))
+        self.assertEqual(summary["conflicting_reg_ids"], ["TSPL01200003"])
+        self.assertEqual(self.current_reg_ids(), {
+            "moved0@example.com": "TSPL01200001",
+            "moved1@example.com": "TSPL01200002",
+            "moved2@example.com": "TSPL01250010",
+            "moved3@example.com": "TSPL01200003",
+        })
+
+    def test_dry_run_writes_nothing(self):
+        before = self.current_reg_ids()
+        summary = task.reg_id_migration(self.previous.id, self.season.id, dry_run=True)
+
+        self.assertEqual((summary["dry_run"], summary["updated"], summary["conflicts"]), (True, 2, 1))
+        self.assertEqual(self.current_reg_ids(), before)
+
+
+class RemoteOrderTests(RegistrationTestCase):
+    """create_remote_order calls the gateway outside a transaction and keeps the first order id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        registration = cls.register()
+        cls.payment = Payment.objects.create(
+            user=cls.player, registration=registration, amount=cls.season.amount, status="PENDING", recpt_id="rcpt_race",
+        )
+
+    def setUp(self):
+        patch = mock.patch.object(paymentHandler, "client", mock.Mock())
+        patch.start()
+        self.addCleanup(patch.stop)
+        # TestCase wraps every test in atomic blocks; anything deeper was opened by the code under test
+        self.savepoints = len(connection.savepoint_ids)
+
+    def create_order(self, side_effect):
+        def gateway(payment):
+            self.assertEqual(len(connection.savepoint_ids), self.savepoints)
+            return side_effect(payment)
+        with mock.patch.object(paymentHandler, "_create_order", side_effect=gateway):
+            return paymentHandler.create_remote_order(Payment.objects.get(pk=self.payment.pk))
+
+    def test_order_is_attached(self):
+        payment, err = self.create_order(lambda payment: {"id": "order_new"})
+        self.assertIsNone(err)
+        self.assertEqual((payment.order_id, Payment.objects.get().order_id), ("order_new", "order_new"))
+
+    def test_concurrent_order_wins(self):
+        def raced(payment):
+            Payment.objects.filter(pk=payment.pk).update(order_id="order_first")
+            return {"id": "order_second"}
+
+        payment, err = self.create_order(raced)
+        self.assertIsNone(err)
+        self.assertEqual((payment.order_id, Payment.objects.get().order_id), ("order_first", "order_first"))
+
+    def test_gateway_failure_fails_the_payment(self):
+        def down(payment):
+            raise ConnectionError("gateway down")
+
+        payment, err = self.create_order(down)
+        self.assertIsNone(payment)
+        self.assertEqual(err, "gateway down")
+        self.assertEqual(Payment.objects.get().status, "FAILED")
+
+    def test_gateway_failure_keeps_a_concurrent_order(self):
+        def raced_then_down(payment):
+            Payment.objects.filter(pk=payment.pk).update(order_id="order_first")
+            raise ConnectionError("gateway down")
+
+        payment, err = self.create_order(raced_then_down)
+        self.assertIsNone(err)
+        self.assertEqual(payment.order_id, "order_first")
+        self.assertEqual(Payment.objects.get().status, "PENDING")
+
+
+class GatewayClientTests(TestCase):
+    """The pooled gateway session bounds every call and only retries what is safe to repeat."""
+
+    def test_default_timeout(self):
+        session = paymentHandler.build_gateway_session()
+        with mock.patch("requests.Session.request") as request:
+            session.request("GET", "http://gateway.test/orders")
+            session.request("GET", "http://gateway.test/orders", timeout=1)
+        self.assertEqual(
+            [call.kwargs["timeout"] for call in request.call_args_list], [paymentHandler.RAZORPAY_TIMEOUT, 1],
+        )
+
+    def test_only_gets_are_retried(self):
+        retry = paymentHandler.build_gateway_session().get_adapter("https://api.razorpay.com").max_retries
+        self.assertEqual(retry.allowed_methods, frozenset({"GET"}))
+        self.assertEqual(retry.total, paymentHandler.RAZORPAY_MAX_RETRIES)
+
+    def create_order(self, client):
+        payment = Payment(amount=499, recpt_id="rcpt_retry")
+        with mock.patch.object(paymentHandler, "client", client), mock.patch.object(paymentHandler.time, "sleep"):
+            return paymentHandler._create_order(payment)
+
+    def test_lost_response_finds_the_order_by_receipt(self):
+        client = mock.Mock()
+        client.order.create.side_effect = requests.ConnectionError("reset")
+        client.order.all.return_value = {"items": [{"id": "order_created"}]}
+
+        self.assertEqual(self.create_order(client), {"id": "order_created"})
+        client.order.create.assert_called_once()
+        client.order.all.assert_called_once_with({"receipt": "rcpt_retry"})
+
+    def test_post_is_repeated_only_without_an_order(self):
+        client = mock.Mock()
+        client.order.create.side_effect = [requests.Timeout("slow"), {"id": "order_second_try"}]
+        client.order.all.return_value = {"items": []}
+
+        self.assertEqual(self.create_order(client), {"id": "order_second_try"})
+        self.assertEqual(client.order.create.call_count, 2)
+
+    def test_gives_up_after_the_retries(self):
+        client = mock.Mock()
+        client.order.create.side_effect = requests.ConnectionError("down")
+        client.order.all.return_value = {"items": []}
+
+        with self.assertRaises(requests.ConnectionError):
+            self.create_order(client)
+        self.assertEqual(client.order.create.call_count, paymentHandler.RAZORPAY_MAX_RETRIES + 1)
+
+
+class DeferredOrderTests(RegistrationTestCase):
+    """With defer=True the payment row is committed first and a job creates the order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.registration = cls.register(editable=False)
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(paymentHandler, "client", mock.Mock()),
+            mock.patch.object(paymentHandler, "_create_order", return_value={"id": "order_deferred"}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def start_payment(self):
+        return paymentHandler.get_or_create_pending_payment(
+            self.player, self.registration, self.season.amount, defer=True,
+        )
+
+    def test_order_is_created_by_the_job(self):
+        payment, err = self.start_payment()
+        self.assertIsNone(err)
+        self.assertIsNone(payment.order_id)
+        paymentHandler._create_order.assert_not_called()
+
+        # A resubmission before the job ran reuses the row and queues nothing new
+        again, _ = self.start_payment()
+        self.assertEqual(again.pk, payment.pk)
+        background_job = BackgroundJob.objects.get(name="core.task.create_order_task")
+        self.assertEqual(background_job.args, [payment.pk])
+
+        jobs.run_job(background_job)
+
+        self.client.force_login(self.player)
+        response = self.client.get(reverse("payment_order_status", args=[payment.pk]))
+        self.assertEqual(response.json(), {"status": "PENDING", "order_id": "order_deferred"})
+
+
+class PaymentCaptureTests(RegistrationTestCase):
+    """The browser callback and the webhook path complete a payment, and mail the player, once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.register("PENDING", editable=False)
+        cls.payment = Payment.objects.get()
+
+    def setUp(self):
+        patch = mock.patch("core.task.send_success_email")
+        self.send_success_email = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_callback_then_webhook(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            registration, completed = paymentHandler.handle_successful_capture(
+                Payment.objects.get(), {"id": "pay_callback"}
+            )
+        self.assertTrue(completed)
+        self.assertTrue(registration.is_mail_sent)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            applied = paymentHandler.apply_captured_payments({"order_pending": {"id": "pay_callback"}})
+        self.assertEqual(applied, 0)
+        self.send_success_email.assert_called_once()
+
+    def test_concurrent_capture_sends_one_mail(self):
+        # Both paths loaded the row while it was still PENDING
+        first, second = Payment.objects.get(), Payment.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            _, first_completed = paymentHandler.handle_successful_capture(first, {"id": "pay_webhook"})
+            _, second_completed = paymentHandler.handle_successful_capture(second, {"id": "pay_webhook"})
+        self.assertEqual((first_completed, second_completed), (True, False))
+        self.send_success_email.assert_called_once()
+        self.assertTrue(PlayerRegistration.objects.get().is_compleated)
+
+    def test_failure_does_not_undo_a_capture(self):
+        paymentHandler.handle_successful_capture(Payment.objects.get(), {"id": "pay_webhook"})
+        paymentHandler.handle_failed_capture(self.payment)
+        self.assertEqual(Payment.objects.get().status, "PAID")
+
+
+class LookupIndexTests(RegistrationTestCase):
+    """The indexes behind the results listing, the player's registration and the latest payment exist."""
+
+    def index_names(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return {name for name, info in constraints.items() if info["index"]}
+
+    def test_indexes_are_created(self):
+        self.assertLessEqual(
+            {"reg_season_selected_points", "reg_user_season", "reg_season_completed_mail", "reg_season_created"},
+            self.index_names(PlayerRegistration),
+        )
+        self.assertIn("payment_reg_user_created", self.index_names(Payment))
+
+    def test_latest_payment_lookup_uses_its_index(self):
+        registration = self.register(status="PAID")
+
+        self.assertIn(
+            "payment_reg_user_created",
+            Payment.objects.filter(registration=registration, user=self.player).order_by("-created_at").explain(),
+        )
+
+
+class ResultsApiTests(RegistrationTestCase):
+    """res.all.json pages through the current season by points, then reg_id."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        GeneralSettings.objects.update(show_points_table=True)
+        for i, points in enumerate((30, 20, 20, 10, 5)):
+            email = f"ranked{i}@example.com"
+            cls.register(
+                user=User.objects.create_user(email, email, "player"),
+                email=email,
+                adhar_card=f"23456789010{i}",
+                points=points,
+            )
+        cls.ranking = list(
+            PlayerRegistration.objects.order_by("-points", "reg_id").values_list("reg_id", flat=True)
+        )
+
+    def setUp(self):
+        invalidate_general_settings()
+        self.url = reverse("allResultsApi")
+
+    def fetch(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_pages_follow_the_cursor(self):
+        first = self.fetch(size=3).json()
+        self.assertEqual([row["reg_id"] for row in first["results"]], self.ranking[:3])
+        self.assertIsNotNone(first["next"])
+
+        second = self.fetch(size=3, cursor=first["next"]).json()
+        self.assertEqual([row["reg_id"] for row in second["results"]], self.ranking[3:])
+        self.assertIsNone(second["next"])
+
+    def test_out_of_range_sizes_are_clamped(self):
+        for size in ("0", "-5"):
+            with self.subTest(size=size):
+                response = self.fetch(size=size)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([row["reg_id"] for row in response.json()["results"]], self.ranking[:1])
+
+    def test_non_numeric_size_uses_the_default(self):
+        response = self.fetch(size="many")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), len(self.ranking))
+
+    def test_garbage_cursor_is_rejected(self):
+        for cursor in ("!!!", "bm9waXBl", "YWJjfGRlZg"):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.fetch(cursor=cursor).status_code, 400)
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET="whsec_test")
+class WebhookTests(RegistrationTestCase):
+    """Webhooks are verified locally, stored once per event id and applied by a queued drain."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.register("PENDING", editable=False)
+
+    def setUp(self):
+        self.url = reverse("razorpay_webhook")
+        patch = mock.patch("core.task.send_success_email")
+        self.send_success_email = patch.start()
+        self.addCleanup(patch.stop)
+
+    def deliver(self, event, event_id, signature=None, order_id="order_pending"):
+        body = json.dumps({
+            "event": event,
+            "payload": {"payment": {"entity": {"id": "pay_webhook", "order_id": order_id}}},
+        }).encode()
+        if signature is None:
+            signature = hmac.new(b"whsec_test", body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            self.url, body, content_type="application/json",
+            HTTP_X_RAZORPAY_SIGNATURE=signature, HTTP_X_RAZORPAY_EVENT_ID=event_id,
+        )
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver("payment.captured", "evt_forged", signature="0" * 64)
+        self.assertEqual(response.status_code, 400)
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=None):
+            self.assertEqual(self.deliver("payment.captured", "evt_unconfigured").status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_redelivery_is_stored_once(self):
+        for _ in range(2):
+            self.assertEqual(self.deliver("payment.captured", "evt_1").status_code, 200)
+
+        self.assertEqual(list(WebhookEvent.objects.values_list("event_id", "status")), [("evt_1", "PENDING")])
+        self.assertEqual(BackgroundJob.objects.filter(name="core.task.drain_webhook_events").count(), 1)
+
+    def test_drain_applies_captures_once(self):
+        self.deliver("payment.captured", "evt_captured")
+        self.deliver("order.paid", "evt_paid")
+        self.deliver("refund.created", "evt_other")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(paymentHandler.process_webhook_events(batch_size=2), 3)
+
+        self.assertEqual(
+            dict(WebhookEvent.objects.values_list("event_id", "status")),
+            {"evt_captured": "PROCESSED", "evt_paid": "PROCESSED", "evt_other": "IGNORED"},
+        )
+        self.assertEqual(Payment.objects.get().status, "PAID")
+        self.assertTrue(PlayerRegistration.objects.get().is_compleated)
+        self.send_success_email.assert_called_once()
+
+
+class SeedDataTests(RegistrationTestCase):
+    """seed_data fills a Load Test season with rupee payments, and --cleanup removes only what it made."""
+
+    def seed(self, *args):
+        call_command("seed_data", "--users", "40", "--random-seed", "7", "--prefix", "seedtest", *args, stdout=io.StringIO())
+
+    def test_seeded_season_and_payments(self):
+        self.seed("--current")
+
+        season = Season.objects.get(title="Load Test")
+        registrations = PlayerRegistration.objects.filter(season=season)
+        self.assertEqual(User.objects.filter(username__startswith="seedtest").count(), 40)
+        self.assertEqual(GeneralSettings.objects.get().current_season, season)
+        # Amounts are stored in rupees, like the season fee
+        self.assertEqual(set(Payment.objects.filter(registration__season=season).values_list("amount", flat=True)), {499})
+        self.assertEqual(
+            set(registrations.filter(is_compleated=True).values_list("id", flat=True)),
+            set(Payment.objects.filter(registration__season=season, status="PAID").values_list("registration_id", flat=True)),
+        )
+        reg_ids = list(registrations.values_list("reg_id", flat=True))
+        self.assertEqual(len(reg_ids), len(set(reg_ids)))
+
+    def test_cleanup(self):
+        self.seed("--current")
+        self.register(status="PAID")
+
+        self.seed("--cleanup")
+
+        self.assertFalse(Season.objects.filter(title="Load Test").exists())
+        self.assertFalse(User.objects.filter(username__startswith="seedtest").exists())
+        self.assertIsNone(GeneralSettings.objects.get().current_season)
+        self.assertEqual(PlayerRegistration.objects.get().season, self.season)
+        self.assertTrue(Payment.objects.filter(status="PAID").exists())
+
+
+class StaleJobTests(TestCase):
+    def test_requeue_only_jobs_with_attempts_left(self):
+        stale = timezone.now() - datetime.timedelta(minutes=10)
+        retry, exhausted, alive = (
+            BackgroundJob.objects.create(
+                name="core.task.success_email_job", status="RUNNING", attempts=attempts, max_attempts=3,
+                heartbeat_at=heartbeat_at, locked_by="gone:1",
+            )
+            for attempts, heartbeat_at in ((1, stale), (3, stale), (3, timezone.now()))
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(timeout=300), 1)
+
+        statuses = dict(BackgroundJob.objects.values_list("id", "status"))
+        self.assertEqual(statuses, {retry.id: "QUEUED", exhausted.id: "FAILED", alive.id: "RUNNING"})
+
+
+class Exploding:
+    def name(self):
+        raise ValueError("cannot render this one")
+
+    def __str__(self):
+        return "exploding"
+
+
+class BulkRendererTests(TestCase):
+    """A batch template is parsed once and identical contexts are rendered once."""
+
+    def test_compiled_once_and_cached(self):
+        with mock.patch.object(
+            Template, "compile_nodelist", autospec=True, side_effect=Template.compile_nodelist,
+        ) as compile_nodelist:
+            renderer = rendering.BulkRenderer.from_string("<p>Hi {{ name }}</p>", cache_size=2)
+            html = list(renderer.stream([{"name": "A"}, {"name": "B"}, {"name": "A"}, {"name": "C"}]))
+
+        self.assertEqual(html, ["<p>Hi A</p>", "<p>Hi B</p>", "<p>Hi A</p>", "<p>Hi C</p>"])
+        self.assertEqual(compile_nodelist.call_count, 1)
+        self.assertEqual(renderer.stats()["cache_hits"], 1)
+        # The cache holds cache_size entries and evicts the least recently used (B)
+        self.assertEqual(renderer.render({"name": "B"}), "<p>Hi B</p>")
+        self.assertEqual((renderer.cache_hits, len(renderer._cache)), (1, 2))
+
+    def test_failed_context_does_not_stop_the_batch(self):
+        renderer = rendering.BulkRenderer.from_string("{{ player.name }}")
+
+        html = list(renderer.stream([{"player": {"name": "A"}}, {"player": Exploding()}, {"player": {"name": "C"}}]))
+
+        self.assertEqual((html[0], html[2]), ("A", "C"))
+        self.assertIsInstance(html[1], rendering.RenderError)
+        self.assertIn("cannot render this one", str(html[1]))
+        self.assertEqual(renderer.stats()["render_errors"], 1)
+
+
+class StopWaiting(Exception):
+    pass
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class SMTPPoolTests(TestCase):
+    """Batches reuse a few long-lived connections and are paced by a token bucket."""
+
+    def setUp(self):
+        opened = mock.patch.object(mailer, "get_connection", wraps=mailer.get_connection)
+        self.get_connection = opened.start()
+        self.addCleanup(opened.stop)
+
+    def message(self, n=0):
+        return EmailMessage("Hi", "Body", "tspl@example.com", [f"player{n}@example.com"])
+
+    @override_settings(EMAIL_POOL_SIZE=2, EMAIL_CHUNK_SIZE=5)
+    def test_batch_shares_the_pool(self):
+        engine = [
+            mock.patch.object(mailer, "_pool", None),
+            mock.patch.object(mailer, "_bucket", mailer.TokenBucket(60000, 1000)),
+        ]
+        for patch in engine:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        report = mailer.deliver(range(25), self.message)
+
+        self.assertEqual((report.sent, report.failed), (25, 0))
+        self.assertEqual(len(mail.outbox), 25)
+        self.assertLessEqual(self.get_connection.call_count, 2)
+
+    def send(self, pool, count):
+        for n in range(count):
+            with pool.connection() as conn:
+                conn.send(self.message(n))
+
+    def test_connections_are_recycled(self):
+        self.send(mailer.SMTPConnectionPool(size=1, max_messages=2, idle_timeout=60), 5)
+        self.assertEqual(self.get_connection.call_count, 3)
+
+    def test_idle_connections_are_replaced(self):
+        self.send(mailer.SMTPConnectionPool(size=1, max_messages=100, idle_timeout=0), 3)
+        self.assertEqual(self.get_connection.call_count, 3)
+
+    def test_failed_connection_is_dropped(self):
+        pool = mailer.SMTPConnectionPool(size=1, max_messages=100, idle_timeout=60)
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            with pool.connection():
+                raise smtplib.SMTPServerDisconnected("gone")
+        self.send(pool, 2)
+        self.assertEqual(self.get_connection.call_count, 2)
+
+    def test_bucket_allows_a_burst_then_waits(self):
+        bucket = mailer.TokenBucket(rate_per_minute=60, burst=3)
+        with mock.patch.object(mailer.time, "sleep", side_effect=StopWaiting) as sleep:
+            for _ in range(3):
+                bucket.acquire()
+            sleep.assert_not_called()
+            with self.assertRaises(StopWaiting):
+                bucket.acquire()
+        self.assertAlmostEqual(sleep.call_args.args[0], 1.0, delta=0.1)
+
+    def test_bucket_slows_down_and_recovers(self):
+        bucket = mailer.TokenBucket(rate_per_minute=60, burst=3)
+        for _ in range(10):
+            bucket.throttle()
+        self.assertEqual(bucket.rate, bucket.max_rate / 16)
+
+        for _ in range(100):
+            bucket.recover()
+        self.assertEqual(bucket.rate, bucket.max_rate)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class FastMailTestCase(TestCase):
+    """Sends go to the locmem outbox through a fresh pool, without pacing."""
+
+    def setUp(self):
+        engine = [
+            mock.patch.object(mailer, "_pool", None),
+            mock.patch.object(mailer, "_bucket", mailer.TokenBucket(60000, 1000)),
+        ]
+        for patch in engine:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(mailer.get_circuit_breaker().reset)
+
+    def refuse(self, *addresses, code=550):
+        """Make the SMTP server refuse `addresses` with `code`; other recipients go through."""
+        send = mailer.PooledConnection.send
+
+        def refusing(conn, message):
+            refused = [address for address in message.to if address in addresses]
+            if refused:
+                raise smtplib.SMTPRecipientsRefused({address: (code, b"5.1.1 No such user") for address in refused})
+            return send(conn, message)
+
+        patch = mock.patch.object(mailer.PooledConnection, "send", autospec=True, side_effect=refusing)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+
+class OutboxTests(FastMailTestCase):
+    """Campaign rows are claimed in chunks and keep their own delivery state."""
+
+    def create(self, count=4):
+        recipients = [{"to_email": f"player{n}@example.com", "context": {"name": f"P{n}"}} for n in range(count)]
+        return outbox.create_campaign("CUSTOM", "Notice", recipients, html_template="<p>Hi {{ name }}</p>")
+
+    def test_claims_do_not_overlap(self):
+        campaign = self.create()
+
+        first = outbox.claim_outbox(campaign.id, 3, "worker-a")
+        second = outbox.claim_outbox(campaign.id, 3, "worker-b")
+
+        self.assertEqual((len(first), len(second)), (3, 1))
+        self.assertFalse({row.id for row in first} & {row.id for row in second})
+        self.assertEqual(outbox.claim_outbox(campaign.id, 3, "worker-c"), [])
+
+    def test_delivery_state_per_recipient(self):
+        campaign = self.create()
+        self.refuse("player2@example.com")
+
+        outbox.send_campaign(campaign.id)
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent, campaign.failed), ("DONE", 3, 1))
+        failed = campaign.emails.get(status="FAILED")
+        self.assertEqual(failed.to_email, "player2@example.com")
+        self.assertIn("No such user", failed.last_error)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            "player0@example.com", "player1@example.com", "player3@example.com",
+        ])
+        self.assertIn("<p>Hi P0</p>", mail.outbox[0].alternatives[0][0])
+
+    def test_abandoned_claims_are_resumed(self):
+        campaign = self.create()
+        # A worker died after claiming two rows; another one is still inside its claim timeout
+        abandoned = timezone.now() - datetime.timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT + 1)
+        rows = list(campaign.emails.order_by("id"))
+        OutboxEmail.objects.filter(id__in=[rows[0].id, rows[1].id]).update(
+            status="SENDING", claimed_by="dead", claimed_at=abandoned, attempts=1,
+        )
+        OutboxEmail.objects.filter(id=rows[2].id).update(status="SENDING", claimed_by="alive", claimed_at=timezone.now())
+
+        outbox.send_campaign(campaign.id)
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent), ("SENDING", 3))
+        self.assertEqual(
+            dict(campaign.emails.values_list("id", "status")),
+            {rows[0].id: "SENT", rows[1].id: "SENT", rows[2].id: "SENDING", rows[3].id: "SENT"},
+        )
+        self.assertEqual(OutboxEmail.objects.get(id=rows[0].id).attempts, 2)
+
+
+class BulkMailAudienceTests(FastMailTestCase, RegistrationTestCase):
+    """send_bulk_mail stores no recipients in the request; the job selects them once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        User.objects.create_user("no-email", "", "player")
+
+    def test_recipients_are_selected_by_the_job(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("con_send_bulk_mail"), {
+            "subject": "Season news",
+            "email_html": "<p>Hi {{ username }}, {{ season_title }} costs {{ amount }}</p>",
+        })
+
+        campaign = EmailCampaign.objects.get()
+        self.assertRedirects(response, reverse("con_campaign_detail", args=[campaign.id]), fetch_redirect_response=False)
+        self.assertEqual((campaign.audience, campaign.total, campaign.emails.count()), ("ALL_USERS", 0, 0))
+
+        self.assertTrue(jobs.run_job(campaign.job))
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.total, campaign.sent), ("DONE", 2, 2))
+        bodies = {message.to[0]: message.alternatives[0][0] for message in mail.outbox}
+        self.assertEqual(set(bodies), {"admin@example.com", "player@example.com"})
+        self.assertEqual(bodies["player@example.com"], "<p>Hi player@example.com, Test Season costs 499</p>")
+        # A resumed run does not select the audience a second time
+        self.assertEqual(outbox.select_audience(campaign.id), 0)
+
+
+class SuccessMailCampaignTests(FastMailTestCase, RegistrationTestCase):
+    """trigger_mail queues one campaign; Mail Sent follows delivery, and failed rows can be retried."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.delivered = cls.register(status="PAID")
+        user = User.objects.create_user("bounce@example.com", "bounce@example.com", "player")
+        cls.bounced = cls.register(user=user, email="bounce@example.com", adhar_card="234567890124", is_compleated=True)
+        Payment.objects.create(
+            user=user, registration=cls.bounced, amount=cls.season.amount, status="PAID", recpt_id="rcpt_bounce",
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def detail_action(self, campaign, action):
+        return self.client.post(reverse("con_campaign_detail", args=[campaign.id]), {"action": action})
+
+    def test_mail_sent_follows_delivery(self):
+        self.refuse("bounce@example.com")
+        self.client.post(
+            f"{reverse('con_trigger_mail')}?season_id={self.season.id}",
+            {"selected_ids": [self.delivered.id, self.bounced.id]},
+        )
+
+        campaign = EmailCampaign.objects.get()
+        self.assertEqual((campaign.kind, campaign.total), ("REGISTRATION_SUCCESS", 2))
+        # Nothing is marked before the job delivers the mail
+        self.assertFalse(PlayerRegistration.objects.filter(is_mail_sent=True).exists())
+
+        self.assertTrue(jobs.run_job(campaign.job))
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.sent, campaign.failed), (1, 1))
+        self.assertEqual(
+            dict(PlayerRegistration.objects.values_list("id", "is_mail_sent")),
+            {self.delivered.id: True, self.bounced.id: False},
+        )
+
+    def test_retry_failed_queues_a_new_job(self):
+        campaign = outbox.create_campaign("REGISTRATION_SUCCESS", "Done", [
+            {"to_email": "bounce@example.com", "context": {"registration_id": self.bounced.id}},
+        ], text_template="Hi")
+        OutboxEmail.objects.filter(campaign=campaign).update(status="FAILED", last_error="550")
+        EmailCampaign.objects.filter(id=campaign.id).update(status="DONE", failed=1)
+
+        self.detail_action(campaign, "retry_failed")
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.failed), ("QUEUED", 0))
+        self.assertEqual(campaign.job.status, "QUEUED")
+        # While that job is queued, resume does not add a second one
+        self.detail_action(campaign, "resume")
+        self.assertEqual(BackgroundJob.objects.filter(name="core.task.send_campaign_job").count(), 1)
+
+        self.assertTrue(jobs.run_job(campaign.job))
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent), ("DONE", 1))
+        self.assertTrue(PlayerRegistration.objects.get(id=self.bounced.id).is_mail_sent)
+
+    def test_paused_campaign_is_resumed(self):
+        campaign = outbox.create_campaign("CUSTOM", "Notice", [
+            {"to_email": "player@example.com", "context": {}},
+        ], html_template="<p>Hi</p>")
+        EmailCampaign.objects.filter(id=campaign.id).update(status="PAUSED", error="535 Authentication failed")
+
+        self.detail_action(campaign, "resume")
+
+        campaign.refresh_from_db()
+        self.assertTrue(jobs.run_job(campaign.job))
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent), ("DONE", 1))
+        self.assertEqual([message.to for message in mail.outbox], [["player@example.com"]])
+
+
+class MailFailureTests(FastMailTestCase):
+    """Failures are classified; throttling trips the shared circuit breaker and slows the bucket."""
+
+    def test_classification(self):
+        cases = [
+            (smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no user")}), mailer.PERMANENT),
+            (smtplib.SMTPRecipientsRefused({"a@example.com": (550, b""), "b@example.com": (451, b"")}), mailer.TRANSIENT),
+            (smtplib.SMTPAuthenticationError(535, b"5.7.8 Bad credentials"), mailer.AUTH),
+            (smtplib.SMTPDataError(421, b"4.7.0 Try again later"), mailer.THROTTLED),
+            (smtplib.SMTPDataError(550, b"5.4.5 Daily sending quota exceeded"), mailer.THROTTLED),
+            (smtplib.SMTPDataError(554, b"5.7.1 Message rejected"), mailer.PERMANENT),
+            (smtplib.SMTPServerDisconnected("Connection unexpectedly closed"), mailer.TRANSIENT),
+            (socket.timeout("timed out"), mailer.TRANSIENT),
+            (ValueError("bad header"), mailer.PERMANENT),
+        ]
+        for error, kind in cases:
+            with self.subTest(error=error):
+                self.assertEqual(mailer.classify_smtp_error(error), kind)
+
+        policy = mailer.RetryPolicy(max_attempts=3)
+        self.assertEqual(
+            [policy.should_retry(kind, 1) for kind in (mailer.TRANSIENT, mailer.THROTTLED, mailer.PERMANENT, mailer.AUTH)],
+            [True, True, False, False],
+        )
+        self.assertFalse(policy.should_retry(mailer.TRANSIENT, 3))
+
+    def test_breaker_pause_doubles_up_to_the_cap(self):
+        breaker = mailer.CircuitBreaker(base_pause=15, max_pause=50)
+        self.addCleanup(breaker.reset)
+
+        self.assertEqual([breaker.trip() for _ in range(4)], [15, 30, 50, 50])
+        self.assertGreater(breaker.cache.get(breaker.OPEN_KEY), time.time() + 45)
+
+    def test_half_open_circuit_lets_one_probe_through(self):
+        breaker = mailer.CircuitBreaker(base_pause=0, max_pause=0)
+        breaker.trip()
+
+        self.assertTrue(breaker.wait())
+        with mock.patch.object(mailer.time, "sleep", side_effect=StopWaiting):
+            with self.assertRaises(StopWaiting):
+                breaker.wait()
+        breaker.reset()
+        self.assertFalse(breaker.wait())
+
+    def test_throttled_send_trips_the_breaker_and_is_retried(self):
+        breaker = mailer.CircuitBreaker(base_pause=0, max_pause=0)
+        breaker_patch = mock.patch.object(mailer, "_breaker", breaker)
+        breaker_patch.start()
+        self.addCleanup(breaker_patch.stop)
+        send = mailer.PooledConnection.send
+        replies = iter([smtplib.SMTPDataError(421, b"4.7.0 Try again later")])
+
+        def throttled_once(conn, message):
+            error = next(replies, None)
+            if error is not None:
+                raise error
+            return send(conn, message)
+
+        with mock.patch.object(mailer.PooledConnection, "send", autospec=True, side_effect=throttled_once), \
+                mock.patch.object(breaker, "trip", wraps=breaker.trip) as trip:
+            report = mailer.deliver(range(3), lambda n: EmailMessage("Hi", "Body", "tspl@example.com", [f"p{n}@example.com"]))
+
+        self.assertEqual((report.sent, report.failed, report.rate_limited), (3, 0, 1))
+        trip.assert_called_once_with()
+        self.assertLess(mailer.get_rate_limiter().rate, mailer.get_rate_limiter().max_rate)
+        # The successful probe closed the circuit again
+        self.assertIsNone(breaker.cache.get(breaker.TRIPS_KEY))
+
+    def test_permanent_failure_is_not_retried(self):
+        self.refuse("player@example.com")
+        message = EmailMessage("Hi", "Body", "tspl@example.com", ["player@example.com"])
+
+        self.assertFalse(mailer.send_message(message))
+        self.assertEqual(mailer.PooledConnection.send.call_count, 1)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class MailAuthFailureTests(TestCase):
+    """Bad SMTP credentials pause the campaign instead of failing every recipient."""
+
+    def setUp(self):
+        patch = mock.patch.object(
+            mailer.PooledConnection, "send", side_effect=smtplib.SMTPAuthenticationError(535, b"5.7.8 Bad credentials"),
+        )
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(mailer.get_circuit_breaker().reset)
+
+    def test_campaign_is_paused_with_rows_pending(self):
+        recipients = [{"to_email": f"player{i}@example.com"} for i in range(5)]
+        campaign = outbox.create_campaign("CUSTOM", "Notice", recipients, html_template="<p>Hi</p>")
+
+        result = outbox.send_campaign(campaign.id)
+
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.sent, campaign.failed), ("PAUSED", 0, 0))
+        self.assertIn("Bad credentials", campaign.error)
+        self.assertIn("paused", result)
+        self.assertEqual(
+            set(campaign.emails.values_list("status", "attempts", "claimed_by")), {("PENDING", 0, "")},
+        )
+
+    def test_single_message_raises_for_a_retry(self):
+        with self.assertRaises(smtplib.SMTPAuthenticationError):
+            mailer.send_message(EmailMessage("Hi", "Body", "tspl@example.com", ["player@example.com"]))
+
+
+@override_settings(METRICS_TOKEN="scrape-token", REQUEST_METRICS_CACHE_ALIAS=None)
+class MetricsTests(TestCase):
+    def test_job_smtp_cost_is_recorded(self):
+        sent = mock.patch.object(mailer, "_deliver_chunk", side_effect=self.fake_delivery)
+        with sent:
+            jobs.run_job(jobs.enqueue_job("core.tests.deliver_one", "email"))
+
+        values = metrics.registry.snapshot()
+        labels = (("job", "core.tests.deliver_one"), ("service", "smtp"))
+        self.assertGreaterEqual(values[("tspl_job_external_calls_total", labels)], 1)
+        self.assertGreaterEqual(values[("tspl_job_runs_total", (labels[0], ("status", "done")))], 1)
+
+    @staticmethod
+    def fake_delivery(chunk, report):
+        # Runs in a mail sender thread, like a real SMTP send
+        for item, message in chunk:
+            with metrics.external("smtp"):
+                report.add_sent(item)
+
+    def test_metrics_need_a_superuser_or_the_token(self):
+        url = reverse("con_metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user("player@example.com", "player@example.com", "player"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        scrape = reverse("con_metrics_scrape")
+        self.assertEqual(self.client.get(scrape, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        response = self.client.get(scrape, HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertContains(response, "tspl_requests_total")
+
+
+def deliver_one():
+    """Job body for MetricsTests: one message through mailer.deliver."""
+    return mailer.deliver([1], lambda item: EmailMessage("Hi", "Body", "tspl@example.com", ["player@example.com"])).sent
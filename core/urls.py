@@ -13,7 +13,10 @@ urlpatterns = [
 urlpatterns += [
     path("form/<int:id>",views.register_form,name='register_form'),
     path("paymenthandler/<int:id>", views.payment_handler, name="payment_handler"),
+    path("paymenthandler/<int:id>/order", views.payment_order_status, name="payment_order_status"),
+    path("razorpay/webhook", views.razorpay_webhook, name="razorpay_webhook"),
 
     path("res",views.player_result,name="player_result"),
     path("res.all",views.allResults,name="allResults"),
+    path("res.all.json",views.allResultsApi,name="allResultsApi"),
 ]
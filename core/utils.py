@@ -1,12 +1,130 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+
 from .models import GeneralSettings
 import logging
 
 logger = logging.getLogger('core')
 
-def get_general_settings():
+GENERAL_SETTINGS_CACHE_KEY = "core:general_settings"
+GENERAL_SETTINGS_VERSION_KEY = "core:general_settings:version"
+
+# Per-process copy of the settings row, refreshed after the TTL or on invalidation
+_settings_lock = threading.Lock()
+_settings_cache = {
+    "value": None,
+    "version": uuid.uuid4().hex,
+    "expires_at": 0.0,
+}
+_settings_stats = {
+    "hits": 0,
+    "misses": 0,
+    "shared_hits": 0,
+    "invalidations": 0,
+}
+
+
+def _shared_cache():
+    """Return the configured Django cache used to share settings between workers, or None."""
+    alias = getattr(django_settings, "GENERAL_SETTINGS_CACHE_ALIAS", None)
+    if not alias:
+        return None
     try:
-        settings = GeneralSettings.objects.first()
-        return settings
-    except GeneralSettings.DoesNotExist:
-        logging.error("GeneralSettings does not exist.")
-        return None
\ No newline at end of file
+        return caches[alias]
+    except Exception as e:
+        logger.error(f"General settings cache '{alias}' unavailable: {e}")
+        return None
+
+
+def _cache_ttl():
+    return getattr(django_settings, "GENERAL_SETTINGS_CACHE_TTL", 60)
+
+
+def _load_general_settings():
+    return GeneralSettings.objects.select_related("current_season").first()
+
+
+def get_general_settings_version():
+    """Return a token that changes every time the general settings are invalidated."""
+    shared = _shared_cache()
+    if shared is not None:
+        version = shared.get(GENERAL_SETTINGS_VERSION_KEY)
+        if version is None:
+            version = _settings_cache["version"]
+            shared.add(GENERAL_SETTINGS_VERSION_KEY, version, None)
+        return version
+    return _settings_cache["version"]
+
+
+def get_general_settings():
+    now = time.monotonic()
+    version = get_general_settings_version()
+
+    with _settings_lock:
+        if (
+            _settings_cache["expires_at"] > now
+            and _settings_cache["version"] == version
+        ):
+            _settings_stats["hits"] += 1
+            return _settings_cache["value"]
+
+    shared = _shared_cache()
+    settings = None
+    found = False
+    if shared is not None:
+        cached = shared.get(f"{GENERAL_SETTINGS_CACHE_KEY}:{version}")
+        if cached is not None:
+            settings = cached.get("value")
+            found = True
+
+    if not found:
+        try:
+            settings = _load_general_settings()
+        except Exception as e:
+            logger.error(f"Failed to load GeneralSettings: {e}")
+            return None
+        if settings is None:
+            logger.error("GeneralSettings does not exist.")
+        if shared is not None:
+            shared.set(f"{GENERAL_SETTINGS_CACHE_KEY}:{version}", {"value": settings}, _cache_ttl())
+
+    with _settings_lock:
+        if found:
+            _settings_stats["shared_hits"] += 1
+        else:
+            _settings_stats["misses"] += 1
+        # Don't overwrite a newer local invalidation with what we just read
+        if shared is None and _settings_cache["version"] != version:
+            return settings
+        _settings_cache["value"] = settings
+        _settings_cache["version"] = version
+        _settings_cache["expires_at"] = now + _cache_ttl()
+    return settings
+
+
+def invalidate_general_settings():
+    """Drop the cached settings in this process and bump the shared version."""
+    new_version = uuid.uuid4().hex
+    with _settings_lock:
+        _settings_cache["value"] = None
+        _settings_cache["version"] = new_version
+        _settings_cache["expires_at"] = 0.0
+        _settings_stats["invalidations"] += 1
+
+    shared = _shared_cache()
+    if shared is not None:
+        shared.set(GENERAL_SETTINGS_VERSION_KEY, new_version, None)
+    logger.info("General settings cache invalidated")
+
+
+def get_general_settings_cache_stats():
+    """Return a snapshot of the settings cache hit/miss counters."""
+    with _settings_lock:
+        stats = dict(_settings_stats)
+    lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+    stats["hit_ratio"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+    return stats
@@ -1,4 +1,8 @@
 from django.shortcuts import render,redirect,HttpResponse 
+from django.http import JsonResponse
+from django.conf import settings as django_settings
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from .forms import PlayerRegistrationForm, LoginForm, RegisterForm, PlayerRegistration
 from django.contrib.auth.decorators import login_required
 from django.contrib.messages import success,warning,error
@@ -6,11 +10,18 @@ from django.contrib.auth import logout,login
 from django.views.decorators.csrf import csrf_exempt
 from .models import PlayerRegistration, Season, Payment
 from .utils import get_general_settings
-from .task import send_success_email
+from .registration import load_registration_state, PAYMENT_NONE, PAYMENT_FAILED, PAYMENT_PENDING
+from .task import submit_webhook_processing
+import json
+import hashlib
 import logging
 from . import paymentHandler
 logger = logging.getLogger('core')
 
+RESULTS_PAGE_SIZE = 50
+RESULTS_MAX_PAGE_SIZE = 200
+RESULTS_FIELDS = ("reg_id", "player_name", "father_name", "zone", "district", "role", "points")
+
 def index(request):
     settings = get_general_settings()
     context = {
@@ -19,6 +30,40 @@ def index(request):
     return render(request, 'core/index.html', context= context)
 
 
+def _render_payment_page(request, payment, season, settings):
+    return render(request, "core/payment.html", {
+        "payment": payment,
+        "season": season,
+        "settings": settings,
+        "razorpay_key": settings.razorpay_key_id,
+        "callback_url": settings.callback_url,
+    })
+
+
+def _start_payment(request, user, registration, season, settings):
+    """Reuse the open Razorpay order for the registration (or create one) and show the payment page."""
+    payment, err = paymentHandler.get_or_create_pending_payment(
+        user, registration, season.amount,
+        defer=getattr(django_settings, "RAZORPAY_ASYNC_ORDERS", False),
+    )
+    if err:
+        error(request, f"Failed to create Razorpay order: {err}")
+        return redirect("index")
+
+    return _render_payment_page(request, payment, season, settings)
+
+
+def _render_success_page(request, payment, registration, settings):
+    return render(request, "core/success.html", {
+        "settings": settings,
+        "id": payment.payment_id,
+        "reg_id": registration.reg_id,
+        "order_id": payment.order_id,
+        "amount": payment.amount,
+        "zone": registration.zone,
+    })
+
+
 @login_required
 def register_form(request, id):
     user = request.user
@@ -30,78 +75,37 @@ def register_form(request, id):
         return redirect('index')
 
     # Ensure season exists
-    try:
-        season = Season.objects.get(id=id)
-        if not season.accept_response or not settings.enable_registration:
-            warning(request, "Registrations are closed currently.")
-            return redirect('index')
-    except Season.DoesNotExist:
+    state = load_registration_state(user, id)
+    if state is None:
         error(request, "Season does not exist.")
         return redirect('index')
 
-    registration = PlayerRegistration.objects.filter(season=season, user=user).first()
-    last_registration = PlayerRegistration.objects.filter(user=user).exclude(season=season).order_by('-created').first()
+    season = state.season
+    if not season.accept_response or not settings.enable_registration:
+        warning(request, "Registrations are closed currently.")
+        return redirect('index')
+
+    registration = state.registration
+    payment = state.payment
 
     # ----------------------------
     # CASE 1: USER ALREADY REGISTERED
     # ----------------------------
-    if registration:
+    if state.is_registered:
         if season.registration_form_editable:
             if request.method == "POST":
-                payment = Payment.objects.filter(user=user, registration=registration).first()
                 form = PlayerRegistrationForm(request.POST, request.FILES, instance=registration)
                 if form.is_valid():
                     registration = form.save()
-                    if payment and (payment.is_compleated and payment.status == 'PAID' and registration.is_compleated):
+                    if state.is_paid:
                         success(request, "Details Updated")
-                        return render(request, "core/success.html", {
-                            "settings": settings,
-                            "id": payment.payment_id,
-                            "reg_id": registration.reg_id,
-                            "order_id": payment.order_id,
-                            "amount": payment.amount,
-                            "zone": registration.zone,
-                        })
-
-                    if payment and payment.status == 'FAILED':
-                        payment, err = paymentHandler.create_payment_for_registration(
-                            user, registration, season.amount
-                        )
-                        if err:
-                            error(request, f"Failed to create Razorpay order: {err}")
-                            return redirect("index")
-
-                        return render(request, "core/payment.html", {
-                            "payment": payment,
-                            "settings": settings,
-                            "season": season,
-                            "razorpay_key": settings.razorpay_key_id,
-                            "callback_url": settings.callback_url,
-                        })
-
-                    if payment and not payment.is_compleated:
-                        return render(request, "core/payment.html", {
-                            "payment": payment,
-                            "settings": settings,
-                            "season": season,
-                            "razorpay_key": settings.razorpay_key_id,
-                            "callback_url": settings.callback_url,
-                        })
-
-                    payment, err = paymentHandler.create_payment_for_registration(
-                        user, registration, season.amount
-                    )
-                    if err:
-                        error(request, f"Failed to create Razorpay order: {err}")
-                        return redirect("index")
-
-                    return render(request, "core/payment.html", {
-                        "payment": payment,
-                        "settings": settings,
-                        "season": season,
-                        "razorpay_key": settings.razorpay_key_id,
-                        "callback_url": settings.callback_url,
-                    })
+                        return _render_success_page(request, payment, registration, settings)
+
+                    if state.payment_state == PAYMENT_PENDING:
+                        return _render_payment_page(request, payment, season, settings)
+
+                    # No payment yet, a failed one, or a stale completed one -> new order
+                    return _start_payment(request, user, registration, season, settings)
             else:
                 form = PlayerRegistrationForm(instance=registration)
             
@@ -113,103 +117,56 @@ def register_form(request, id):
                 "edit_mode": True,
             })
 
-        else:
-            try:
-                payment = Payment.objects.filter(user=user, registration=registration).first()
-                if payment is None:
-                    raise Payment.DoesNotExist
-                # If payment failed previously, create a new one to retry
-                if payment.status == 'FAILED':
-                    payment, err = paymentHandler.create_payment_for_registration(
-                        user, registration, season.amount
-                    )
-                    if err:
-                        error(request, f"Failed to create Razorpay order: {err}")
-                        return redirect("index")
-
-                    return render(request, "core/payment.html", {
-                        "payment": payment,
-                        "settings": settings,
-                        "season": season,
-                        "razorpay_key": settings.razorpay_key_id,
-                        "callback_url": settings.callback_url,
-                    })
-
-                # If payment pending -> show the payment page
-                if not payment.is_compleated:
-                    print("Payment Pending")
-                    return render(request, "core/payment.html", {
-                        "payment": payment,
-                        "season": season,
-                        "settings": settings,
-                        "razorpay_key": settings.razorpay_key_id,
-                        "callback_url": settings.callback_url,
-                    })
-
-            except Payment.DoesNotExist:
-                payment, err = paymentHandler.create_payment_for_registration(
-                    user, registration, season.amount
-                )
-                if err:
-                    error(request, f"Failed to create Razorpay order: {err}")
-                    return redirect("index")
-
-                return render(request, "core/payment.html", {
-                    "payment": payment,
-                    "season": season,
-                    "settings": settings,
-                    "razorpay_key": settings.razorpay_key_id,
-                    "callback_url": settings.callback_url,
-                })
-
-            # If we reach here, payment exists and is completed -> render success
-            return render(request, "core/success.html", {
-                "settings": settings,
-                "id": payment.payment_id,
-                "reg_id": registration.reg_id,
-                "order_id": payment.order_id,
-                "amount": payment.amount,
-                "zone": registration.zone,
-            })
+        payment_state = state.payment_state
+
+        # No payment yet, or the previous one failed -> create a new order to retry
+        if payment_state in (PAYMENT_NONE, PAYMENT_FAILED):
+            return _start_payment(request, user, registration, season, settings)
+
+        # If payment pending -> show the payment page
+        if payment_state == PAYMENT_PENDING:
+            return _render_payment_page(request, payment, season, settings)
+
+        # Payment exists and is completed -> render success
+        return _render_success_page(request, payment, registration, settings)
 
     # ----------------------------
     # CASE 2: USER REGISTERING FOR THE FIRST TIME
     # ----------------------------
-    else:
-        form = PlayerRegistrationForm(instance=last_registration) # Pre-fill with last registration data if exists
-
-        if request.method == 'POST':
-            form = PlayerRegistrationForm(request.POST, request.FILES)
-            if form.is_valid():
-                registration = form.save(commit=False)
-                if last_registration:
-                    registration.reg_id = last_registration.reg_id
-                registration.user = user
-                registration.season = season
-                registration.save()
-
-                payment, err = paymentHandler.create_payment_for_registration(
-                    user, registration, season.amount
-                )
-                if err:
-                    error(request, f"Failed to create Razorpay order: {err}")
-                    return redirect("index")
-
-                return render(request, "core/payment.html", {
-                    "payment": payment,
-                    "season": season,
-                    "settings": settings,
-                    
-                    "razorpay_key": settings.razorpay_key_id,
-                    "callback_url": settings.callback_url,
-                })
-
-        return render(request, 'core/form.html', {
-            'form': form,
-            "settings": settings,
-            'season': season,
-            'edit_mode': False,
-        })
+    last_registration = state.last_registration
+    form = PlayerRegistrationForm(instance=last_registration) # Pre-fill with last registration data if exists
+
+    if request.method == 'POST':
+        form = PlayerRegistrationForm(request.POST, request.FILES)
+        if form.is_valid():
+            registration = form.save(commit=False)
+            if last_registration:
+                registration.reg_id = last_registration.reg_id
+            registration.user = user
+            registration.season = season
+            registration.save()
+
+            return _start_payment(request, user, registration, season, settings)
+
+    return render(request, 'core/form.html', {
+        'form': form,
+        "settings": settings,
+        'season': season,
+        'edit_mode': False,
+    })
+
+
+@login_required
+def payment_order_status(request, id):
+    """Polled by the payment page while the Razorpay order is created in the background."""
+    payment = Payment.objects.filter(id=id, user=request.user).only("status", "order_id").first()
+    if payment is None:
+        return JsonResponse({"error": "Invalid Payment"}, status=404)
+
+    return JsonResponse({
+        "status": payment.status,
+        "order_id": payment.order_id,
+    })
 
 
 @csrf_exempt
@@ -228,27 +185,25 @@ def payment_handler(request, id):
     except Payment.DoesNotExist:
         return HttpResponse("Invalid Registration")
     
-    registration = payment.registration
     payment_id = request.POST.get("razorpay_payment_id")
     order_id = request.POST.get("razorpay_order_id")
     signature = request.POST.get("razorpay_signature")
 
     if not payment_id or not order_id or not signature:
-        payment.status = "FAILED"
-        payment.save()
+        paymentHandler.handle_failed_capture(payment)
         return render(request, "core/paymentfail.html", {"message": "Missing payment details.", "settings":settings})
 
     payment_details, err = paymentHandler.verify_payment_signature_and_fetch(
         payment_id, order_id, signature
     )
     if err:
-        payment.status = "FAILED"
-        payment.save()
+        paymentHandler.handle_failed_capture(payment)
         return render(request, "core/paymentfail.html", {"message": err, "settings":settings})
 
+    # Only these fields: a full save could overwrite a PAID status the webhook wrote meanwhile
     payment.payment_id = payment_id
     payment.signature = signature
-    payment.save()
+    payment.save(update_fields=["payment_id", "signature"])
 
     status = payment_details.get("status")
 
@@ -256,7 +211,8 @@ def payment_handler(request, id):
     #       SUCCESS CASE
     # --------------------------------------------
     if status == "captured":
-        registration = paymentHandler.handle_successful_capture(payment, payment_details)
+        # Queues the success mail only if this request moved the payment to PAID
+        registration, _ = paymentHandler.handle_successful_capture(payment, payment_details)
 
         context = {
             "id": payment_id,
@@ -267,26 +223,34 @@ def payment_handler(request, id):
             "settings": settings
         
         }
-
-        try:
-            send_success_email(
-                subject="Registration Completed",
-                to=registration.user.email,
-                context=context
-            )
-            registration.is_mail_sent = True
-            registration.is_compleated = True
-            registration.save()
-        except:
-            pass
-
         return render(request, "core/success.html", context)
 
     else:
         reason = payment_details.get("error_description", "Payment failed.")
-        payment.status = "FAILED"
-        payment.save()
-        return render(request, "core/core/paymentfail.html", {"message": reason, "settings": settings})
+        paymentHandler.handle_failed_capture(payment)
+        return render(request, "core/paymentfail.html", {"message": reason, "settings": settings})
+
+
+@csrf_exempt
+def razorpay_webhook(request):
+    """Receive Razorpay webhooks: verify the HMAC, store the event and return at once."""
+    if request.method != "POST":
+        return HttpResponse("Invalid Request Method", status=405)
+
+    signature = request.headers.get("X-Razorpay-Signature")
+    if not paymentHandler.verify_webhook_signature(request.body, signature):
+        logger.warning("Rejected Razorpay webhook with invalid signature")
+        return HttpResponse("Invalid Signature", status=400)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return HttpResponse("Invalid Payload", status=400)
+
+    event_id = request.headers.get("X-Razorpay-Event-Id") or hashlib.sha256(request.body).hexdigest()
+    paymentHandler.record_webhook_event(event_id, payload)
+    submit_webhook_processing()
+    return HttpResponse("OK")
 
 
 def allResults(request):
@@ -295,12 +259,75 @@ def allResults(request):
         return HttpResponse("Now Allowed", status=403)
     
     context = {
-        "selected" : PlayerRegistration.objects.filter(is_selected=True),
-        "notSelected" : PlayerRegistration.objects.filter(is_selected=False),
-        "settings": settings
+        "settings": settings,
+        "page_size": RESULTS_PAGE_SIZE,
     }
     return render(request,"allResults.html",context)
 
+
+def _encode_results_cursor(points, reg_id):
+    return urlsafe_base64_encode(f"{points}|{reg_id}".encode())
+
+
+def _decode_results_cursor(cursor):
+    try:
+        points, reg_id = urlsafe_base64_decode(cursor).decode().split("|", 1)
+        return int(points), reg_id
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def allResultsApi(request):
+    """Keyset-paginated results for the current season, ordered by points."""
+    settings = get_general_settings()
+    if not settings or not settings.show_points_table:
+        return JsonResponse({"error": "Now Allowed"}, status=403)
+
+    is_selected = request.GET.get("selected") == "1"
+    query = request.GET.get("q", "").strip()
+    cursor = request.GET.get("cursor")
+    try:
+        page_size = max(1, min(int(request.GET.get("size", RESULTS_PAGE_SIZE)), RESULTS_MAX_PAGE_SIZE))
+    except ValueError:
+        page_size = RESULTS_PAGE_SIZE
+
+    players = PlayerRegistration.objects.filter(
+        season=settings.current_season_id,
+        is_selected=is_selected,
+    )
+
+    if query:
+        players = players.filter(
+            Q(reg_id__icontains=query) |
+            Q(player_name__icontains=query)
+        )
+
+    if cursor:
+        position = _decode_results_cursor(cursor)
+        if position is None:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        points, reg_id = position
+        players = players.filter(
+            Q(points__lt=points) |
+            Q(points=points, reg_id__gt=reg_id)
+        )
+
+    rows = list(
+        players.order_by("-points", "reg_id")
+        .values(*RESULTS_FIELDS)[:page_size + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = _encode_results_cursor(last["points"], last["reg_id"])
+
+    return JsonResponse({
+        "results": rows,
+        "next": next_cursor,
+    })
+
 @login_required
 def player_result(request):
     settings = get_general_settings()
@@ -0,0 +1,184 @@
+import gzip
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings as django_settings
+from django.contrib.messages import get_messages
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from core.utils import get_general_settings_version
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger('core')
+
+re_accepts_br = re.compile(r"\bbr\b")
+re_accepts_gzip = re.compile(r"\bgzip\b")
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_LENGTH = 200
+
+_page_lock = threading.Lock()
+_pages = OrderedDict()
+_page_stats = {"hits": 0, "misses": 0, "not_modified": 0, "bypassed": 0}
+
+
+def _page_cache_ttl():
+    return getattr(django_settings, "PAGE_CACHE_TTL", 300)
+
+
+def _page_cache_max_entries():
+    return getattr(django_settings, "PAGE_CACHE_MAX_ENTRIES", 256)
+
+
+class CachedPage:
+    """A rendered page kept in memory together with its pre-compressed bodies."""
+
+    def __init__(self, response):
+        self.content = response.content
+        self.content_type = response["Content-Type"]
+        self.etag = '"%s"' % hashlib.md5(self.content, usedforsecurity=False).hexdigest()
+        self.last_modified = int(time.time())
+        self.expires_at = time.monotonic() + _page_cache_ttl()
+
+        self.gzip_content = None
+        self.br_content = None
+        if len(self.content) >= MIN_COMPRESS_LENGTH:
+            self.gzip_content = gzip.compress(self.content, compresslevel=6, mtime=0)
+            if brotli is not None:
+                self.br_content = brotli.compress(self.content)
+
+    def is_fresh(self):
+        return self.expires_at > time.monotonic()
+
+    def to_response(self, request):
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        content, encoding = self.content, None
+        if self.br_content is not None and re_accepts_br.search(accept_encoding):
+            content, encoding = self.br_content, "br"
+        elif self.gzip_content is not None and re_accepts_gzip.search(accept_encoding):
+            content, encoding = self.gzip_content, "gzip"
+
+        response = HttpResponse(content, content_type=self.content_type)
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["ETag"] = self.etag
+        response["Last-Modified"] = http_date(self.last_modified)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+
+def _is_cacheable_request(request):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    # Authenticated pages embed a per-user CSRF token in the header, so only the
+    # anonymous variant is shared between visitors.
+    if request.user.is_authenticated:
+        return False
+    # Flash messages are rendered into the page and consumed once
+    if len(get_messages(request)):
+        return False
+    return True
+
+
+def _is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header("Content-Encoding")
+    )
+
+
+def _get_page(key):
+    with _page_lock:
+        page = _pages.get(key)
+        if page is None:
+            return None
+        if not page.is_fresh():
+            del _pages[key]
+            return None
+        _pages.move_to_end(key)
+        return page
+
+
+def _store_page(key, page):
+    with _page_lock:
+        _pages[key] = page
+        _pages.move_to_end(key)
+        while len(_pages) > _page_cache_max_entries():
+            _pages.popitem(last=False)
+
+
+def _drop_stale_versions(version):
+    with _page_lock:
+        for key in [key for key in _pages if key[1] != version]:
+            del _pages[key]
+
+
+def cached_page(view_func):
+    """Serve the view from the in-process page cache.
+
+    Pages are keyed on path, general settings version and auth state, so any
+    GeneralSettings/Season change starts a fresh set of entries.
+    """
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not _is_cacheable_request(request):
+            with _page_lock:
+                _page_stats["bypassed"] += 1
+            return view_func(request, *args, **kwargs)
+
+        version = get_general_settings_version()
+        key = (request.path, version, "anonymous")
+
+        page = _get_page(key)
+        if page is None:
+            response = view_func(request, *args, **kwargs)
+            if not _is_cacheable_response(response):
+                return response
+            _drop_stale_versions(version)
+            page = CachedPage(response)
+            _store_page(key, page)
+            with _page_lock:
+                _page_stats["misses"] += 1
+        else:
+            with _page_lock:
+                _page_stats["hits"] += 1
+
+        not_modified = get_conditional_response(
+            request, etag=page.etag, last_modified=page.last_modified
+        )
+        if not_modified is not None:
+            with _page_lock:
+                _page_stats["not_modified"] += 1
+            patch_vary_headers(not_modified, ("Accept-Encoding",))
+            return not_modified
+
+        return page.to_response(request)
+
+    return _wrapped_view
+
+
+def clear_page_cache():
+    with _page_lock:
+        _pages.clear()
+
+
+def get_page_cache_stats():
+    """Return a snapshot of the page cache counters."""
+    with _page_lock:
+        stats = dict(_page_stats)
+        stats["entries"] = len(_pages)
+    return stats
@@ -0,0 +1,68 @@
+import gzip
+
+from django.urls import reverse
+
+from core.tests import RegistrationTestCase
+from core.utils import invalidate_general_settings
+
+from .cache import clear_page_cache, get_page_cache_stats
+
+
+class PageCacheTests(RegistrationTestCase):
+    """Anonymous visitors share one rendered copy per page and settings version."""
+
+    def setUp(self):
+        clear_page_cache()
+        self.addCleanup(clear_page_cache)
+        self.url = reverse("about")
+
+    def stats_delta(self, before):
+        after = get_page_cache_stats()
+        return {key: after[key] - before[key] for key in ("hits", "misses", "not_modified", "bypassed")}
+
+    def test_second_visit_is_served_from_memory(self):
+        before = get_page_cache_stats()
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(self.stats_delta(before), {"hits": 1, "misses": 1, "not_modified": 0, "bypassed": 0})
+
+    def test_conditional_get_gets_304(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_compressed_body(self):
+        plain = self.client.get(self.url)
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+
+    def test_settings_change_starts_a_new_entry(self):
+        self.client.get(self.url)
+        invalidate_general_settings()
+        before = get_page_cache_stats()
+
+        self.client.get(self.url)
+
+        self.assertEqual(self.stats_delta(before)["misses"], 1)
+        self.assertEqual(get_page_cache_stats()["entries"], 1)
+
+    def test_authenticated_visitors_bypass_the_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.player)
+        before = get_page_cache_stats()
+
+        response = self.client.get(self.url)
+
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(self.stats_delta(before), {"hits": 0, "misses": 0, "not_modified": 0, "bypassed": 1})
@@ -1,7 +1,9 @@
 from django.shortcuts import render,HttpResponse
 from django.template.loader import get_template
 from core.utils import get_general_settings
+from .cache import cached_page
 
+@cached_page
 def about(request):
     settings = get_general_settings()
     context = {
@@ -10,6 +12,7 @@ def about(request):
     return render(request,"staticPages/about.html", context)
 
 
+@cached_page
 def contact(request):
     settings = get_general_settings()
     context = {
@@ -18,6 +21,7 @@ def contact(request):
     return render(request,"staticPages/contactus.html",context)
 
 
+@cached_page
 def newsevents(request):
     settings = get_general_settings()
     context = {
@@ -27,6 +31,7 @@ def newsevents(request):
 
 # BLOGS
 
+@cached_page
 def commitie(request):
     settings = get_general_settings()
     context = {
@@ -35,6 +40,7 @@ def commitie(request):
     return render(request,"staticPages/blog/commitie.html",context)
 
 
+@cached_page
 def gallery(request):
     settings = get_general_settings()
     context = {
@@ -42,6 +48,7 @@ def gallery(request):
     }
     return render(request,"staticPages/blog/imagegallery.html",context)
 
+@cached_page
 def vgallery(request):
     settings = get_general_settings()
     context = {
@@ -49,6 +56,7 @@ def vgallery(request):
     }
     return render(request,"staticPages/blog/videogallery.html",context)
 
+@cached_page
 def pp(request):
     settings = get_general_settings()
     context = {
@@ -56,6 +64,7 @@ def pp(request):
     }
     return render(request,"staticPages/blog/privacy-policy.html",context)
 
+@cached_page
 def tc(request):
     settings = get_general_settings()
     context = {
@@ -64,6 +73,7 @@ def tc(request):
     return render(request,"staticPages/blog/tearms-and-condition.html",context)
 
 
+@cached_page
 def b1(request):
     settings = get_general_settings()
     context = {
@@ -71,6 +81,7 @@ def b1(request):
     }
     return render(request,"staticPages/blog/ispl-player-revealed.html",context)
 
+@cached_page
 def b2(request):
     settings = get_general_settings()
     context = {
@@ -78,6 +89,7 @@ def b2(request):
     }
     return render(request,"staticPages/blog/own-a-tspl-franchise-team.html",context)
 
+@cached_page
 def b3(request):
     settings = get_general_settings()
     context = {
@@ -85,6 +97,7 @@ def b3(request):
     }
     return render(request,"staticPages/blog/tennies-ball-cricket.html",context)
 
+@cached_page
 def b4(request):
     settings = get_general_settings()
     context = {
@@ -92,6 +105,7 @@ def b4(request):
     }
     return render(request,"staticPages/blog/tspl-t10-action.html",context)
 
+@cached_page
 def b5(request):
     settings = get_general_settings()
     context = {
@@ -100,6 +114,7 @@ def b5(request):
     return render(request,"staticPages/blog/who-can-register.html",context)
 
 
+@cached_page
 def points_table(request):
     settings = get_general_settings()
     if not settings.show_points_table:
@@ -110,12 +125,14 @@ def points_table(request):
     return render(request,'staticPages/pointstable.html', context)
 
 # SEO
+@cached_page
 def robot(request):
     template = get_template('robots.txt')
     robots_content = template.render()
     
     return HttpResponse(robots_content, content_type="text/plain")
 
+@cached_page
 def sitemap(request):
     template = get_template('sitemap.xml')
     sitemap_content = template.render()
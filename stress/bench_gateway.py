@@ -0,0 +1,72 @@
+"""Benchmark Razorpay order creation through the gateway client layer.
+
+Start the fake gateway first, then:
+
+    python stress/fake_razorpay.py --latency 0.1 &
+    RAZORPAY_BASE_URL=http://127.0.0.1:9090 python stress/bench_gateway.py -n 500 -c 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("RAZORPAY_KEY_ID", "rzp_test_fake")
+os.environ.setdefault("RAZORPAY_KEY_SECRET", "fake_secret")
+
+import django  # noqa: E402
+
+django.setup()
+
+from core import paymentHandler  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    client = paymentHandler.build_client()
+    latencies = []
+    errors = 0
+
+    def create(i):
+        started = time.perf_counter()
+        client.order.create({"amount": 100, "currency": "INR", "receipt": f"bench_{i}", "payment_capture": 1})
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(create, i) for i in range(args.requests)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print(f"All {errors} requests failed")
+        return
+    print(f"requests={args.requests} concurrency={args.concurrency} errors={errors}")
+    print(f"throughput={len(latencies) / elapsed:.1f} req/s")
+    print(
+        f"mean={statistics.mean(latencies) * 1000:.1f}ms "
+        f"p50={percentile(latencies, 50) * 1000:.1f}ms "
+        f"p95={percentile(latencies, 95) * 1000:.1f}ms "
+        f"p99={percentile(latencies, 99) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
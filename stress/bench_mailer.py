@@ -0,0 +1,85 @@
+"""Benchmark batch mail delivery through core.mailer.
+
+Start the fake SMTP sink first, then:
+
+    python stress/fake_smtp.py --port 2525 --latency 0.05 --throttle-rate 0.01 &
+    python stress/bench_mailer.py -n 500 --rate 6000
+    python stress/bench_mailer.py -n 5000 --rate 600000
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+os.environ.setdefault("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+os.environ.setdefault("EMAIL_HOST", "127.0.0.1")
+os.environ.setdefault("EMAIL_PORT", "2525")
+os.environ.setdefault("EMAIL_USE_TLS", "0")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.mail import EmailMultiAlternatives  # noqa: E402
+
+from core import mailer  # noqa: E402
+from core.rendering import BulkRenderer  # noqa: E402
+
+TEMPLATE = """
+<html><body>
+{% load static %}
+<h2>Hello {{ first_name|title }} {{ last_name }},</h2>
+<p>Registrations for {{ season_title }} ({{ year }}) are open till {{ end_date|date:"d M Y" }}.</p>
+<ul>{% for item in items %}<li>{{ forloop.counter }}. {{ item|upper }}</li>{% endfor %}</ul>
+<p>Fee: &#8377;{{ amount|floatformat:2 }}</p>
+</body></html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--messages", type=int, default=200)
+    parser.add_argument("--rate", type=int, help="Messages per minute (default: EMAIL_RATE_PER_MINUTE)")
+    parser.add_argument("--pool", type=int, help="SMTP connections (default: EMAIL_POOL_SIZE)")
+    args = parser.parse_args()
+
+    if args.rate:
+        settings.EMAIL_RATE_PER_MINUTE = args.rate
+    if args.pool:
+        settings.EMAIL_POOL_SIZE = args.pool
+
+    renderer = BulkRenderer.from_string(TEMPLATE)
+    contexts = (
+        {
+            "first_name": f"player{i}",
+            "last_name": "Kumar",
+            "season_title": "TSPL",
+            "year": 2026,
+            "end_date": "2026-12-31",
+            "amount": 499,
+            "items": ["kit", "jersey", "cap"],
+        }
+        for i in range(args.messages)
+    )
+
+    def build_message(item):
+        i, html = item
+        # Every 50th recipient is on bounce.example.com, refused by fake_smtp.py --bounce-domain
+        domain = "bounce.example.com" if i % 50 == 49 else "example.com"
+        message = EmailMultiAlternatives("Benchmark", "Plain body", "bench@example.com", [f"player{i}@{domain}"])
+        message.attach_alternative(str(html), "text/html")
+        return message
+
+    rendered = renderer.stream(contexts)
+    report = mailer.deliver(zip(range(args.messages), rendered), build_message)
+    mailer.get_connection_pool().close_all()
+    print(f"messages={args.messages} rate={settings.EMAIL_RATE_PER_MINUTE}/min pool={settings.EMAIL_POOL_SIZE}")
+    print(report)
+    print(f"render: {renderer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Minimal local stand-in for the Razorpay REST API.
+
+Run it and point the app at it with RAZORPAY_BASE_URL:
+
+    python stress/fake_razorpay.py --port 9090 --latency 0.2
+    RAZORPAY_BASE_URL=http://127.0.0.1:9090 python manage.py runserver
+
+Implements the endpoints the app uses: create/list/fetch orders and
+fetch/list payments. Every order gets a captured payment so callbacks and
+reconciliation can be exercised without the real gateway; load tests play
+the checkout step by reading it from /v1/orders/<id>/payments.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ORDERS = {}
+PAYMENTS = {}
+ORDER_PAYMENTS = {}
+LOCK = threading.Lock()
+
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:14]}"
+
+
+def create_payment_for_order(order, status="captured"):
+    payment = {
+        "id": _new_id("pay"),
+        "entity": "payment",
+        "amount": order["amount"],
+        "currency": order["currency"],
+        "status": status,
+        "order_id": order["id"],
+        "created_at": int(time.time()),
+    }
+    PAYMENTS[payment["id"]] = payment
+    ORDER_PAYMENTS.setdefault(order["id"], []).append(payment)
+    return payment
+
+
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(random.uniform(self.latency * 0.5, self.latency * 1.5))
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, description):
+        self._send(status, {"error": {"code": "BAD_REQUEST_ERROR", "description": description}})
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            self._send(503, {"error": {"code": "SERVER_ERROR", "description": "Injected failure"}})
+            return True
+        return False
+
+    def do_POST(self):
+        self._delay()
+        if self._maybe_fail():
+            return
+        path = urlparse(self.path).path.rstrip("/")
+        if path != "/v1/orders":
+            return self._error(404, "Not found")
+
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"{}")
+        order = {
+            "id": _new_id("order"),
+            "entity": "order",
+            "amount": int(data.get("amount", 0)),
+            "currency": data.get("currency", "INR"),
+            "receipt": data.get("receipt"),
+            "status": "created",
+            "created_at": int(time.time()),
+        }
+        with LOCK:
+            ORDERS[order["id"]] = order
+            create_payment_for_order(order)
+        self._send(200, order)
+
+    def do_GET(self):
+        self._delay()
+        if self._maybe_fail():
+            return
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        with LOCK:
+            if path == "/v1/orders":
+                items = list(ORDERS.values())
+                if query.get("receipt"):
+                    items = [order for order in items if order["receipt"] == query["receipt"]]
+                return self._send(200, self._page(items, query))
+
+            if path.startswith("/v1/orders/") and path.endswith("/payments"):
+                order_id = path.split("/")[3]
+                if order_id not in ORDERS:
+                    return self._error(400, "Order not found")
+                return self._send(200, self._page(ORDER_PAYMENTS.get(order_id, []), query))
+
+            if path.startswith("/v1/orders/"):
+                order = ORDERS.get(path.rsplit("/", 1)[1])
+                return self._send(200, order) if order else self._error(400, "Order not found")
+
+            if path == "/v1/payments":
+                items = list(PAYMENTS.values())
+                if query.get("from"):
+                    items = [p for p in items if p["created_at"] >= int(query["from"])]
+                if query.get("to"):
+                    items = [p for p in items if p["created_at"] <= int(query["to"])]
+                return self._send(200, self._page(items, query))
+
+            if path.startswith("/v1/payments/"):
+                payment = PAYMENTS.get(path.rsplit("/", 1)[1])
+                return self._send(200, payment) if payment else self._error(400, "Payment not found")
+
+        self._error(404, "Not found")
+
+    @staticmethod
+    def _page(items, query):
+        skip = int(query.get("skip", 0))
+        count = int(query.get("count", 10))
+        items = items[skip:skip + count]
+        return {"entity": "collection", "count": len(items), "items": items}
+
+
+def run(host="127.0.0.1", port=9090, latency=0.0, failure_rate=0.0):
+    FakeRazorpayHandler.latency = latency
+    FakeRazorpayHandler.failure_rate = failure_rate
+    server = ThreadingHTTPServer((host, port), FakeRazorpayHandler)
+    print(f"Fake Razorpay listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Razorpay API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9090)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean response delay in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    run(args.host, args.port, args.latency, args.failure_rate)
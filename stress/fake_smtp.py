@@ -0,0 +1,103 @@
+"""Minimal local SMTP sink for exercising batch mail delivery.
+
+Accepts and discards every message. Point the app at it with:
+
+    python stress/fake_smtp.py --port 2525 --throttle-rate 0.02 &
+    EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend \
+    EMAIL_HOST=127.0.0.1 EMAIL_PORT=2525 EMAIL_USE_TLS=0 python manage.py run_jobs
+
+--throttle-rate answers that fraction of MAIL commands with
+"421 Try again later" and drops the connection, like Gmail does when a
+sender goes too fast. Recipients at --bounce-domain are refused with 550.
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+STATS = {"connections": 0, "messages": 0, "throttled": 0, "bounced": 0}
+LOCK = threading.Lock()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    latency = 0.0
+    throttle_rate = 0.0
+    bounce_domain = None
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        with LOCK:
+            STATS["connections"] += 1
+        self.reply("220 fake-smtp ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+
+            if command in ("EHLO", "HELO"):
+                self.wfile.write(b"250-fake-smtp\r\n250-PIPELINING\r\n250 8BITMIME\r\n")
+            elif command == "MAIL":
+                if self.throttle_rate and random.random() < self.throttle_rate:
+                    with LOCK:
+                        STATS["throttled"] += 1
+                    self.reply("421 4.7.0 Try again later, closing connection")
+                    return
+                self.reply("250 OK")
+            elif command == "RCPT":
+                if self.bounce_domain and f"@{self.bounce_domain}>" in line.decode(errors="replace"):
+                    with LOCK:
+                        STATS["bounced"] += 1
+                    self.reply("550 5.1.1 The email account that you tried to reach does not exist")
+                else:
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                if self.latency:
+                    time.sleep(random.uniform(self.latency * 0.5, self.latency * 1.5))
+                with LOCK:
+                    STATS["messages"] += 1
+                self.reply("250 OK queued")
+            elif command in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def run(host="127.0.0.1", port=2525, latency=0.0, throttle_rate=0.0, bounce_domain=None):
+    FakeSMTPHandler.latency = latency
+    FakeSMTPHandler.throttle_rate = throttle_rate
+    FakeSMTPHandler.bounce_domain = bounce_domain
+    server = ThreadingSMTPServer((host, port), FakeSMTPHandler)
+    print(f"Fake SMTP listening on {host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(" ".join(f"{key}={value}" for key, value in STATS.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake SMTP sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean delay per message in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of messages answered with 421")
+    parser.add_argument("--bounce-domain", help="Refuse recipients at this domain with 550")
+    args = parser.parse_args()
+    run(args.host, args.port, args.latency, args.throttle_rate, args.bounce_domain)
@@ -1,39 +1,283 @@
-from locust import HttpUser, task, between
-
-# Filtered URLs to test
-URLS = [
-    "https://tntenniscricket.in/",
-    "https://tntenniscricket.in/blog/vgallery",
-    "https://tntenniscricket.in/blog/who-can-register/",
-    "https://tntenniscricket.in/blog/gallery",
-    "https://tntenniscricket.in/points/table.view",
-    "https://tntenniscricket.in/newsevents/",
-    "https://tntenniscricket.in/blog/tspl-t10-action/",
-    "https://tntenniscricket.in/blog/own-a-tspl-franchise-team/",
-    "https://tntenniscricket.in/privacy-policy",
-    "https://tntenniscricket.in/sitemap.xml",
-    "https://tntenniscricket.in/commite-team",
-    "https://tntenniscricket.in/about-us/",
+"""Load test for the registration and payment flows against a local server.
+
+Start the fakes and the app, seed data, then run locust:
+
+    python stress/fake_razorpay.py --port 9090 --latency 0.2 &
+    python stress/fake_smtp.py --port 2525 &
+    export RAZORPAY_BASE_URL=http://127.0.0.1:9090 RAZORPAY_KEY_ID=rzp_test RAZORPAY_KEY_SECRET=loadtest
+    export EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend EMAIL_HOST=127.0.0.1 EMAIL_PORT=2525 EMAIL_USE_TLS=0
+    python manage.py seed_data --users 5000 --admin --current
+    gunicorn -b 127.0.0.1:8000 -w 4 backend.wsgi &
+    python manage.py run_jobs &
+    locust -f stress/locust.py --host http://127.0.0.1:8000 --headless -u 50 -r 5 -t 2m --csv stress-report
+
+New players sign up, fill the form, get a Razorpay order and post the
+checkout callback signed with RAZORPAY_KEY_SECRET, the way checkout.js would.
+Returning players log in as seeded users; one admin browses the /master/
+listings. p50/p95/p99 per endpoint are printed when the run ends.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import random
+import re
+import time
+import uuid
+
+from locust import HttpUser, between, events, task
+from locust import stats as locust_stats
+
+RAZORPAY_BASE_URL = os.getenv("RAZORPAY_BASE_URL", "http://127.0.0.1:9090").rstrip("/")
+RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
+
+# Must match manage.py seed_data
+SEED_PREFIX = os.getenv("LOCUST_SEED_PREFIX", "load")
+SEED_PASSWORD = os.getenv("LOCUST_SEED_PASSWORD", "loadtest123")
+SEED_USERS = int(os.getenv("LOCUST_SEED_USERS", "1000"))
+
+PERCENTILES = [0.5, 0.95, 0.99]
+locust_stats.PERCENTILES_TO_REPORT = PERCENTILES
+locust_stats.PERCENTILES_TO_STATISTICS = PERCENTILES
+
+PUBLIC_PAGES = [
+    "/",
+    "/about-us/",
+    "/newsevents/",
+    "/blog/who-can-register/",
+    "/blog/gallery",
+    "/points/table.view",
+    "/res.all",
 ]
 
-# 50 fake test users
-TEST_USERS = [f"user{i}@example.com" for i in range(1, 200)]
+DISTRICTS = ["Chennai", "Coimbatore", "Madurai", "Tiruchi", "Salem", "Vellore", "Tirunelveli", "Erode"]
+
+# 1x1 PNG for the player image
+PLAYER_IMAGE = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+SEASON_LINK = re.compile(r"/form/(\d+)")
+PAYMENT_ID = re.compile(r"/paymenthandler/(\d+)/order")
+ORDER_ID = re.compile(r'order_id: "([^"]*)"')
+
+
+def csrf_data(client, data=None):
+    return {**(data or {}), "csrfmiddlewaretoken": client.cookies.get("csrftoken", "")}
 
 
-class TNTSPLUser(HttpUser):
-    wait_time = between(1, 3)  # simulated delay
+def sign(order_id, payment_id):
+    message = f"{order_id}|{payment_id}".encode()
+    return hmac.new(RAZORPAY_KEY_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+class PortalUser(HttpUser):
+    abstract = True
+    wait_time = between(1, 3)
+    season_id = None
+
+    def current_season(self):
+        if PortalUser.season_id is None:
+            with self.client.get("/", name="/", catch_response=True) as response:
+                match = SEASON_LINK.search(response.text)
+                if not match:
+                    response.failure("No open season linked from the index page")
+                    return None
+                PortalUser.season_id = int(match.group(1))
+        return PortalUser.season_id
+
+    def login(self, username, password):
+        self.client.get("/accounts/login/", name="/accounts/login/")
+        with self.client.post(
+            "/accounts/login/",
+            csrf_data(self.client, {"username": username, "password": password}),
+            name="/accounts/login/ [POST]",
+            catch_response=True,
+        ) as response:
+            if "/accounts/login/" in response.url:
+                response.failure(f"Login failed for {username}")
+                return False
+        return True
+
+
+class Visitor(PortalUser):
+    """Anonymous traffic: marketing pages and the public results."""
+    weight = 4
+
+    @task(3)
+    def browse(self):
+        self.client.get(random.choice(PUBLIC_PAGES))
+
+    @task(1)
+    def results(self):
+        response = self.client.get("/res.all.json", name="/res.all.json")
+        if response.ok:
+            next_page = response.json().get("next")
+            if next_page:
+                self.client.get(f"/res.all.json?cursor={next_page}", name="/res.all.json?cursor")
+
+
+class NewPlayer(PortalUser):
+    """Sign up, register for the current season and pay: register -> order -> callback."""
+    weight = 2
 
     def on_start(self):
-        """Random user assigned per locust instance"""
-        self.username = TEST_USERS[self.environment.runner.user_count % len(TEST_USERS)]
+        self.email = f"locust-{uuid.uuid4().hex[:12]}@example.com"
+        self.client.get("/accounts/register/", name="/accounts/register/")
+        self.client.post("/accounts/register/", csrf_data(self.client, {
+            "username": self.email,
+            "first_name": "Locust",
+            "last_name": "Player",
+            "password1": SEED_PASSWORD,
+            "password2": SEED_PASSWORD,
+        }), name="/accounts/register/ [POST]")
+
+    @task
+    def register_and_pay(self):
+        season_id = self.current_season()
+        if season_id is None:
+            return
+        self.client.get(f"/form/{season_id}", name="/form/[id]")
 
-    @task(5)
-    def browse_pages(self):
-        """Hit all TNTSPL main URLs"""
-        for url in URLS:
-            self.client.get(url, name=url.replace("https://tntenniscricket.in", ""))
+        with self.client.post(
+            f"/form/{season_id}",
+            csrf_data(self.client, self.registration_data()),
+            files={"player_image": ("player.png", PLAYER_IMAGE, "image/png")},
+            name="/form/[id] [POST]",
+            catch_response=True,
+        ) as response:
+            payment_match = PAYMENT_ID.search(response.text)
+            order_match = ORDER_ID.search(response.text)
+            if not payment_match:
+                response.failure("No payment page after the registration form")
+                return
+        payment_id = payment_match.group(1)
+        order_id = order_match.group(1) if order_match else ""
+        if not order_id:
+            order_id = self.wait_for_order(payment_id)
+            if not order_id:
+                return
+
+        gateway_payment = self.checkout(order_id)
+        if gateway_payment is None:
+            return
+        with self.client.post(f"/paymenthandler/{payment_id}", {
+            "razorpay_payment_id": gateway_payment,
+            "razorpay_order_id": order_id,
+            "razorpay_signature": sign(order_id, gateway_payment),
+        }, name="/paymenthandler/[id] [POST]", catch_response=True) as response:
+            if "Register ID" not in response.text:
+                response.failure("Payment callback did not complete the registration")
+
+        # A player registers once per season; the next iteration is a fresh account
+        self.client.cookies.clear()
+        self.on_start()
+
+    def wait_for_order(self, payment_id):
+        """Poll the order status like the payment page does with RAZORPAY_ASYNC_ORDERS."""
+        for _ in range(30):
+            response = self.client.get(f"/paymenthandler/{payment_id}/order", name="/paymenthandler/[id]/order")
+            data = response.json() if response.ok else {}
+            if data.get("order_id"):
+                return data["order_id"]
+            if data.get("status") == "FAILED":
+                return None
+            time.sleep(1)
+        return None
+
+    def checkout(self, order_id):
+        """Stand-in for checkout.js: the fake gateway has already captured a payment for the order."""
+        with self.client.get(
+            f"{RAZORPAY_BASE_URL}/v1/orders/{order_id}/payments",
+            name="[gateway] /v1/orders/[id]/payments",
+            catch_response=True,
+        ) as response:
+            items = response.json().get("items") if response.ok else None
+            if not items:
+                response.failure(f"No gateway payment for {order_id}")
+                return None
+        return items[0]["id"]
+
+    def registration_data(self):
+        mobile = f"9{random.randrange(10 ** 9):09d}"
+        return {
+            "player_name": "Locust Player",
+            "father_name": "Locust Senior",
+            "category": "21 and Above",
+            "age": 24,
+            "dob": "2002-05-17",
+            "gender": "male",
+            "occupation": "student",
+            "tshirt_size": "M",
+            "mobile": mobile,
+            "wathsapp_number": mobile,
+            "email": self.email,
+            "adhar_card": f"{random.randrange(2, 10)}{random.randrange(10 ** 11):011d}",
+            "social_media_link": "https://instagram.com/locust.player",
+            "district": random.choice(DISTRICTS),
+            "pin_code": 600001,
+            "address": "1, Main Road",
+            "first_preference": "batting",
+            "batting_arm": "right",
+            "role": "BATTING",
+        }
+
+
+class ReturningPlayer(PortalUser):
+    """A seeded player checking their registration, payment and result."""
+    weight = 3
+
+    def on_start(self):
+        self.login(f"{SEED_PREFIX}{random.randrange(SEED_USERS)}@example.com", SEED_PASSWORD)
+
+    @task(3)
+    def registration(self):
+        season_id = self.current_season()
+        if season_id is not None:
+            self.client.get(f"/form/{season_id}", name="/form/[id]")
 
     @task(1)
-    def login_page(self):
-        """Hits the login page but does NOT post credentials"""
-        self.client.get("https://tntenniscricket.in/accounts/login/", name="/login")
+    def result(self):
+        self.client.get("/res", name="/res")
+
+
+class Admin(PortalUser):
+    """Staff browsing and searching the /master/ mail listings."""
+    fixed_count = 1
+
+    def on_start(self):
+        self.login(f"{SEED_PREFIX}-admin@example.com", SEED_PASSWORD)
+
+    def listing(self, path, **params):
+        season_id = self.current_season()
+        if season_id is None:
+            return
+        query = "&".join(f"{key}={value}" for key, value in {"season_id": season_id, **params}.items())
+        self.client.get(f"{path}?{query}", name=path)
+
+    @task(3)
+    def trigger_mail(self):
+        self.listing("/master/trigger-mail/", mail_filter=random.choice(["all", "sent", "unsent"]),
+                     page=random.randint(1, 5))
+
+    @task(1)
+    def search(self):
+        self.listing("/master/trigger-mail/", q=random.choice(["Kumar", "TSPL", "Chennai", "load1"]))
+
+    @task(2)
+    def remaining_payments(self):
+        self.listing("/master/send-remaining-payment-mail/", is_compleated=random.choice(["", "yes", "no"]))
+
+    @task(1)
+    def campaigns(self):
+        self.client.get("/master/campaigns/", name="/master/campaigns/")
+
+
+@events.quitting.add_listener
+def print_percentiles(environment, **kwargs):
+    rows = sorted(environment.stats.entries.values(), key=lambda entry: (entry.name, entry.method))
+    print(f"\n{'Endpoint':<48} {'reqs':>7} {'fails':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for entry in rows + [environment.stats.total]:
+        name = "Aggregated" if entry is environment.stats.total else f"{entry.method} {entry.name}"
+        p50, p95, p99 = (entry.get_response_time_percentile(p) for p in PERCENTILES)
+        print(f"{name[:48]:<48} {entry.num_requests:>7} {entry.num_failures:>6} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f}")
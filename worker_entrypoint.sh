@@ -0,0 +1,12 @@
+#!/bin/sh
+
+# The worker shares the app's PostgreSQL database; start once the app has migrated it
+chmod +x ./wait_for_db.sh
+./wait_for_db.sh db:5432 -t 15
+
+until python3 manage.py migrate --check > /dev/null 2>&1; do
+    echo "waiting for migrations"
+    sleep 5
+done
+
+exec python3 manage.py run_jobs